@@ -0,0 +1,208 @@
+"""Shifts of every mutant from the wild type of its isoform, with bootstrap confidence intervals.
+
+    python -m analysis.comparison [--isoform "Kv 1.2"] [--sort d_act_v50] [--top 20]
+
+For each (isoform, mutant) group: the change of mean V50 and z from the isoform's WT records (mutant - WT) and
+the ratio of geometric mean time constants (mutant / WT). Intervals are percentiles of RESAMPLES bootstrap
+replicates of both sides, resampled independently, over the values each group has in that column.
+
+All groups are resampled at once: groups of the same size share one matrix of multinomial counts, so the
+replicate means of every group of that size are a single matrix product. Groups of more than
+EXACT_BOOTSTRAP_MAX values (typically the wild types) draw their replicate means from the normal distribution
+the bootstrap mean converges to, and the interval of a mutant with a single value is the WT one, mirrored."""
+import argparse
+from statistics import NormalDist
+
+import numpy as np
+import pandas as pd
+
+from db.mutants import parse_mutant
+
+SHIFT_COLS = ['act_v50', 'inact_v50', 'act_z', 'inact_z']
+RATIO_COLS = ['act_time', 'inact_time']
+RESAMPLES = 1000
+CONFIDENCE = 0.95
+EXACT_BOOTSTRAP_MAX = 30
+# groups resampled together, bounding the memory of the replicates (groups x RESAMPLES)
+CHUNK_GROUPS = 2048
+SEED = 0
+GROUP_COLS = ['selectivity', 'isoform', 'mutant', 'position', 'original', 'new', 'n_mutations', 'n', 'n_wt']
+
+
+METRIC_LABELS = {
+    'd_act_v50': 'ΔV50 of activation (mV)',
+    'd_inact_v50': 'ΔV50 of inactivation (mV)',
+    'd_act_z': 'Δz of activation',
+    'd_inact_z': 'Δz of inactivation',
+    'act_time_ratio': 'τ ratio of activation',
+    'inact_time_ratio': 'τ ratio of inactivation',
+}
+
+
+def metric_names():
+    """Result columns of each compared column, e.g. 'act_v50' -> 'd_act_v50', 'act_time' -> 'act_time_ratio'"""
+    names = {col: f'd_{col}' for col in SHIFT_COLS}
+    names.update({col: f'{col}_ratio' for col in RATIO_COLS})
+    return names
+
+
+def result_columns():
+    """Columns of compare_to_wild_type(): the group, then each metric with its interval"""
+    return GROUP_COLS + [name + suffix for name in metric_names().values() for suffix in ('', '_low', '_high')]
+
+
+class GroupValues:
+    """The values of one column by group, NaN left out; rows come sorted by group"""
+
+    def __init__(self, values, groups, n_groups):
+        present = ~np.isnan(values)
+        self.values, groups = values[present], groups[present]
+        self.counts = np.bincount(groups, minlength=n_groups)
+        self.starts = np.r_[0, np.cumsum(self.counts)[:-1]]
+        sums = np.bincount(groups, weights=self.values, minlength=n_groups)
+        squares = np.bincount(groups, weights=self.values ** 2, minlength=n_groups)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            self.means = sums / self.counts
+            # plug-in standard error of the mean, the sd of the bootstrap mean
+            self.errors = np.sqrt(np.maximum(squares / self.counts - self.means ** 2, 0) / self.counts)
+
+
+class Bootstrap:
+
+    def __init__(self, resamples=RESAMPLES, seed=SEED):
+        self.rng = np.random.default_rng(seed)
+        self.resamples = resamples
+        self._weights = {}
+
+    def weights(self, size, side):
+        """(size x resamples) multinomial resampling weights, shared by all groups of this size on one side of
+        the comparison: the two sides are drawn independently"""
+        if (side, size) not in self._weights:
+            counts = self.rng.multinomial(size, np.full(size, 1 / size), size=self.resamples)
+            self._weights[side, size] = counts.T / size
+        return self._weights[side, size]
+
+    def replicates(self, values, groups, side):
+        """(groups x resamples) replicate means of the given groups, all with the same number of values"""
+        size = values.counts[groups[0]]
+        if size > EXACT_BOOTSTRAP_MAX:
+            noise = self.rng.standard_normal((len(groups), self.resamples))
+            return values.means[groups, None] + values.errors[groups, None] * noise
+        rows = values.starts[groups, None] + np.arange(size)
+        return values.values[rows] @ self.weights(size, side)
+
+    def all_replicates(self, values, side):
+        replicates = np.full((len(values.counts), self.resamples), np.nan)
+        for size in np.unique(values.counts[values.counts > 0]):
+            groups = np.flatnonzero(values.counts == size)
+            replicates[groups] = self.replicates(values, groups, side)
+        return replicates
+
+    def percentiles(self, replicates, low, high):
+        """Nearest-rank percentiles of each row, from a partial sort around the two ranks"""
+        ranks = [int(round(q * (self.resamples - 1))) for q in (low, high)]
+        return np.partition(replicates, ranks, axis=1)[:, ranks].T
+
+    def shift_intervals(self, mutant, wild_type, reference, confidence=CONFIDENCE):
+        """Bounds of the confidence intervals of mutant - WT means; reference is the WT group of each mutant"""
+        alpha = (1 - confidence) / 2
+        low, high = np.full((2, len(mutant.counts)), np.nan)
+        wt_replicates = self.all_replicates(wild_type, 'wild type')
+        wt_low, wt_high = self.percentiles(wt_replicates, alpha, 1 - alpha)
+        sizes, wt_sizes = mutant.counts, wild_type.counts[reference]
+        todo = (sizes > 0) & (wt_sizes > 0)
+
+        single = todo & (sizes == 1)
+        low[single] = mutant.means[single] - wt_high[reference[single]]
+        high[single] = mutant.means[single] - wt_low[reference[single]]
+        normal = todo & (sizes > EXACT_BOOTSTRAP_MAX) & (wt_sizes > EXACT_BOOTSTRAP_MAX)
+        error = np.hypot(mutant.errors[normal], wild_type.errors[reference[normal]])
+        shift = mutant.means[normal] - wild_type.means[reference[normal]]
+        z = NormalDist().inv_cdf(1 - alpha)
+        low[normal], high[normal] = shift - z * error, shift + z * error
+
+        todo &= ~single & ~normal
+        for size in np.unique(sizes[todo]):
+            same_size = np.flatnonzero(todo & (sizes == size))
+            for chunk in range(0, len(same_size), CHUNK_GROUPS):
+                groups = same_size[chunk:chunk + CHUNK_GROUPS]
+                shifts = self.replicates(mutant, groups, 'mutant') - wt_replicates[reference[groups]]
+                low[groups], high[groups] = self.percentiles(shifts, alpha, 1 - alpha)
+        return low, high
+
+
+def compare_to_wild_type(df, resamples=RESAMPLES, confidence=CONFIDENCE, seed=SEED):
+    """One row per (isoform, mutant) with its selectivity, parsed mutation, row counts and, for every compared
+    column, the estimate with its confidence interval (columns <metric>, <metric>_low, <metric>_high)"""
+    isoforms = df['isoform'].astype('category').cat
+    mutants = df['mutant'].astype('category').cat
+    parsed = [parse_mutant(name) for name in mutants.categories]
+    is_wild_type = np.array([mutations == () for mutations in parsed], dtype=bool)
+    iso_codes = isoforms.codes.to_numpy().astype(np.int64)
+    mut_codes = mutants.codes.to_numpy().astype(np.int64)
+    known = (iso_codes >= 0) & (mut_codes >= 0)
+    wild = known & is_wild_type[np.maximum(mut_codes, 0)]
+    mutated = known & ~wild
+    if not mutated.any():
+        # an empty table, or wild types only: nothing to compare
+        return pd.DataFrame(columns=result_columns())
+
+    # one group per (isoform, mutant) against the WT group of the isoform
+    keys, groups = np.unique(iso_codes[mutated] * len(mutants.categories) + mut_codes[mutated],
+                             return_inverse=True)
+    group_iso, group_mut = keys // len(mutants.categories), keys % len(mutants.categories)
+    mutated = np.flatnonzero(mutated)
+    order = np.argsort(groups, kind='stable')
+    mutated, groups = mutated[order], groups[order]
+    first = mutated[np.r_[True, groups[1:] != groups[:-1]]]
+    wild = np.flatnonzero(wild)
+    wild = wild[np.argsort(iso_codes[wild], kind='stable')]
+    n_wt = np.bincount(iso_codes[wild], minlength=len(isoforms.categories))
+
+    result = pd.DataFrame({
+        'selectivity': df['selectivity'].to_numpy()[first],
+        'isoform': isoforms.categories[group_iso],
+        'mutant': mutants.categories[group_mut],
+        'position': [parsed[code][0][1] if parsed[code] else None for code in group_mut],
+        'original': [parsed[code][0][0] if parsed[code] else None for code in group_mut],
+        'new': [parsed[code][0][2] if parsed[code] else None for code in group_mut],
+        'n_mutations': [len(parsed[code]) if parsed[code] else None for code in group_mut],
+        'n': np.bincount(groups, minlength=len(keys)),
+        'n_wt': n_wt[group_iso],
+    })
+    bootstrap = Bootstrap(resamples, seed)
+    for col, name in metric_names().items():
+        values = df[col].to_numpy(dtype=np.float64)
+        if col in RATIO_COLS:
+            # time constants are compared as ratios: differences of log means
+            with np.errstate(divide='ignore', invalid='ignore'):
+                values = np.log(np.where(values > 0, values, np.nan))
+        mutant = GroupValues(values[mutated], groups, len(keys))
+        wild_type = GroupValues(values[wild], iso_codes[wild], len(isoforms.categories))
+        estimate = mutant.means - wild_type.means[group_iso]
+        low, high = bootstrap.shift_intervals(mutant, wild_type, group_iso, confidence)
+        if col in RATIO_COLS:
+            estimate, low, high = np.exp(estimate), np.exp(low), np.exp(high)
+        result[name], result[name + '_low'], result[name + '_high'] = estimate, low, high
+    return result.sort_values(['isoform', 'position', 'mutant'], kind='stable').reset_index(drop=True)[
+        result_columns()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--isoform')
+    parser.add_argument('--sort', default='d_act_v50', help='result column, largest absolute values first')
+    parser.add_argument('--top', type=int, default=20)
+    args = parser.parse_args()
+
+    from db.store import STORE
+
+    shifts = compare_to_wild_type(STORE.frame())
+    if args.isoform:
+        shifts = shifts[shifts['isoform'] == args.isoform]
+    shifts = shifts.reindex(shifts[args.sort].abs().sort_values(ascending=False).index)
+    print(shifts.head(args.top).round(3).to_string(index=False))
+
+
+if __name__ == '__main__':
+    main()
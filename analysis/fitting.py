@@ -0,0 +1,198 @@
+"""Batched fits of raw voltage-clamp data to the scalars stored in the kinetics table.
+
+    python -m analysis.fitting act gv.csv --selectivity K --isoform "Kv 1.2" --mutant WT --source "..." [--insert]
+
+Each input file holds one sweep per column, with the voltage (mV) or time (ms) in the first column. All sweeps
+of a file are fitted together: the Levenberg-Marquardt iterations run on (sweeps x points) arrays, so a file of
+thousands of sweeps costs a few dozen vectorized steps rather than one optimizer run per curve."""
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from db.ingest import validate_chunk
+from db.schema import COLUMNS
+
+GAS_CONSTANT = 8.314
+FARADAY = 96485.
+TEMPERATURE = 295.
+
+
+def thermal_voltage(temperature=TEMPERATURE):
+    """RT/F in mV"""
+    return 1000 * GAS_CONSTANT * temperature / FARADAY
+
+
+def boltzmann(v, gmax, v50, z, sign=1, temperature=TEMPERATURE):
+    """gmax / (1 + exp(-sign z (V - V50) F/RT)); sign=1 for activation (G-V), -1 for steady-state inactivation"""
+    u = sign * z * (v - v50) / thermal_voltage(temperature)
+    return gmax * 0.5 * (1 + np.tanh(u / 2))
+
+
+def exponential(t, a, tau, c):
+    return a * np.exp(-t / tau) + c
+
+
+def _levenberg_marquardt(residual_jacobian, p0, n_iter=100, tol=1e-8):
+    """Minimizes sum(r**2) independently for every row of p0 (sweeps x params).
+
+    residual_jacobian(p, rows) returns the residuals (sweeps x points) and Jacobian (sweeps x points x params)
+    of the given sweeps, with padded points zeroed. Only sweeps that have not converged yet are iterated on.
+    Returns the parameters, final cost and a per-sweep convergence flag."""
+    p = p0.astype(np.float64).copy()
+    n_sweeps, n_params = p.shape
+    lam = np.full(n_sweeps, 1e-3)
+    r, jac = residual_jacobian(p, np.arange(n_sweeps))
+    cost = np.einsum('nm,nm->n', r, r)
+    converged = np.zeros(n_sweeps, dtype=bool)
+    eye = np.eye(n_params)
+
+    for _ in range(n_iter):
+        active = np.flatnonzero(~converged)
+        if len(active) == 0:
+            break
+        r_a, jac_a = r[active], jac[active]
+        jtj = np.matmul(jac_a.transpose(0, 2, 1), jac_a)
+        grad = np.matmul(jac_a.transpose(0, 2, 1), r_a[..., None])
+        damped = jtj + lam[active, None, None] * (jtj * eye) + 1e-12 * eye
+        p_new = p[active] + np.linalg.solve(damped, -grad)[..., 0]
+
+        r_new, jac_new = residual_jacobian(p_new, active)
+        cost_new = np.einsum('nm,nm->n', r_new, r_new)
+        better = cost_new < cost[active]
+        done = better & (cost[active] - cost_new <= tol * (1 + cost[active]))
+
+        accepted = active[better]
+        p[accepted] = p_new[better]
+        r[accepted], jac[accepted] = r_new[better], jac_new[better]
+        cost[accepted] = cost_new[better]
+        lam[active] = np.where(better, lam[active] / 3, np.minimum(lam[active] * 4, 1e10))
+        converged[active[done]] = True
+        converged |= lam >= 1e10
+    return p, cost, converged
+
+
+def _as_sweeps(x, y):
+    y = np.atleast_2d(np.asarray(y, dtype=np.float64))
+    x = np.broadcast_to(np.asarray(x, dtype=np.float64), y.shape)
+    mask = ~(np.isnan(x) | np.isnan(y))
+    return np.where(mask, x, 0), np.where(mask, y, 0), mask
+
+
+def _result(columns, p, cost, converged, mask):
+    n_points = mask.sum(axis=1)
+    df = pd.DataFrame(p, columns=columns)
+    df['rmse'] = np.sqrt(cost / np.maximum(n_points, 1))
+    df['converged'] = converged
+    return df
+
+
+def fit_boltzmann(v, y, sign=1, temperature=TEMPERATURE, n_iter=100):
+    """Fits every sweep (row of y, NaN-padded) to boltzmann(); returns gmax, v50, z, rmse and converged per sweep.
+    z keeps the sign of the fit: a negative z is a sweep running the other way than `sign` says, which insert_fits()
+    rejects rather than storing it as the opposite curve."""
+    v, y, mask = _as_sweeps(v, y)
+    vt = thermal_voltage(temperature)
+
+    ymax = np.where(mask, y, -np.inf).max(axis=1)
+    half = np.abs(np.where(mask, y, np.inf) - ymax[:, None] / 2).argmin(axis=1)
+    p0 = np.column_stack([ymax, v[np.arange(len(v)), half], np.full(len(v), 2.)])
+
+    def residual_jacobian(p, rows):
+        gmax, v50, z = (p[:, i:i + 1] for i in range(3))
+        vr = v[rows]
+        u = sign * z * (vr - v50) / vt
+        sigma = 0.5 * (1 + np.tanh(u / 2))
+        r = (gmax * sigma - y[rows]) * mask[rows]
+        dfdu = gmax * sigma * (1 - sigma)
+        jac = np.stack([sigma, dfdu * (-sign * z / vt), dfdu * (sign * (vr - v50) / vt)], axis=-1)
+        return r, jac * mask[rows, :, None]
+
+    p, cost, converged = _levenberg_marquardt(residual_jacobian, p0, n_iter=n_iter)
+    return _result(['gmax', 'v50', 'z'], p, cost, converged, mask)
+
+
+def fit_exponential(t, y, n_iter=100):
+    """Fits every sweep (row of y, NaN-padded) to a * exp(-t / tau) + c; returns a, tau, c, rmse and converged"""
+    t, y, mask = _as_sweeps(t, y)
+    rows = np.arange(len(t))
+
+    last = mask.sum(axis=1) - 1
+    c0 = y[rows, last]
+    a0 = y[:, 0] - c0
+    # first point where the decay has covered 1 - 1/e of its amplitude
+    decayed = (np.abs(y - c0[:, None]) <= np.abs(a0)[:, None] / np.e) & mask
+    tau0 = np.where(decayed.any(axis=1), t[rows, decayed.argmax(axis=1)] - t[:, 0], (t[rows, last] - t[:, 0]) / 3)
+    p0 = np.column_stack([a0, np.maximum(tau0, 1e-6), c0])
+
+    def residual_jacobian(p, rows):
+        a, tau, c = (p[:, i:i + 1] for i in range(3))
+        tau = np.maximum(tau, 1e-9)
+        tr = t[rows]
+        e = np.exp(-tr / tau)
+        r = (a * e + c - y[rows]) * mask[rows]
+        jac = np.stack([e, a * e * tr / tau ** 2, np.ones_like(e)], axis=-1)
+        return r, jac * mask[rows, :, None]
+
+    p, cost, converged = _levenberg_marquardt(residual_jacobian, p0, n_iter=n_iter)
+    return _result(['a', 'tau', 'c'], p, cost, converged, mask)
+
+
+def load_sweeps(path):
+    """(x, sweeps) from a CSV/TSV file with x in the first column and one sweep per following column"""
+    df = pd.read_csv(path, sep=None, engine='python')
+    return df.iloc[:, 0].to_numpy(dtype=np.float64), df.iloc[:, 1:].to_numpy(dtype=np.float64).T
+
+
+FIT_COLUMNS = {
+    'act': {'act_v50': 'v50', 'act_z': 'z'},
+    'inact': {'inact_v50': 'v50', 'inact_z': 'z'},
+    'act_time': {'act_time': 'tau'},
+    'inact_time': {'inact_time': 'tau'},
+}
+
+
+def fits_to_rows(fits, kind, **metadata):
+    """Kinetics rows (store layout) from converged fits; kind is one of FIT_COLUMNS, metadata fills text columns"""
+    fits = fits[fits.converged]
+    rows = pd.DataFrame({col: fits[param].to_numpy() for col, param in FIT_COLUMNS[kind].items()})
+    for col, value in metadata.items():
+        rows[col] = value
+    return rows.reindex(columns=COLUMNS)
+
+
+def insert_fits(rows, store):
+    """Inserts fitted rows into a store through the same validation as bulk ingest; returns (inserted, rejects)"""
+    valid, rejects = validate_chunk(rows)
+    if len(valid):
+        store.append(valid, note='fits')
+    return len(valid), rejects
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('kind', choices=list(FIT_COLUMNS))
+    parser.add_argument('path')
+    for field in ['selectivity', 'isoform', 'mutant', 'new_residue', 'source']:
+        parser.add_argument(f'--{field}')
+    parser.add_argument('--insert', action='store_true', help='insert the converged fits into the database')
+    args = parser.parse_args()
+
+    x, sweeps = load_sweeps(args.path)
+    if args.kind in ('act', 'inact'):
+        fits = fit_boltzmann(x, sweeps, sign=1 if args.kind == 'act' else -1)
+    else:
+        fits = fit_exponential(x, sweeps)
+    print(fits.describe().round(3).to_string())
+
+    if args.insert:
+        from db.store import STORE
+
+        metadata = {field: getattr(args, field) for field in ['selectivity', 'isoform', 'mutant', 'new_residue',
+                                                              'source']}
+        inserted, rejects = insert_fits(fits_to_rows(fits, args.kind, **metadata), STORE)
+        print(f'{inserted} rows inserted, {len(rejects)} rejected')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,9 +1,7 @@
-import base64
-
 # Dash/Plotly/Flask
 import dash
-from dash.dependencies import Input, Output, State
-from flask import Flask, send_from_directory
+from dash.dependencies import ClientsideFunction, Input, Output, State
+from flask import Flask, Response, abort, request, send_from_directory, stream_with_context
 import dash_core_components as dcc 
 import dash_html_components as html
 import dash_bootstrap_components as dbc
@@ -12,16 +10,33 @@ import plotly.graph_objects as go
 # Data wrangling
 import numpy as np
 import pandas as pd
+import hashlib
 import json
 import os
 
 from layout.layout import *
+from layout.assets import ASSET_ROUTE, CACHE_CONTROL, resolve_asset
+from layout.cache import LayoutCache
+from db.catalog import CATALOG
+from analysis.comparison import METRIC_LABELS, compare_to_wild_type
+from db.cache import QUERY_CACHE, normalize_filters
+from db.export import EXPORT_FORMATS, encode, export_etag
+from db.paging import apply_filter_query, apply_sort, get_page, page_count
+from db.query import filter_frame, filter_rows, gating_of
+from db.scatter import LOG_COLS, POINT_BUDGET, density, plotted, stratified_sample
+from db.ingest import ingest_upload
+from db.schema import COLUMNS, NUM_COLS, TEXT_COLS, signed_selectivity
+from db.store import STORE
+from monitoring.callbacks import instrument
+from monitoring.metrics import METRICS, phase
 
 #APP_DIR = '/home/michael/Desktop/Biophysics/Dev/KineticsApp'
 APP_DIR = os.getcwd()
 
 app = dash.Dash(__name__, external_stylesheets=[dbc.themes.FLATLY])
 server = app.server
+# traces every server-side callback declared below, see /metrics
+instrument(app)
 
 
 app.title = "Kinetics Data Ion Channels"
@@ -33,77 +48,212 @@ CONTENT_STYLE = {
     #"padding": "2rem 1rem",
 }
 
-app.layout = html.Div([
-    produce_sidebar(),
-    dcc.Location(id="url"),
-    html.Div(id="page-content", style=CONTENT_STYLE),
+def serve_layout():
+    # every page is in the layout once; navigating only toggles which one is hidden
+    return html.Div([
+        produce_sidebar(),
+        dcc.Location(id="url"),
+        html.Div([
+            html.Div(produce_kinetics_ui(), id="page-1-content"),
+            html.Div(produce_about_page(), id="page-2-content", hidden=True),
+            html.Div(produce_contact_page(), id="page-3-content", hidden=True),
+            html.Div(produce_not_found_page(), id="page-4-content", hidden=True),
+        ],
+            id="page-content", style=CONTENT_STYLE),
+        # isoform option tables, read by the clientside isoform callback
+        dcc.Store(id="channel-catalog", data=CATALOG.table()),
 
-]
-)
+    ]
+    )
 
 
-@app.callback(
-    Output("isoform-dropdown", "options"),
-    [Input("gating-radio", "value"),
-    Input('selectivity-dropdown', 'value')
-    ],
-)
-def isoform_option(gating, ion):
-    empty_options = [{'label': '', 'value': ''}]
-    if ion is not None:
-        if 'vg' in gating:
-            if 'K' in ion:
-                isoforms = ['1.1', '1.2', '1.3', '1.4', '1.5', '1.6', '1.7', '1.8', '2.1', '2.2', '3.1', '3.2', '3.3',
-                            '3.4', '4.1', '4.2', '4.3', '5.1', '6.1', '6.2', '6.3', '6.4', '7.1', '7.2', '7.3', '7.4',
-                            '7.5', '8.1', '8.2', '9.1', '9.2', '9.3', '10.1', '10.2', '11.1', '11.2', '11.3', '12.1',
-                            '12.2', '12.3']
-                return [{"value": f"Kv {x}", "label": f"Kv {x}"} for x in isoforms]
-
-            elif 'Na' in ion:
-                isoforms = ['1.1', '1.2', '1.3', '1.4', '1.5', '1.6', '1.7', '1.8', '1.9', '2', '2.1', '2.2', '2.3', '2.4',
-                            '3.1']
-
-                return [{"value": f"Nav {x}", "label": f"Nav {x}"} for x in isoforms]
-            else:
-                return empty_options
-        else:
-            return empty_options
+# built on the first page request rather than at import, then reused
+LAYOUT = LayoutCache(serve_layout)
+app.layout = LAYOUT.tree
+LAYOUT_ROUTE = app.config.routes_pathname_prefix + '_dash-layout'
+
+
+@server.after_request
+def cache_layout(response):
+    """The layout never changes while the process runs: reloads revalidate it by ETag and get a 304"""
+    if request.path == LAYOUT_ROUTE and response.status_code == 200:
+        response.set_etag(LAYOUT.etag())
+        response = response.make_conditional(request)
+    return response
+
+
+@server.route(f'{ASSET_ROUTE}/<path:filename>')
+def serve_image(filename):
+    resolved = resolve_asset(filename, accept_webp='image/webp' in request.headers.get('Accept', ''))
+    if resolved is None:
+        abort(404)
+    response = send_from_directory(*resolved, cache_timeout=31536000)
+    response.headers['Cache-Control'] = CACHE_CONTROL
+    response.headers['Vary'] = 'Accept'
+    return response
+
+
+@server.route('/metrics')
+def serve_metrics():
+    return Response(METRICS.render(), mimetype='text/plain; version=0.0.4')
+
+
+@server.route('/export/kinetics.<fmt>')
+def export_kinetics(fmt):
+    """The rows matching the Consult filters (query string: gating, selectivity, isoform, mutant, new_residue,
+    with the form's values, e.g. selectivity=K), streamed as CSV, NDJSON or Parquet"""
+    if fmt not in EXPORT_FORMATS:
+        abort(404)
+    args = request.args
+    filters = normalize_filters(args.get('gating'), args.get('selectivity'), args.get('isoform'),
+                                args.get('mutant'), args.get('new_residue'))
+    _, version_id, df = STORE.snapshot()
+    etag = export_etag(fmt, version_id, filters)
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
     else:
-        return empty_options
+        # the rows are taken a chunk at a time from the frame: the filtered frame is never built, nor cached
+        gating, selectivity, isoform, mutant, new_res = filters
+        rows = filter_rows(STORE.index_for(df), isoform=isoform, mutant=mutant, selectivity=selectivity,
+                           new_res=new_res, gating=gating)
+        response = Response(stream_with_context(encode(fmt, df, rows)), mimetype=EXPORT_FORMATS[fmt])
+        response.headers['Content-Disposition'] = f'attachment; filename=kinetics.{fmt}'
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+# Read-only JSON API for scripts, e.g. /api/v1/kinetics?selectivity=K&isoform=Kv 1.2&columns=act_v50,act_z
+API_PREFIX = '/api/v1'
+API_DEFAULT_LIMIT = 1000
+API_MAX_LIMIT = 10000
+
+
+def api_error(message, status=400):
+    return Response(json.dumps({'error': message}), status=status, mimetype='application/json')
+
+
+def api_response(key, compute):
+    """JSON response built once per (dataset version, key): identical requests, even concurrent ones, share the
+    computation and the encoded body. compute(df) gets the frame of that version, whose id the body carries"""
+    version, version_id, df = STORE.snapshot()
+
+    def encode_body():
+        body = json.dumps(dict(version=version_id, **compute(df))).encode('utf-8')
+        return body, hashlib.sha1(body).hexdigest()[:20]
+
+    body, etag = QUERY_CACHE.get(('api', version) + key, encode_body)
+    response = Response(body, mimetype='application/json')
+    response.set_etag(etag)
+    return response.make_conditional(request)
+
+
+def api_filters(args):
+    return normalize_filters(args.get('gating'), args.get('selectivity'), args.get('isoform'), args.get('mutant'),
+                             args.get('new_residue'))
+
+
+def api_rows(df, filters):
+    gating, selectivity, isoform, mutant, new_res = filters
+    return filter_frame(df, STORE.index_for(df), isoform=isoform, mutant=mutant, selectivity=selectivity,
+                        new_res=new_res, gating=gating)
+
+
+def api_columns(args, default):
+    columns = [col.strip() for col in args.get('columns', '').split(',') if col.strip()] or default
+    unknown = [col for col in columns if col not in COLUMNS]
+    if unknown:
+        raise ValueError(f"unknown column(s): {', '.join(unknown)}")
+    return columns
+
+
+def api_sort(args):
+    """'-act_v50,isoform' -> DataTable sort_by (descending act_v50, then ascending isoform)"""
+    sort_by = []
+    for col in filter(None, (col.strip() for col in args.get('sort', '').split(','))):
+        direction = 'desc' if col.startswith('-') else 'asc'
+        col = col.lstrip('-+')
+        if col not in COLUMNS:
+            raise ValueError(f'unknown sort column: {col}')
+        sort_by.append({'column_id': col, 'direction': direction})
+    return sort_by
+
+
+@server.route(f'{API_PREFIX}/version')
+def api_version():
+    return Response(json.dumps({'version': STORE.current_version_id()}), mimetype='application/json')
+
+
+@server.route(f'{API_PREFIX}/kinetics')
+def api_kinetics():
+    """Filtered rows (filters as for /export), with column projection (columns), sorting (sort) and paging
+    (limit, offset)"""
+    try:
+        filters = api_filters(request.args)
+        columns = api_columns(request.args, COLUMNS)
+        sort_by = api_sort(request.args)
+        limit = min(int(request.args.get('limit', API_DEFAULT_LIMIT)), API_MAX_LIMIT)
+        offset = int(request.args.get('offset', 0))
+        if limit < 0 or offset < 0:
+            raise ValueError('limit and offset must not be negative')
+    except ValueError as e:
+        return api_error(str(e))
+
+    def compute(df):
+        df = apply_sort(api_rows(df, filters), sort_by)
+        rows = df.iloc[offset:offset + limit][columns]
+        return {'total': len(df), 'offset': offset, 'limit': limit, 'columns': columns,
+                'rows': json.loads(rows.to_json(orient='records'))}
+
+    sort_key = tuple((col['column_id'], col['direction']) for col in sort_by)
+    return api_response(('kinetics', tuple(columns), sort_key, limit, offset) + filters, compute)
+
+
+@server.route(f'{API_PREFIX}/stats')
+def api_stats():
+    """Summary statistics (count, mean, std, min, quartiles, max) of numeric columns over the filtered rows"""
+    try:
+        filters = api_filters(request.args)
+        columns = api_columns(request.args, NUM_COLS)
+        if set(columns) - set(NUM_COLS):
+            raise ValueError('statistics are only available for numeric columns')
+    except ValueError as e:
+        return api_error(str(e))
 
+    def compute(df):
+        stats_df = api_rows(df, filters)[columns].describe()
+        return {'columns': columns, 'stats': json.loads(stats_df.to_json(orient='index'))}
 
+    return api_response(('stats', tuple(columns)) + filters, compute)
 
 
-@app.callback(
+# Pure-UI callbacks run in the browser, see assets/clientside.js
+app.clientside_callback(
+    ClientsideFunction('kinetics', 'isoformOptions'),
+    Output("isoform-dropdown", "options"),
+    [Input("gating-radio", "value"),
+    Input('selectivity-dropdown', 'value'),
+    Input("isoform-dropdown", "search_value"),
+    ],
+    [State("channel-catalog", "data"),
+    State("isoform-dropdown", "value"),
+    ],
+)
+
+app.clientside_callback(
+    ClientsideFunction('kinetics', 'activeLinks'),
     [Output(f"page-{i}-link", "active") for i in range(1, 4)],
     [Input("url", "pathname")],
 )
-def toggle_active_links(pathname):
-    if pathname == "/":
-        # Treat page 1 as the homepage / index
-        return True, False, False
-    return [pathname == f"/page-{i}" for i in range(1, 4)]
-
-
-@app.callback(Output("page-content", "children"), [Input("url", "pathname")])
-def render_page_content(pathname):
-    if pathname in ["/", "/page-1"]:
-        return produce_kinetics_ui()
-    elif pathname == "/page-2":
-        return produce_about_page()
-    elif pathname == "/page-3":
-        return produce_contact_page()
-    # If the user tries to reach a different page, return a 404 message
-    return dbc.Jumbotron(
-        [
-            html.H1("404: Not found", className="text-danger"),
-            html.Hr(),
-            html.P(f"The pathname {pathname} was not recognised... The only pages are those accessible "
-            f"through the sidebar."),
-        ]
-    )
+
+app.clientside_callback(
+    ClientsideFunction('kinetics', 'routePage'),
+    [Output(f"page-{i}-content", "hidden") for i in range(1, 5)] + [Output("missing-pathname", "children")],
+    [Input("url", "pathname")],
+)
 
 
+@phase('render')
 def df_to_html_table(df: pd.DataFrame, text_align: object = 'center', header: object = True, padding='10px') -> object:
     """Transforms a Pandas DataFrame to an HTML table using Dash components
     Note: df.to_html() is useless here, as we need the html code wrapped as/by Python objects for Dash server"""
@@ -112,8 +262,8 @@ def df_to_html_table(df: pd.DataFrame, text_align: object = 'center', header: ob
     return html.Table(
                 head +
                 [html.Tr([
-                    html.Td(df.iloc[i][col], style={'text-align': text_align, 'padding': padding}) for col in df.columns
-                        ]) for i in range(len(df))],
+                    html.Td(value, style={'text-align': text_align, 'padding': padding}) for value in row
+                        ]) for row in df.itertuples(index=False)],
                 # contentEditable='True'
                 style={'margin': 'auto'}
             )
@@ -121,69 +271,157 @@ def df_to_html_table(df: pd.DataFrame, text_align: object = 'center', header: ob
 
 def update_db(df, selectivity, isoform, mutant, new_res, act_v50, act_time, inact_v50, inact_time, inact_z, act_z,
               source_input):
-    restore_db()
-
-    if 'cl' in selectivity.lower():
-        sign = '-'
-    else:
-        sign = '+'
-    new_row = {'selectivity': selectivity+sign, 'isoform': isoform, 'mutant': mutant, 'new_residue': new_res,
+    new_row = {'selectivity': signed_selectivity(selectivity), 'isoform': isoform, 'mutant': mutant, 'new_residue': new_res,
                'act_v50': act_v50, 'act_time': act_time, 'inact_v50': inact_v50, 'inact_time': inact_time,
                'act_z':act_z, 'inact_z':inact_z, 'source': source_input}
-    new_row = pd.DataFrame(new_row, index=[len(df)])
-    new_df = df.append(new_row, ignore_index=True)
-    new_df.to_csv('db/test.csv', sep='\t', index=False)
+    new_df = STORE.append(pd.DataFrame(new_row, index=[len(df)]), note='insert form')
+    QUERY_CACHE.clear()
     return new_df
 
 def clear_db():
-    df = pd.read_csv('db/test-bk.csv', sep='\t', header=0)
-    df[0:0].to_csv('db/test.csv', sep='\t', index=False)
+    STORE.clear()
+    QUERY_CACHE.clear()
     return True
 
 
 def restore_db():
-    df = pd.read_csv('db/test-bk.csv', sep='\t', header=0)
-    df.to_csv('db/test.csv', sep='\t', index=False)
+    df = STORE.restore()
+    QUERY_CACHE.clear()
     return df
 
 
-def filter_db(df, isoform, mutant, selectivity):
+def filter_db(df, isoform, mutant, selectivity, new_res=None, gating=None):
+    return filter_frame(df, STORE.index_for(df), isoform=isoform, mutant=mutant, selectivity=selectivity,
+                        new_res=new_res, gating=gating)
 
-    if isoform:
-        df = df[df.isoform == isoform]
-    if mutant:
-        df = df[df.mutant == mutant]
 
-    if selectivity:
-        if 'Cl' == selectivity:
-            sign = '-'
-        else:
-            sign = '+'
+def query_db(gating, selectivity, isoform, mutant, new_res):
+    """Filtered rows, computed once per (filters, dataset version) and shared by the Consult callbacks"""
+    filters = normalize_filters(gating, selectivity, isoform, mutant, new_res)
+    gating, selectivity, isoform, mutant, new_res = filters
+    return QUERY_CACHE.get(('rows', STORE.current_version()) + filters,
+                           lambda: STORE.filter(isoform=isoform, mutant=mutant, selectivity=selectivity,
+                                                new_res=new_res, gating=gating))
+
+
+def query_mutants(query, limit=None):
+    """Mutant names matching a WT/Mutant filter (see db.mutants), best first"""
+    return STORE.index_for(STORE.frame()).mutants.search_names(query, limit=limit)
+
+
+def query_stats(selected_cols, *filters):
+    filters = normalize_filters(*filters)
+    gating, selectivity, isoform, mutant, new_res = filters
+    key = ('stats', STORE.current_version(), tuple(selected_cols)) + filters
+
+    def compute():
+        # from the file store's facets, or in SQL
+        return format_stats(STORE.describe(selected_cols, isoform=isoform, mutant=mutant, selectivity=selectivity,
+                                           new_res=new_res, gating=gating))
+
+    return QUERY_CACHE.get(key, compute)
+
+
+def query_hist(variable, *filters):
+    """(counts, bin edges) of one column over the filtered rows"""
+    filters = normalize_filters(*filters)
+    gating, selectivity, isoform, mutant, new_res = filters
+    key = ('hist', STORE.current_version(), variable) + filters
+
+    def compute():
+        return STORE.histogram(variable, isoform=isoform, mutant=mutant, selectivity=selectivity, new_res=new_res,
+                               gating=gating)
+
+    return QUERY_CACHE.get(key, compute)
+
+def query_scatter(x_col, y_col, mode, *filters):
+    """Two columns of the filtered rows, reduced for plotting (db.scatter): ('points', rows, n) with at most
+    POINT_BUDGET rows or ('density', (counts, x edges, y edges), n), n being the number of plottable rows"""
+    filters = normalize_filters(*filters)
+    key = ('scatter', STORE.current_version(), x_col, y_col, mode) + filters
+
+    def compute():
+        rows = query_db(*filters)
+        x, y = rows[x_col].to_numpy(dtype=np.float64), rows[y_col].to_numpy(dtype=np.float64)
+        log_x, log_y = x_col in LOG_COLS, y_col in LOG_COLS
+        keep = plotted(x, y, log_x, log_y)
+        if mode == 'density':
+            return 'density', density(x_col, y_col, x[keep], y[keep]), len(keep)
+        sample = keep[stratified_sample(x[keep], y[keep], POINT_BUDGET, log_x, log_y)]
+        return 'points', rows.iloc[sample][['selectivity', 'isoform', 'mutant', x_col, y_col]], len(keep)
+
+    return QUERY_CACHE.get(key, compute)
+
+
+def query_comparison():
+    """Shifts of every mutant from the WT of its isoform (analysis.comparison), once per dataset version"""
+    return QUERY_CACHE.get(('comparison', STORE.current_version()),
+                           phase('aggregate')(lambda: compare_to_wild_type(STORE.frame())))
+
+
+def query_shifts(*filters):
+    """Rows of the comparison matching the Consult filters"""
+    filters = normalize_filters(*filters)
+    gating, selectivity, isoform, mutant, new_res = filters
+
+    def compute():
+        shifts = query_comparison()
+        keep = np.ones(len(shifts), dtype=bool)
+        if gating:
+            keep &= shifts['isoform'].isin([name for name in shifts['isoform'].unique() if gating_of(name) == gating])
+        if selectivity:
+            keep &= shifts['selectivity'] == signed_selectivity(selectivity)
+        if isoform:
+            keep &= shifts['isoform'] == isoform
+        if mutant:
+            keep &= shifts['mutant'].isin(query_mutants(mutant))
+        if new_res:
+            # 'Phe (F)' -> 'F'
+            keep &= shifts['new'] == new_res[-2]
+        return shifts[keep]
+
+    return QUERY_CACHE.get(('shifts', STORE.current_version()) + filters, compute)
+
+
+def query_table_view(sort_by, filter_query, *filters):
+    """Filtered rows after the DataTable's own filter and sort, cached so that paging only slices"""
+    version = STORE.current_version()
+    sort_key = tuple((col['column_id'], col['direction']) for col in sort_by or [])
+    key = ('table', version, sort_key, filter_query or '') + normalize_filters(*filters)
+    return QUERY_CACHE.get(key, lambda: apply_sort(apply_filter_query(query_db(*filters), filter_query), sort_by))
+
+
+@app.callback(
+    Output('mutant-suggestions', 'children'),
+    [Input('mutant-input', 'value')]
+    )
+def suggest_mutants(query):
+    if not query or not query.strip():
+        return []
+    mutants = STORE.index_for(STORE.frame()).mutants
+    return [html.Option(value=name) for name in mutants.suggest_names(query.strip(), limit=MUTANT_SUGGESTIONS)]
 
-        df = df[df.selectivity == selectivity + sign]
-    return df
 
 @app.callback(
-    Output('consult-data-div', 'children'),
+    [Output('consult-table', 'data'),
+    Output('consult-table', 'page_count')],
     [Input('gating-radio', 'value'),
     Input('selectivity-dropdown', 'value'),
     Input('isoform-dropdown', 'value'),
     Input('mutant-input', 'value'),
-    Input('new-residue-dropdown', 'value')
+    Input('new-residue-dropdown', 'value'),
+    Input('consult-table', 'page_current'),
+    Input('consult-table', 'page_size'),
+    Input('consult-table', 'sort_by'),
+    Input('consult-table', 'filter_query'),
     ]
     )
-def render_content(gating_radio, selectivity, isoform, mutant, new_res):
+def render_content(gating_radio, selectivity, isoform, mutant, new_res, page_current, page_size, sort_by,
+                   filter_query):
 
-    df = pd.read_csv('db/test.csv', sep='\t', header=0)
+    df = query_table_view(sort_by, filter_query, gating_radio, selectivity, isoform, mutant, new_res)
 
-    df = filter_db(df, isoform, mutant, selectivity)
-
-    return html.Div([
-        html.P('Filter the database with the fields above, or leave empty for all data.'),
-        df_to_html_table(df)
-    ],
-        style={'margin-bottom': '50px'}
-    )
+    return get_page(df, page_current, page_size), page_count(len(df), page_size)
 
 
 @app.callback(
@@ -206,13 +444,11 @@ def render_content(gating_radio, selectivity, isoform, mutant, new_res):
     )
 def render_content(n_clicks, gating_radio, selectivity, isoform, mutant, new_res, inact_v50, act_v50,
                    inact_time, act_time, inact_z, act_z, source_input):
-    restore_db()
     if n_clicks:
         try:
-            df = pd.read_csv('db/test.csv', sep='\t', header=0)
+            df = STORE.frame()
         except:
-            restore_db()
-            df = pd.read_csv('db/test.csv', sep='\t', header=0)
+            df = restore_db()
         if len(df) == 0:
             restore_db()
         if source_input:
@@ -225,12 +461,11 @@ def render_content(n_clicks, gating_radio, selectivity, isoform, mutant, new_res
                 new_df = update_db(df, selectivity, isoform, mutant, new_res, act_v50, act_time, inact_v50, inact_time,
                                    inact_z, act_z, source_input)
 
-                return html.Div(df_to_html_table(new_df), style={'text-align': 'center'})
+                return html.Div(df_to_html_table(new_df.tail(TABLE_PAGE_SIZE)), style={'text-align': 'center'})
         else:
-            df.to_csv('db/test.csv', sep='\t', index=False)
             return html.Div(
                 [
-                    df_to_html_table(df, padding='20px')
+                    df_to_html_table(df.tail(TABLE_PAGE_SIZE), padding='20px')
                 ],
                 style={'text-align': 'center'}
             )
@@ -238,8 +473,27 @@ def render_content(n_clicks, gating_radio, selectivity, isoform, mutant, new_res
         return None
 
 
+@app.callback(
+    Output('bulk-upload-report', 'children'),
+    [Input('bulk-upload', 'contents')],
+    [State('bulk-upload', 'filename')]
+)
+def bulk_insert(contents, filename):
+    if contents is None:
+        return None
+    try:
+        inserted, rejects = ingest_upload(contents, filename, STORE)
+    except (ValueError, UnicodeDecodeError) as e:
+        return html.P(f'Could not read {filename}: {e}', className="text-danger")
+    QUERY_CACHE.clear()
+    return html.Div([
+        html.P(f'{filename}: {inserted} rows inserted, {len(rejects)} rejected.'),
+        df_to_html_table(rejects.head(TABLE_PAGE_SIZE)) if len(rejects) else None,
+    ])
+
+
 def get_db_cols():
-    return list(pd.read_csv('db/test-bk.csv', sep='\t', header=0).columns)
+    return STORE.columns()
 
 
 @app.callback(
@@ -247,9 +501,7 @@ def get_db_cols():
     [Input('mother-tabs', 'value')]
 )
 def render_content(tab):
-    db_cols = [x for x in get_db_cols() if x not in ['selectivity', 'isoform', 'mutant', 'new_residue', 'source']]
-    df = pd.read_csv('db/test.csv', sep='\t', header=0)
-    dff = df[db_cols]
+    db_cols = [x for x in get_db_cols() if x not in TEXT_COLS]
 
     return [{'label': col, 'value' :col} for col in db_cols]
 
@@ -263,16 +515,18 @@ def render_content(tab):
     Input('new-residue-dropdown', 'value'),
     ]
 )
+@phase('render')
 def render_content(hist_variables, gating_radio, selectivity, isoform, mutant, new_res):
 
-    df = pd.read_csv('db/test.csv', sep='\t', header=0)
-    df = filter_db(df, isoform, mutant, selectivity)
-
     fig = go.Figure()
     for variable in hist_variables:
+        counts, edges = query_hist(variable, gating_radio, selectivity, isoform, mutant, new_res)
+        filled = np.flatnonzero(counts)
         fig.add_trace(
-            go.Histogram(
-                x=df[variable],
+            go.Bar(
+                x=(edges[filled] + edges[filled + 1]) / 2,
+                y=counts[filled],
+                width=edges[filled + 1] - edges[filled],
                 name=variable
             ))
 
@@ -287,68 +541,6 @@ def render_content(hist_variables, gating_radio, selectivity, isoform, mutant, n
     return fig
 
 
-@app.callback(Output('tabs-div-container', 'children'),
-              [Input('mother-tabs', 'value')])
-def render_content(tab):
-    if tab == 'insert-tab':
-        return html.Div([
-            dcc.Markdown(
-                """
-                Please enter as many of the following fields and a credible source. (*If you have a lot of data, [email Michael](mailto:michael.morin.1@umontreal.ca), he can mass insert for you*).
-                """
-            ),
-            produce_kinetics_subform(type='Act.'),
-            produce_kinetics_subform(type='Inact.'),
-            html.Div(source_input, style={"margin-top": "20px"}),
-            email_input,
-            html.Div(
-                dbc.Button(
-                    id='submit-button',
-                    children='Submit Data!',
-                    color="primary",
-                    className="btn btn-primary",
-                    style={
-                        'float': 'center',
-                        'margin-bottom': '40px',
-                        'text-align': 'center'
-                    }
-                ),
-                style={
-                    'float': 'center',
-                    'text-align': 'center'
-                }
-            ),
-
-            html.Div(id='click-confirmation-div')
-        ])
-
-    else:
-        return html.Div([
-            html.Div(id='consult-data-div'),
-            html.H6('Select your desired Statistics',
-                    style={'textAlign': 'center', 'padding': '20px', 'font-size': '18px', 'margin-top': '90px'}),
-            dcc.Dropdown(
-                id='hist-selector',
-                multi=True,
-                value=['act_v50', 'inact_v50'],
-                style={
-                    'margin-bottom': 'px',
-                    #'width': '92.5%',
-                    }
-            ),
-
-            html.Div([
-                dbc.Row([
-                    dbc.Col(html.Div(id='stats-table', style={'margin-top': '50px',})),
-                    dbc.Col(dcc.Graph(id='consult-graph', style={'margin-top': '0px'})),
-
-                ]),
-
-            ]
-            )
-
-        ]),
-
 @app.callback(
     Output('stats-table', 'children'),
     [Input('hist-selector', 'value'),
@@ -361,16 +553,134 @@ def render_content(tab):
 )
 def stats_table(selected_variables, gating_radio, selectivity, isoform, mutant, new_res):
 
-    df = pd.read_csv('db/test.csv', sep='\t', header=0)
-    df = filter_db(df, isoform, mutant, selectivity)
-    stats_df = get_stats(df, selected_variables)
+    stats_df = query_stats(selected_variables, gating_radio, selectivity, isoform, mutant, new_res)
     stats_df = stats_df.round(2)
     return df_to_html_table(stats_df)
 
 
+@app.callback(
+    Output('scatter-graph', 'figure'),
+    [Input('scatter-x', 'value'),
+     Input('scatter-y', 'value'),
+     Input('scatter-mode', 'value'),
+     Input('gating-radio', 'value'),
+     Input('selectivity-dropdown', 'value'),
+     Input('isoform-dropdown', 'value'),
+     Input('mutant-input', 'value'),
+     Input('new-residue-dropdown', 'value'),
+     ]
+)
+@phase('render')
+def scatter_view(x_col, y_col, mode, gating_radio, selectivity, isoform, mutant, new_res):
+    kind, data, n = query_scatter(x_col, y_col, mode, gating_radio, selectivity, isoform, mutant, new_res)
+    fig = go.Figure()
+    if kind == 'density':
+        counts, x_edges, y_edges = data
+        fig.add_trace(go.Heatmap(
+            x=x_edges,
+            y=y_edges,
+            z=np.where(counts > 0, counts, np.nan),
+            colorscale='Viridis',
+            hovertemplate=f'{x_col} %{{x}}<br>{y_col} %{{y}}<br>%{{z}} records<extra></extra>',
+            hoverongaps=False,
+        ))
+        title = f'{y_col} vs {x_col}: density of {n:,} records'
+    else:
+        # one WebGL trace per selectivity
+        for label in data['selectivity'].dropna().unique():
+            points = data[data['selectivity'] == label]
+            fig.add_trace(go.Scattergl(
+                x=points[x_col],
+                y=points[y_col],
+                mode='markers',
+                name=str(label),
+                text=points['isoform'].astype(str) + ' ' + points['mutant'].astype(str),
+                marker={'size': 4, 'opacity': 0.6},
+                hovertemplate=f'%{{text}}<br>{x_col} %{{x}}<br>{y_col} %{{y}}<extra></extra>',
+            ))
+        title = f'{y_col} vs {x_col}: {len(data):,} records'
+        if len(data) < n:
+            title += f' (stratified sample of {n:,})'
+    fig.update_layout(
+        title_text=title,
+        title_x=0.5,
+        xaxis_title_text=x_col,
+        yaxis_title_text=y_col,
+        xaxis_type='log' if x_col in LOG_COLS else 'linear',
+        yaxis_type='log' if y_col in LOG_COLS else 'linear',
+    )
+    return fig
+
+
+@app.callback(
+    [Output('shift-heatmap', 'figure'),
+     Output('shift-table', 'children')],
+    [Input('shift-metric', 'value'),
+     Input('gating-radio', 'value'),
+     Input('selectivity-dropdown', 'value'),
+     Input('isoform-dropdown', 'value'),
+     Input('mutant-input', 'value'),
+     Input('new-residue-dropdown', 'value'),
+     ]
+)
+def shift_view(metric, gating_radio, selectivity, isoform, mutant, new_res):
+    shifts = query_shifts(gating_radio, selectivity, isoform, mutant, new_res)
+    shifts = shifts[shifts[metric].notna()]
+    neutral = 1 if metric.endswith('_ratio') else 0
+    largest = shifts.reindex((shifts[metric] - neutral).abs().sort_values(ascending=False).index)
+    table = largest.head(SHIFT_TABLE_ROWS)[['isoform', 'mutant', 'n', 'n_wt', metric, metric + '_low',
+                                            metric + '_high']].round(2)
+    return shift_heatmap(shifts, metric, neutral), df_to_html_table(table) if len(table) else None
+
+
+@phase('render')
+def shift_heatmap(shifts, metric, neutral):
+    """Shift of each single substitution by position (columns) and new residue (rows), averaged over isoforms"""
+    single = shifts[shifts['n_mutations'] == 1]
+    positions = single['position'].value_counts().index[:SHIFT_HEATMAP_POSITIONS]
+    single = single[single['position'].isin(positions)]
+    fig = go.Figure()
+    if len(single):
+        cells = single.groupby(['new', 'position']).agg(
+            shift=(metric, 'mean'), low=(metric + '_low', 'first'), high=(metric + '_high', 'first'),
+            groups=(metric, 'size'), n=('n', 'sum'))
+        # the interval of a cell measured on one isoform, the number of isoforms averaged otherwise
+        cells['detail'] = np.where(cells['groups'] > 1, cells['groups'].astype(str) + ' isoforms',
+                                   'CI [' + cells['low'].round(2).astype(str) + ', ' +
+                                   cells['high'].round(2).astype(str) + ']')
+        residues = [res[-2] for res in RESIDUES if res[-2] in set(cells.index.get_level_values('new'))]
+        columns = np.sort(cells.index.get_level_values('position').unique())
+        grid = {name: cells[name].unstack().reindex(index=residues, columns=columns)
+                for name in ['shift', 'detail', 'n']}
+        fig.add_trace(go.Heatmap(
+            x=[str(position) for position in columns],
+            y=residues,
+            z=grid['shift'].to_numpy(),
+            zmid=neutral,
+            colorscale='RdBu_r',
+            customdata=np.dstack([grid['detail'].to_numpy(), grid['n'].to_numpy()]),
+            hovertemplate='position %{x}, new residue %{y}<br>%{z:.2f}, %{customdata[0]}<br>'
+                          '%{customdata[1]} records<extra></extra>',
+            hoverongaps=False,
+        ))
+    fig.update_layout(
+        title_text=f'{METRIC_LABELS[metric]} of single substitutions' if len(single) else
+        'No single substitution with a WT reference matches the filters',
+        title_x=0.5,
+        xaxis_title_text='Position',
+        yaxis_title_text='New residue',
+        xaxis_type='category',
+    )
+    return fig
+
+
 def get_stats(df, selected_cols):
     dff = df[selected_cols]
-    stats_df = dff.describe()
+    return format_stats(dff.describe())
+
+
+@phase('render')
+def format_stats(stats_df):
     stats_df['stats'] = stats_df.index
     cols = list(stats_df.columns)
     cols = [cols[-1]] + cols[:-1]
@@ -382,5 +692,6 @@ if __name__ == "__main__":
     app.run_server(
         port=8050,
         #dev_tools_ui=False, dev_tools_props_check=False,
-        debug=True,
+        # DASH_DEBUG=true for the reloader and dev tools; production goes through gunicorn.conf.py
+        debug=os.environ.get('DASH_DEBUG', 'false').lower() == 'true',
         )
\ No newline at end of file
@@ -0,0 +1,55 @@
+// Pure-UI callbacks run in the browser (registered with app.clientside_callback in app.py)
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    kinetics: {
+        // URL -> active sidebar link; "/" is the kinetics page
+        activeLinks: function(pathname) {
+            var page = pathname === "/" ? "/page-1" : pathname;
+            return [1, 2, 3].map(function(i) { return page === "/page-" + i; });
+        },
+
+        // URL -> hidden flags of the three pages and of the 404 page, plus the path shown on the 404 page
+        routePage: function(pathname) {
+            var pages = {"/": 0, "/page-1": 0, "/page-2": 1, "/page-3": 2};
+            var shown = pathname in pages ? pages[pathname] : 3;
+            var hidden = [0, 1, 2, 3].map(function(i) { return i !== shown; });
+            return hidden.concat([shown === 3 ? pathname : ""]);
+        },
+
+        // option table of the (gating, ion) pair, shipped once in the channel-catalog store;
+        // large tables are narrowed to the names (or words of them) starting with the search text
+        isoformOptions: function(gating, ion, search, catalog, selected) {
+            var empty = [{label: "", value: ""}];
+            var options = catalog.options[gating + "|" + ion] || empty;
+            var triggered = dash_clientside.callback_context.triggered.map(function(t) { return t.prop_id; });
+            if (options.length <= catalog.max_options) {
+                // the dropdown already filters a full list as the user types
+                if (triggered.indexOf("isoform-dropdown.search_value") !== -1 && triggered.length === 1) {
+                    return dash_clientside.no_update;
+                }
+                return options;
+            }
+            // name endings starting at each word, sorted: the matches are the run of keys from the first one >= prefix
+            var table = catalog.prefixes[gating + "|" + ion];
+            var prefix = (search || "").toLowerCase().trim();
+            var lo = 0, hi = table.keys.length;
+            while (lo < hi) {
+                var mid = (lo + hi) >>> 1;
+                if (table.keys[mid] < prefix) { lo = mid + 1; } else { hi = mid; }
+            }
+            var ids = [], seen = {};
+            for (var i = lo; i < table.keys.length && ids.length < catalog.search_limit
+                    && table.keys[i].lastIndexOf(prefix, 0) === 0; i++) {
+                if (!seen[table.ids[i]]) {
+                    seen[table.ids[i]] = true;
+                    ids.push(table.ids[i]);
+                }
+            }
+            var found = ids.sort(function(a, b) { return a - b; }).map(function(id) { return options[id]; });
+            // keep the current choice selectable, otherwise the dropdown clears it
+            if (selected && !found.some(function(option) { return option.value === selected; })) {
+                found.push({label: selected, value: selected});
+            }
+            return found;
+        }
+    }
+});
@@ -0,0 +1,368 @@
+"""Load test replaying Consult and Insert sessions against a running server, with a stepwise ramp of users.
+
+    python -m bench.load --start-server --rows 1e5 --workers 2         # gunicorn on a synthetic table
+    python -m bench.load --url http://127.0.0.1:8050 --users 1 2 4 8 16 32 --stage-seconds 30 --out load.json
+
+Virtual users behave as the Dash renderer does: they load the page (index, layout, dependencies, then every
+callback fired on load) and, for each value they change, POST /_dash-update-component once per server-side
+callback having it as an input, with the payload built from the app's own dependency list. Clientside
+callbacks (isoform options, page routing) cost the server nothing and are skipped, as in the browser.
+
+A Consult session picks a gating, a selectivity and an isoform (table, histogram and stats callbacks each
+time), pages through the table, sometimes searches a mutant and switches tabs; an Insert session
+(--insert-share of them) fills in the form and submits it, which writes to the server's table. Users are added
+stage by stage; each stage reports throughput, error rate and latency percentiles, and the saturation point is
+the first stage where doubling the users no longer adds throughput, errors exceed MAX_ERROR_RATE or the p99
+exceeds --p99-ms."""
+import argparse
+import http.client
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from urllib.parse import urlsplit
+
+import numpy as np
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_URL = 'http://127.0.0.1:8050'
+DEFAULT_USERS = (1, 2, 4, 8, 16, 32)
+STAGE_SECONDS = 20.
+THINK_SECONDS = 0.5
+INSERT_SHARE = 0.05
+# a stage is saturated when it adds less than this share of throughput to the previous one
+MIN_THROUGHPUT_GAIN = 0.1
+MAX_ERROR_RATE = 0.01
+P99_MS = 2000.
+MUTANT_SEARCHES = ('WT', 'W434F', 'Trp434Phe', '400-450', 'L2', 'A')
+TIMEOUT = 60
+
+
+class Connection:
+    """Keep-alive HTTP connection of one virtual user, reopened after errors"""
+
+    def __init__(self, url):
+        parts = urlsplit(url)
+        self.host, self.port = parts.hostname, parts.port or 80
+        self._connection = None
+
+    def request(self, method, path, body=None):
+        """(status, response size); status 0 when the request failed"""
+        headers = {'Content-Type': 'application/json'} if body is not None else {}
+        try:
+            if self._connection is None:
+                self._connection = http.client.HTTPConnection(self.host, self.port, timeout=TIMEOUT)
+            self._connection.request(method, path, body=body, headers=headers)
+            response = self._connection.getresponse()
+            return response.status, len(response.read())
+        except (OSError, http.client.HTTPException):
+            self.close()
+            return 0, 0
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+
+def _components(node):
+    """Every component of a layout tree"""
+    if isinstance(node, list):
+        for child in node:
+            yield from _components(child)
+    elif isinstance(node, dict) and 'props' in node:
+        yield node
+        yield from _components(node['props'].get('children'))
+        for value in node['props'].values():
+            if isinstance(value, dict) and 'props' in value:
+                yield from _components(value)
+
+
+class AppModel:
+    """What the renderer knows of the app: initial prop values, server-side callbacks, isoform options"""
+
+    def __init__(self, url):
+        connection = http.client.HTTPConnection(urlsplit(url).hostname, urlsplit(url).port or 80, timeout=TIMEOUT)
+        layout = self._get_json(connection, '/_dash-layout')
+        dependencies = self._get_json(connection, '/_dash-dependencies')
+        connection.close()
+
+        self.props = {}
+        for component in _components(layout):
+            component_id = component['props'].get('id')
+            if isinstance(component_id, str):
+                for prop, value in component['props'].items():
+                    if prop != 'children':
+                        self.props[f'{component_id}.{prop}'] = value
+        catalog = self.props.get('channel-catalog.data') or {}
+        self.options = {key: [option['value'] for option in options if option['value']]
+                        for key, options in catalog.get('options', {}).items()}
+
+        self.callbacks = [dep for dep in dependencies if not dep.get('clientside_function')]
+        self.triggered_by = defaultdict(list)
+        for callback in self.callbacks:
+            for item in callback['inputs']:
+                self.triggered_by[f"{item['id']}.{item['property']}"].append(callback)
+
+    @staticmethod
+    def _get_json(connection, path):
+        connection.request('GET', path)
+        response = connection.getresponse()
+        if response.status != 200:
+            raise RuntimeError(f'GET {path}: {response.status}')
+        return json.loads(response.read())
+
+
+def callback_name(output):
+    return ','.join(output.strip('.').split('...'))
+
+
+class Recorder:
+    """(time, request, status, latency) of every request, shared by the virtual users"""
+
+    def __init__(self):
+        self.samples = []
+        self._lock = threading.Lock()
+
+    def add(self, name, status, latency):
+        with self._lock:
+            self.samples.append((time.monotonic(), name, status, latency))
+
+    def between(self, start, stop):
+        with self._lock:
+            return [sample for sample in self.samples if start <= sample[0] < stop]
+
+
+class VirtualUser:
+
+    def __init__(self, model, url, recorder, rng, think, insert_share):
+        self.model = model
+        self.connection = Connection(url)
+        self.recorder = recorder
+        self.rng = rng
+        self.think = think
+        self.insert_share = insert_share
+        self.props = dict(model.props)
+
+    def _request(self, name, method, path, body=None):
+        start = time.perf_counter()
+        status, _ = self.connection.request(method, path, body)
+        self.recorder.add(name, status, time.perf_counter() - start)
+
+    def fire(self, callback, trigger):
+        def values(items):
+            return [dict(item, value=self.props.get(f"{item['id']}.{item['property']}")) for item in items]
+
+        output = callback['output']
+        if output.startswith('..'):
+            outputs = [dict(zip(('id', 'property'), part.split('.'))) for part in output.strip('.').split('...')]
+        else:
+            outputs = dict(zip(('id', 'property'), output.split('.')))
+        body = {'output': output, 'outputs': outputs, 'inputs': values(callback['inputs']),
+                'state': values(callback['state']), 'changedPropIds': [trigger]}
+        self._request(callback_name(output), 'POST', '/_dash-update-component', json.dumps(body))
+
+    def set(self, prop, value):
+        """Changes a prop as the user would, firing the server callbacks it is an input of"""
+        if self.props.get(prop) == value:
+            return
+        self.props[prop] = value
+        for callback in self.model.triggered_by.get(prop, ()):
+            self.fire(callback, prop)
+
+    def pause(self, stop):
+        if self.think:
+            stop.wait(self.rng.expovariate(1 / self.think))
+
+    def load_page(self):
+        for path in ('/', '/_dash-layout', '/_dash-dependencies'):
+            self._request(path, 'GET', path)
+        self.props = dict(self.model.props)
+        for callback in self.model.callbacks:
+            if not callback.get('prevent_initial_call'):
+                item = callback['inputs'][0]
+                self.fire(callback, f"{item['id']}.{item['property']}")
+
+    def consult(self, stop):
+        self.set('mother-tabs.value', 'select-tab')
+        gating = self.rng.choice(('vg', 'vg', 'vg', 'lg'))
+        self.set('gating-radio.value', gating)
+        self.pause(stop)
+        keys = [key for key in self.model.options if key.startswith(gating + '|')]
+        if not keys:
+            return
+        ion = self.rng.choice(keys).split('|')[1]
+        self.set('selectivity-dropdown.value', ion)
+        self.pause(stop)
+        self.set('isoform-dropdown.value', self.rng.choice(self.model.options[f'{gating}|{ion}']))
+        self.pause(stop)
+        for page in range(1, self.rng.randint(1, 4)):
+            self.set('consult-table.page_current', page)
+            self.pause(stop)
+        if self.rng.random() < 0.3:
+            self.set('mutant-input.value', self.rng.choice(MUTANT_SEARCHES))
+            self.pause(stop)
+
+    def insert(self, stop):
+        self.set('mother-tabs.value', 'insert-tab')
+        self.set('gating-radio.value', 'vg')
+        self.set('selectivity-dropdown.value', 'K')
+        self.set('isoform-dropdown.value', self.rng.choice(self.model.options.get('vg|K') or ['Kv 1.2']))
+        self.set('mutant-input.value', 'W434F')
+        self.set('new-residue-dropdown.value', 'Phe (F)')
+        for prop, value in (('Activation-V50', -20), ('Inactivation-V50', -50), ('Activation-Time', 2),
+                            ('Inactivation-Time', 200), ('Activation-Z', 3), ('Inactivation-Z', 4),
+                            ('source-input', 'load test')):
+            self.props[f'{prop}.value'] = value + self.rng.random() if not isinstance(value, str) else value
+        self.pause(stop)
+        self.set('submit-button.n_clicks', (self.props.get('submit-button.n_clicks') or 0) + 1)
+
+    def run(self, stop):
+        while not stop.is_set():
+            self.load_page()
+            while not stop.is_set() and self.rng.random() < 0.8:
+                if self.rng.random() < self.insert_share:
+                    self.insert(stop)
+                else:
+                    self.consult(stop)
+                self.pause(stop)
+        self.connection.close()
+
+
+def summarize(samples, seconds):
+    latencies = np.array([sample[3] for sample in samples]) * 1e3
+    errors = sum(1 for sample in samples if not 200 <= sample[2] < 400)
+    summary = {'requests': len(samples), 'errors': errors,
+               'error_rate': round(errors / len(samples), 4) if samples else 0.,
+               'throughput_per_s': round((len(samples) - errors) / seconds, 2)}
+    for q in (50, 95, 99):
+        summary[f'p{q}_ms'] = round(float(np.percentile(latencies, q)), 2) if len(samples) else None
+    return summary
+
+
+def run_ramp(url, users, stage_seconds, think, insert_share, p99_ms, seed):
+    model = AppModel(url)
+    recorder = Recorder()
+    stop = threading.Event()
+    threads = []
+    stages = []
+    for n_users in users:
+        while len(threads) < n_users:
+            user = VirtualUser(model, url, recorder, random.Random(seed + len(threads)), think, insert_share)
+            thread = threading.Thread(target=user.run, args=(stop,), daemon=True)
+            thread.start()
+            threads.append(thread)
+        start = time.monotonic()
+        time.sleep(stage_seconds)
+        samples = recorder.between(start, time.monotonic())
+        stage = dict(users=n_users, **summarize(samples, stage_seconds))
+        by_request = defaultdict(list)
+        for sample in samples:
+            by_request[sample[1]].append(sample)
+        stage['requests_by_name'] = {name: summarize(group, stage_seconds)
+                                     for name, group in sorted(by_request.items())}
+        stages.append(stage)
+        print(f"{n_users:>5} users {stage['throughput_per_s']:>9.1f} req/s  errors {stage['error_rate']:>7.2%}  "
+              f"p50 {stage['p50_ms']} ms  p95 {stage['p95_ms']} ms  p99 {stage['p99_ms']} ms", file=sys.stderr)
+    stop.set()
+    for thread in threads:
+        thread.join(TIMEOUT)
+    return stages, saturation(stages, p99_ms)
+
+
+def saturation(stages, p99_ms):
+    """Users of the last stage before saturation (capacity) and of the first saturated stage, with the reason"""
+    for previous, stage in zip([None] + stages, stages):
+        reason = None
+        if stage['error_rate'] > MAX_ERROR_RATE:
+            reason = f"error rate {stage['error_rate']:.2%}"
+        elif stage['p99_ms'] is not None and stage['p99_ms'] > p99_ms:
+            reason = f"p99 {stage['p99_ms']} ms over {p99_ms:g} ms"
+        elif previous is not None and \
+                stage['throughput_per_s'] < previous['throughput_per_s'] * (1 + MIN_THROUGHPUT_GAIN):
+            reason = f"throughput {stage['throughput_per_s']} req/s, {previous['throughput_per_s']} before"
+        if reason:
+            return {'capacity_users': previous['users'] if previous else 0, 'saturated_users': stage['users'],
+                    'reason': reason}
+    return {'capacity_users': stages[-1]['users'] if stages else 0, 'saturated_users': None,
+            'reason': 'not saturated'}
+
+
+def wait_until_up(url, server, seconds):
+    deadline = time.monotonic() + seconds
+    connection = Connection(url)
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f'the server exited with status {server.returncode}')
+        if connection.request('GET', '/_dash-layout')[0] == 200:
+            connection.close()
+            return
+        time.sleep(0.5)
+    raise RuntimeError(f'{url} did not come up within {seconds:g} s')
+
+
+def start_server(url, workers, rows, seed, directory):
+    """gunicorn with the production settings (gunicorn.conf.py), on a synthetic table when rows is given"""
+    env = dict(os.environ, PORT=str(urlsplit(url).port or 80))
+    if workers:
+        env['WEB_CONCURRENCY'] = str(workers)
+    if rows:
+        from bench.synthetic import generate
+        from db.columnar import write_table
+
+        env['KINETICS_DB'] = os.path.join(directory, 'kinetics.arrow')
+        write_table(generate(rows, seed=seed), env['KINETICS_DB'])
+    server = subprocess.Popen([shutil.which('gunicorn') or 'gunicorn', '-c', 'gunicorn.conf.py', 'app:server'],
+                              cwd=REPO_DIR, env=env)
+    try:
+        wait_until_up(url, server, 300)
+    except RuntimeError:
+        server.terminate()
+        raise
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default=DEFAULT_URL)
+    parser.add_argument('--users', type=int, nargs='+', default=DEFAULT_USERS)
+    parser.add_argument('--stage-seconds', type=float, default=STAGE_SECONDS)
+    parser.add_argument('--think', type=float, default=THINK_SECONDS, help='mean think time between actions, s')
+    parser.add_argument('--insert-share', type=float, default=INSERT_SHARE)
+    parser.add_argument('--p99-ms', type=float, default=P99_MS)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out')
+    parser.add_argument('--start-server', action='store_true', help='run gunicorn on --url for the test')
+    parser.add_argument('--workers', type=int, help='gunicorn workers, with --start-server')
+    parser.add_argument('--rows', type=float, help='serve a synthetic table of this size, with --start-server')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix='kinetics-load-') as directory:
+        server = None
+        if args.start_server:
+            server = start_server(args.url, args.workers, int(args.rows) if args.rows else None, args.seed,
+                                  directory)
+        try:
+            stages, result = run_ramp(args.url, args.users, args.stage_seconds, args.think, args.insert_share,
+                                      args.p99_ms, args.seed)
+        finally:
+            if server is not None:
+                server.terminate()
+                server.wait(TIMEOUT)
+
+    print(f"capacity: {result['capacity_users']} users"
+          + (f", saturated at {result['saturated_users']} ({result['reason']})" if result['saturated_users'] else ''))
+    if args.out:
+        settings = {key: value for key, value in vars(args).items() if key != 'out'}
+        with open(args.out, 'w') as f:
+            json.dump({'settings': settings, 'saturation': result, 'stages': stages}, f, indent=1)
+
+
+if __name__ == '__main__':
+    main()
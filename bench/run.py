@@ -0,0 +1,275 @@
+"""Benchmarks of the data path and the callbacks on synthetic tables, with results in JSON to compare commits.
+
+    python -m bench.run                                  # 1e3 and 1e5 rows -> bench/results/<commit>.json
+    python -m bench.run --rows 1e3 1e5 1e6 1e7 --out results.json --scenarios filter_db get_stats
+    python -m bench.run --compare old.json new.json      # p50 ratios, exits with 1 on a regression
+
+Each size runs in its own process, started on a generated table (bench.synthetic) through KINETICS_DB, so the
+code under test is the app as served: store, indexes, caches and callbacks. Scenarios call the app's functions
+directly or go through the Flask test client; 'cold' ones clear the query cache before every call. For each
+scenario the results hold p50/p99/mean latency, throughput (calls per second, one thread), the peak memory
+allocated by one call (tracemalloc) and the peak RSS of the process so far."""
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(REPO_DIR, 'bench', 'results')
+DEFAULT_ROWS = (1e3, 1e5)
+REPEAT = 50
+# seconds of calls per scenario, after which it stops even if it has not been repeated REPEAT times
+BUDGET = 10.
+MIN_ITERATIONS = 3
+REGRESSION_THRESHOLD = 0.1
+
+
+def callback_body(outputs, inputs):
+    """Body of a /_dash-update-component request, as sent by the browser"""
+    outputs = [dict(zip(('id', 'property'), output.split('.'))) for output in outputs]
+    output = '..' + '...'.join(f"{o['id']}.{o['property']}" for o in outputs) + '..' if len(outputs) > 1 else \
+        f"{outputs[0]['id']}.{outputs[0]['property']}"
+    return {
+        'output': output,
+        'outputs': outputs if len(outputs) > 1 else outputs[0],
+        'inputs': [{'id': i, 'property': p, 'value': v} for (i, p), v in inputs],
+        'changedPropIds': [f'{inputs[0][0][0]}.{inputs[0][0][1]}'],
+    }
+
+
+def scenarios(app, filters):
+    """name -> (function, cold, setup); filters are the Consult form's (gating, selectivity, isoform, mutant,
+    new residue)"""
+    from db.schema import NUM_COLS
+    from db.store import STORE
+
+    client = app.server.test_client()
+    gating, selectivity, isoform, mutant, new_res = filters
+    form = [(('gating-radio', 'value'), gating), (('selectivity-dropdown', 'value'), selectivity),
+            (('isoform-dropdown', 'value'), isoform), (('mutant-input', 'value'), mutant),
+            (('new-residue-dropdown', 'value'), new_res)]
+    table = [(('consult-table', 'page_current'), 0), (('consult-table', 'page_size'), app.TABLE_PAGE_SIZE),
+             (('consult-table', 'sort_by'), [{'column_id': 'act_v50', 'direction': 'asc'}]),
+             (('consult-table', 'filter_query'), '{act_v50} < -20')]
+    hist = [(('hist-selector', 'value'), ['act_v50', 'inact_v50'])]
+    shift = [(('shift-metric', 'value'), 'd_act_v50')]
+    scatter = [(('scatter-x', 'value'), 'act_v50'), (('scatter-y', 'value'), 'inact_v50')]
+    query = f'?gating={gating}&selectivity={selectivity}&isoform={isoform}'
+
+    def post(outputs, inputs):
+        response = client.post('/_dash-update-component', json=callback_body(outputs, inputs))
+        assert response.status_code == 200, response.status_code
+        return response.data
+
+    def get(url):
+        response = client.get(url)
+        assert response.status_code == 200, response.status_code
+        return b''.join(response.response)
+
+    def filtered():
+        return app.filter_db(STORE.frame(), isoform, mutant, selectivity, new_res, gating)
+
+    def append():
+        app.update_db(STORE.frame(), selectivity, isoform, 'W434F', 'Phe (F)', -20., 2., -50., 200., 3., 4., 'bench')
+
+    subset = {}
+
+    def keep_subset():
+        subset['df'] = filtered()
+
+    return {
+        'load': (STORE.preload, True, None),
+        'filter_db': (filtered, False, None),
+        'filter_db_mutant_range': (lambda: app.filter_db(STORE.frame(), None, '400-450', None), False, None),
+        'get_stats': (lambda: app.get_stats(subset['df'], NUM_COLS), False, keep_subset),
+        'df_to_html_table': (lambda: app.df_to_html_table(subset['df'].head(app.TABLE_PAGE_SIZE)), False,
+                             keep_subset),
+        'query_stats': (lambda: app.query_stats(NUM_COLS, *filters), True, None),
+        'query_stats_cached': (lambda: app.query_stats(NUM_COLS, *filters), False, None),
+        'callback_consult_table': (lambda: post(['consult-table.data', 'consult-table.page_count'], form + table),
+                                   True, None),
+        'callback_consult_graph': (lambda: post(['consult-graph.figure'], hist + form), True, None),
+        'callback_stats_table': (lambda: post(['stats-table.children'], hist + form), True, None),
+        'callback_scatter_points': (lambda: post(['scatter-graph.figure'], scatter + [(('scatter-mode', 'value'),
+                                                                                     'points')] + form), True, None),
+        'callback_scatter_density': (lambda: post(['scatter-graph.figure'], scatter + [(('scatter-mode', 'value'),
+                                                                                       'density')] + form), True, None),
+        'query_comparison': (app.query_comparison, True, None),
+        'callback_shift_view': (lambda: post(['shift-heatmap.figure', 'shift-table.children'], shift + form), True,
+                                None),
+        'api_kinetics': (lambda: get(f'/api/v1/kinetics{query}&limit=1000'), True, None),
+        'export_csv': (lambda: get(f'/export/kinetics.csv{query}'), True, None),
+        # last: every call adds a row
+        'write_append': (append, False, None),
+    }
+
+
+def measure(func, cold, repeat, budget, clear):
+    """Latencies (seconds) of calls to func, after a warm-up call, and the peak memory allocated by one call"""
+    func()
+    latencies = []
+    started = time.perf_counter()
+    while len(latencies) < repeat and (len(latencies) < MIN_ITERATIONS or time.perf_counter() - started < budget):
+        if cold:
+            clear()
+        start = time.perf_counter()
+        func()
+        latencies.append(time.perf_counter() - start)
+    if cold:
+        clear()
+    tracemalloc.start()
+    try:
+        func()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return latencies, peak
+
+
+def max_rss_mb():
+    # kilobytes on Linux, bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (2 ** 20 if sys.platform == 'darwin' else 2 ** 10)
+
+
+def summarize(rows, name, latencies, peak):
+    latencies = np.array(latencies)
+    return {
+        'rows': rows,
+        'scenario': name,
+        'iterations': len(latencies),
+        'p50_ms': round(float(np.percentile(latencies, 50)) * 1e3, 4),
+        'p99_ms': round(float(np.percentile(latencies, 99)) * 1e3, 4),
+        'mean_ms': round(float(latencies.mean()) * 1e3, 4),
+        'throughput_per_s': round(len(latencies) / float(latencies.sum()), 2),
+        'peak_alloc_mb': round(peak / 2 ** 20, 3) if peak is not None else None,
+        'max_rss_mb': round(max_rss_mb(), 1),
+    }
+
+
+def run_worker(rows, isoform, names, repeat, budget):
+    """Runs the scenarios in this process, on the table KINETICS_DB points to"""
+    import app
+    from db.cache import QUERY_CACHE
+
+    filters = ('vg', 'K', isoform, None, None)
+    results = []
+    for name, (func, cold, setup) in scenarios(app, filters).items():
+        if names and name not in names:
+            continue
+        if setup is not None:
+            setup()
+        if name == 'load':
+            # the first load only: the table has not been touched yet
+            start = time.perf_counter()
+            func()
+            latencies, peak = [time.perf_counter() - start], None
+        else:
+            latencies, peak = measure(func, cold, repeat, budget, QUERY_CACHE.clear)
+        results.append(summarize(rows, name, latencies, peak))
+        print(f"{rows:>10} {name:<24} p50 {results[-1]['p50_ms']:>10.3f} ms  p99 {results[-1]['p99_ms']:>10.3f} ms",
+              file=sys.stderr)
+    return results
+
+
+def run_size(rows, args):
+    from bench.synthetic import generate
+    from db.columnar import write_table
+
+    with tempfile.TemporaryDirectory(prefix='kinetics-bench-') as directory:
+        path = os.path.join(directory, 'kinetics.arrow')
+        df = generate(rows, seed=args.seed)
+        write_table(df, path)
+        # the most popular potassium channel, as a typical Consult query
+        isoform = df.loc[df['selectivity'] == 'K+', 'isoform'].value_counts().index[0]
+        del df
+        command = [sys.executable, '-m', 'bench.run', '--worker', str(rows), '--isoform', isoform,
+                   '--repeat', str(args.repeat), '--budget', str(args.budget)]
+        if args.scenarios:
+            command += ['--scenarios'] + args.scenarios
+        env = dict(os.environ, KINETICS_DB=path, PYTHONPATH=REPO_DIR)
+        output = subprocess.run(command, cwd=REPO_DIR, env=env, stdout=subprocess.PIPE, check=True).stdout
+    return json.loads(output)
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIR, stdout=subprocess.PIPE,
+                              stderr=subprocess.DEVNULL, check=True).stdout.decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def environment():
+    import pandas as pd
+
+    return {
+        'commit': git_commit(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+    }
+
+
+def compare(old_path, new_path, threshold):
+    """Prints the p50 of each scenario in both runs; True when one got slower by more than threshold"""
+    with open(old_path) as f:
+        old = {(r['rows'], r['scenario']): r for r in json.load(f)['results']}
+    with open(new_path) as f:
+        new = {(r['rows'], r['scenario']): r for r in json.load(f)['results']}
+    regressed = False
+    print(f"{'rows':>10} {'scenario':<24} {'old p50':>12} {'new p50':>12} {'ratio':>7}")
+    for key in sorted(old.keys() & new.keys()):
+        ratio = new[key]['p50_ms'] / old[key]['p50_ms'] if old[key]['p50_ms'] else float('nan')
+        flag = ' slower' if ratio > 1 + threshold else ''
+        regressed |= bool(flag)
+        print(f"{key[0]:>10} {key[1]:<24} {old[key]['p50_ms']:>9.3f} ms {new[key]['p50_ms']:>9.3f} ms "
+              f"{ratio:>7.2f}{flag}")
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=float, nargs='+', default=DEFAULT_ROWS)
+    parser.add_argument('--scenarios', nargs='+')
+    parser.add_argument('--repeat', type=int, default=REPEAT)
+    parser.add_argument('--budget', type=float, default=BUDGET, help='seconds per scenario')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'))
+    parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD)
+    parser.add_argument('--worker', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--isoform', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.compare:
+        sys.exit(1 if compare(*args.compare, args.threshold) else 0)
+    if args.worker is not None:
+        json.dump(run_worker(args.worker, args.isoform, args.scenarios, args.repeat, args.budget), sys.stdout)
+        return
+
+    results = []
+    for rows in args.rows:
+        results.extend(run_size(int(rows), args))
+    report = {'environment': environment(), 'settings': {'seed': args.seed, 'repeat': args.repeat,
+                                                         'budget': args.budget}, 'results': results}
+    out = args.out or os.path.join(RESULTS_DIR, f"{report['environment']['commit'] or 'results'}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, 'w') as f:
+        json.dump(report, f, indent=1)
+    print(f'{len(results)} results written to {out}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+"""Synthetic kinetics tables for benchmarks: Kv, Nav, Cav and ClC records with mutants, at any size.
+
+    python -m bench.synthetic 1000000 /tmp/kinetics.arrow [--seed 0]
+
+Isoforms come from cfg/channels.json and are drawn with Zipf-like popularity (a few channels hold most of the
+records, as in the literature). Each family has its own V50, slope (z) and time constant distributions, shifted
+per isoform and per mutant; about half of the records are wild type. The same seed gives the same table."""
+import argparse
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from db.columnar import write_table
+from db.schema import COLUMNS, RESIDUES
+
+CATALOG_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'cfg', 'channels.json')
+
+# per family: selectivity label, then (mean, sd) of V50 (mV) and the median and log-sd of z and tau (ms)
+FAMILY_KINETICS = {
+    'Kv': {'selectivity': 'K+', 'act_v50': (-20, 12), 'inact_v50': (-45, 12),
+           'act_z': (3., .3), 'inact_z': (3.5, .3), 'act_time': (3., .8), 'inact_time': (600., 1.)},
+    'Nav': {'selectivity': 'Na+', 'act_v50': (-28, 7), 'inact_v50': (-68, 8),
+            'act_z': (5., .25), 'inact_z': (6., .25), 'act_time': (.3, .5), 'inact_time': (1.2, .6)},
+    'Cav': {'selectivity': 'Ca+', 'act_v50': (-12, 14), 'inact_v50': (-40, 15),
+            'act_z': (4., .3), 'inact_z': (5., .3), 'act_time': (1.5, .7), 'inact_time': (150., 1.)},
+    'ClC': {'selectivity': 'Cl-', 'act_v50': (-70, 25), 'inact_v50': (-100, 20),
+            'act_z': (1., .4), 'inact_z': (1., .4), 'act_time': (40., .9), 'inact_time': (900., 1.)},
+}
+# share of records missing inactivation (non-inactivating channels, unreported values) by family
+MISSING_INACTIVATION = {'Kv': .3, 'Nav': .05, 'Cav': .15, 'ClC': .6}
+WILD_TYPE_SHARE = .5
+DOUBLE_MUTANT_SHARE = .1
+MUTANTS_PER_ISOFORM = 200
+N_SOURCES = 2000
+ZIPF_EXPONENT = 1.1
+
+
+def load_isoforms(path=CATALOG_FILE):
+    """[(family, isoform)] of the benchmarked families, in registry order"""
+    with open(path, encoding='utf-8') as f:
+        families = json.load(f)['families']
+    return [(family['family'], isoform) for family in families if family['family'] in FAMILY_KINETICS
+            for isoform in family['isoforms']]
+
+
+def _mutant_pool(rng, n_mutants, length):
+    """Distinct mutant names with the new residue of each ('' for double mutants, which have several)"""
+    letters = [res[-2] for res in RESIDUES]
+    names = {}
+    while len(names) < n_mutants:
+        n_mutations = 2 if rng.random() < DOUBLE_MUTANT_SHARE else 1
+        mutations = []
+        for _ in range(n_mutations):
+            original, new = rng.choice(letters, 2, replace=False)
+            mutations.append((original, int(rng.integers(1, length)), new))
+        name = '/'.join(f'{original}{position}{new}' for original, position, new in mutations)
+        if name not in names:
+            names[name] = next(res for res in RESIDUES if res[-2] == mutations[0][2]) if n_mutations == 1 else ''
+    return list(names), list(names.values())
+
+
+def generate(n_rows, seed=0):
+    """A kinetics frame of n_rows synthetic records, with the store's column types"""
+    rng = np.random.default_rng(seed)
+    isoforms = load_isoforms()
+    families = np.array([family for family, _ in isoforms])
+
+    # Zipf popularity over a fixed random ranking of the isoforms
+    ranks = rng.permutation(len(isoforms)) + 1
+    popularity = 1 / ranks ** ZIPF_EXPONENT
+    isoform_codes = rng.choice(len(isoforms), size=n_rows, p=popularity / popularity.sum())
+
+    # mutants: a pool per isoform, rows pick WT or one of their isoform's mutants
+    mutant_names, mutant_new, mutant_offset = ['WT'], [None], [0]
+    for _ in isoforms:
+        names, new_residues = _mutant_pool(rng, MUTANTS_PER_ISOFORM, int(rng.integers(500, 2000)))
+        mutant_names.extend(names)
+        mutant_new.extend(new_residues)
+        mutant_offset.append(mutant_offset[-1] + len(names))
+    # the same name can appear under several isoforms: rows are coded on distinct names
+    distinct, name_codes = np.unique(np.array(mutant_names, dtype=object), return_inverse=True)
+    is_wild_type = rng.random(n_rows) < WILD_TYPE_SHARE
+    pick = 1 + np.array(mutant_offset)[isoform_codes] + rng.integers(0, MUTANTS_PER_ISOFORM, size=n_rows)
+    pick[is_wild_type] = 0
+    new_residue = np.array([res or None for res in mutant_new], dtype=object)[pick]
+
+    columns = {
+        'selectivity': pd.Categorical(np.array([FAMILY_KINETICS[f]['selectivity'] for f in families])[isoform_codes]),
+        'isoform': pd.Categorical.from_codes(isoform_codes, categories=[name for _, name in isoforms]),
+        'mutant': pd.Categorical.from_codes(name_codes[pick], categories=list(distinct)),
+        'new_residue': pd.Categorical(new_residue),
+    }
+
+    # kinetics: family distribution, shifted per isoform and per mutant
+    isoform_shift = rng.normal(0, 6, size=len(isoforms))[isoform_codes]
+    mutant_effect = rng.normal(0, 4, size=len(mutant_names))[pick] + rng.normal(0, 8, n_rows)
+    mutant_shift = np.where(is_wild_type, 0, mutant_effect)
+    row_family = families[isoform_codes]
+    for col in ('act_v50', 'inact_v50', 'act_z', 'inact_z', 'act_time', 'inact_time'):
+        values = np.empty(n_rows)
+        for family, params in FAMILY_KINETICS.items():
+            rows = row_family == family
+            center, spread = params[col]
+            if col.endswith('v50'):
+                values[rows] = rng.normal(center, spread, rows.sum()) + isoform_shift[rows] + mutant_shift[rows]
+            else:
+                values[rows] = rng.lognormal(np.log(center), spread, rows.sum())
+        columns[col] = np.round(values, 2)
+    for family, share in MISSING_INACTIVATION.items():
+        missing = (row_family == family) & (rng.random(n_rows) < share)
+        for col in ('inact_v50', 'inact_z', 'inact_time'):
+            columns[col][missing] = np.nan
+    columns['act_z'][rng.random(n_rows) < .05] = np.nan
+
+    sources = np.array([f'Synthetic et al. {1990 + i % 35} #{i}' for i in range(N_SOURCES)], dtype=object)
+    columns['source'] = sources[rng.zipf(1.5, n_rows) % N_SOURCES]
+    return pd.DataFrame(columns)[COLUMNS]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('rows', type=float)
+    parser.add_argument('destination', help='.arrow/.feather for Arrow IPC, anything else for TSV')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    df = generate(int(args.rows), seed=args.seed)
+    write_table(df, args.destination)
+    print(f'{len(df)} rows written to {args.destination}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+import threading
+import time
+from collections import OrderedDict
+
+from monitoring.metrics import note_cache
+
+
+def normalize_filters(gating, selectivity, isoform, mutant, new_res):
+    """Canonical filter tuple: empty inputs become None and the free-text mutant is stripped"""
+    if isinstance(mutant, str):
+        mutant = mutant.strip()
+    return tuple(value or None for value in (gating, selectivity, isoform, mutant, new_res))
+
+
+class _Flight:
+    """A computation in progress, awaited by every request for the same key"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class QueryCache:
+    """Bounded LRU cache with a time-to-live, keyed on hashable tuples.
+
+    Keys are expected to carry the dataset version so that entries computed against an older table are never
+    served; clear() drops everything at once after a write. Concurrent misses on the same key are coalesced: the
+    first computes, the others wait for its result (single-flight)."""
+
+    def __init__(self, maxsize=256, ttl=600):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self._entries = OrderedDict()
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, compute):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now - entry[0] < self.ttl:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                note_cache('hit')
+                return entry[1]
+            flight = self._flights.get(key)
+            if flight is None:
+                flight = self._flights[key] = _Flight()
+                self.misses += 1
+                leader = True
+            else:
+                self.coalesced += 1
+                leader = False
+        note_cache('miss' if leader else 'coalesced')
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        try:
+            flight.value = compute()
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+                if flight.error is None:
+                    self._entries[key] = (now, flight.value)
+                    self._entries.move_to_end(key)
+                    while len(self._entries) > self.maxsize:
+                        self._entries.popitem(last=False)
+            flight.done.set()
+        return flight.value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'coalesced': self.coalesced, 'size': len(self._entries),
+                    'maxsize': self.maxsize}
+
+
+QUERY_CACHE = QueryCache()
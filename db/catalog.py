@@ -0,0 +1,86 @@
+"""Channel families and isoforms offered by the isoform dropdown, loaded from cfg/channels.json.
+
+Option lists are built once per (gating, ion) key and shipped to the browser in the layout (see table()), where
+a clientside callback picks them (assets/clientside.js). Above MAX_OPTIONS entries a key is searched by prefix
+instead, matching the start of the full name or of any word in it ('1.2' finds 'Kv 1.2'): such keys also ship a
+sorted list of those name endings (see prefix_table()), which the browser binary-searches.
+
+The catalog is also where the gating of an isoform is defined (gating()), for the gating filters. It lives with
+the data rather than the layout so that the store and its queries load without Dash."""
+import json
+import os
+from collections import OrderedDict
+
+CONFIG_DIR = os.getcwd() + '/cfg'
+CATALOG_FILE = os.path.join(CONFIG_DIR, 'channels.json')
+GATINGS = ('vg', 'lg')
+# keys with more isoforms than this are served through prefix search instead of as one list
+MAX_OPTIONS = 500
+SEARCH_LIMIT = 50
+
+
+def _option(isoform):
+    return {'label': isoform, 'value': isoform}
+
+
+def _utf16(text):
+    # the order of JavaScript string comparisons
+    return text.encode('utf-16-be')
+
+
+def prefix_table(names):
+    """{'keys': [...], 'ids': [...]}: every lower-cased name ending that starts at a word ('kv 1.2', '1.2'), sorted
+    as JavaScript compares strings, and the position in names of the name it ends"""
+    endings = []
+    for i, name in enumerate(names):
+        words = name.lower().split(' ')
+        endings.extend((' '.join(words[start:]), i) for start in range(len(words)))
+    endings.sort(key=lambda ending: (_utf16(ending[0]), ending[1]))
+    return {'keys': [key for key, _ in endings], 'ids': [i for _, i in endings]}
+
+
+class ChannelCatalog:
+
+    def __init__(self, families, version=None):
+        self.version = version
+        self.families = families
+        isoforms = OrderedDict()
+        self._family_gating, self._isoform_gating = {}, {}
+        for family in families:
+            if family['gating'] not in GATINGS:
+                raise ValueError(f"{family['family']}: gating must be one of {GATINGS}, not {family['gating']!r}")
+            self._family_gating[family['family']] = family['gating']
+            self._isoform_gating.update((isoform, family['gating']) for isoform in family['isoforms'])
+            for ion in family['ions']:
+                isoforms.setdefault((family['gating'], ion), []).extend(family['isoforms'])
+
+        self._options = {key: tuple(_option(isoform) for isoform in names) for key, names in isoforms.items()}
+
+    @classmethod
+    def load(cls, path=CATALOG_FILE):
+        with open(path, encoding='utf-8') as f:
+            registry = json.load(f)
+        return cls(registry['families'], version=registry.get('version'))
+
+    def gating(self, isoform):
+        """'vg' or 'lg': the gating of the isoform's family, found by the isoform or, for isoforms missing from the
+        catalog, by its family name (the name up to the first space); 'vg' for unknown families"""
+        gating = self._isoform_gating.get(isoform)
+        if gating is None:
+            gating = self._family_gating.get(str(isoform).split(' ')[0], 'vg')
+        return gating
+
+    def table(self):
+        """Every option list keyed by 'gating|ion', the prefix tables of the lists searched by prefix and the search
+        settings, as read by the clientside callback"""
+        return {
+            'version': self.version,
+            'max_options': MAX_OPTIONS,
+            'search_limit': SEARCH_LIMIT,
+            'options': {f'{gating}|{ion}': list(options) for (gating, ion), options in self._options.items()},
+            'prefixes': {f'{gating}|{ion}': prefix_table([option['label'] for option in options])
+                         for (gating, ion), options in self._options.items() if len(options) > MAX_OPTIONS},
+        }
+
+
+CATALOG = ChannelCatalog.load()
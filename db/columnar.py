@@ -0,0 +1,85 @@
+"""Arrow IPC (Feather v2) files for the kinetics table, and conversion to and from the TSV layout.
+
+    python -m db.columnar db/test.csv db/kinetics.arrow    # TSV -> Arrow
+    python -m db.columnar db/kinetics.arrow db/test.csv    # Arrow -> TSV
+
+Measurements are stored as float32 and text columns dictionary-encoded. Files are written uncompressed and read
+through a memory map, so a load only pages in the columns asked for and converts them, instead of parsing text;
+the store then widens the measurements to float64 once (see coerce_frame). Values keep float32 precision, about
+7 significant digits. Start the app with KINETICS_DB=db/kinetics.arrow to serve from one."""
+import argparse
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from pyarrow import feather
+
+from db.schema import COLUMNS, NUM_COLS, TEXT_COLS, coerce_frame
+
+ARROW_EXTENSIONS = ('.arrow', '.feather')
+
+
+def is_arrow(path):
+    return str(path).lower().endswith(ARROW_EXTENSIONS)
+
+
+def to_arrow(df):
+    """Arrow table of a kinetics frame: dictionary-encoded text, float32 measurements"""
+    arrays = {}
+    for col in TEXT_COLS:
+        # values read as numbers (e.g. a source '12345678') are written as the text they were
+        values = df[col].astype(object)
+        values = values.where(values.isna(), values.astype(str))
+        arrays[col] = pa.array(values, type=pa.string(), from_pandas=True).dictionary_encode()
+    for col in NUM_COLS:
+        arrays[col] = pa.array(df[col].to_numpy(dtype=np.float32), type=pa.float32(), from_pandas=True)
+    return pa.Table.from_arrays([arrays[col] for col in COLUMNS], names=COLUMNS)
+
+
+def write_arrow(df, path):
+    feather.write_feather(to_arrow(df), path, compression='uncompressed')
+
+
+def read_arrow(path, columns=None):
+    """The table (or only `columns` of it) as a frame, read through a memory map; measurements stay float32"""
+    return feather.read_table(path, columns=columns, memory_map=True).to_pandas()
+
+
+def read_tsv(source, header=True, columns=None):
+    """Rows of a TSV table (or journal, without header): text columns as written ('007' stays '007', a mutant
+    named 'NA' is not missing), only empty fields missing"""
+    return pd.read_csv(source, sep='\t', header=0 if header else None, names=None if header else COLUMNS,
+                       usecols=columns, dtype={col: str for col in TEXT_COLS}, keep_default_na=False, na_values=[''])
+
+
+def read_base(path, columns=None):
+    """The raw table file (TSV or Arrow, from the extension), before coercion to the store's types"""
+    if is_arrow(path):
+        return read_arrow(path, columns=columns)
+    return read_tsv(path, columns=columns)
+
+
+def read_table(path, columns=None):
+    """The table file coerced to the store's types; `columns` only reads (and returns) those columns"""
+    return coerce_frame(read_base(path, columns=columns), columns=columns or COLUMNS)
+
+
+def write_table(df, path):
+    if is_arrow(path):
+        write_arrow(df, path)
+    else:
+        df.to_csv(path, sep='\t', index=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('source')
+    parser.add_argument('destination')
+    args = parser.parse_args()
+    df = read_table(args.source)
+    write_table(df, args.destination)
+    print(f'{len(df)} rows written to {args.destination}')
+
+
+if __name__ == '__main__':
+    main()
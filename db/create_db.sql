@@ -1,20 +1,36 @@
 USE ic_kinetics;
-DROP TABLE IF EXISTS tutors_subjects_junction;
-DROP TABLE IF EXISTS transactions;
-DROP TABLE IF EXISTS blocks;
-DROP TABLE IF EXISTS students ;
-DROP TABLE IF EXISTS tutors;
-DROP TABLE IF EXISTS subjects;
+DROP TABLE IF EXISTS kinetics;
+DROP TABLE IF EXISTS dataset_meta;
 
 #SET NAMES 'utf8';
 #DEFAULT CHARSET=utf8;
 
-CREATE TABLE main_table(
+# Same table as the local SQLite store (db/sqlite_store.py)
+CREATE TABLE kinetics(
 	id INT AUTO_INCREMENT PRIMARY KEY,
-	t1 VARCHAR(64) NOT NULL,
-	t2 VARCHAR(64) NOT NULL,
-	t3 VARCHAR(64) 
+	selectivity VARCHAR(8),
+	isoform VARCHAR(64),
+	mutant VARCHAR(64),
+	new_residue VARCHAR(16),
+	act_v50 DOUBLE,
+	act_z DOUBLE,
+	act_time DOUBLE,
+	inact_v50 DOUBLE,
+	inact_z DOUBLE,
+	inact_time DOUBLE,
+	source TEXT,
+	gating VARCHAR(2)
 );
+CREATE INDEX kinetics_isoform_mutant ON kinetics (isoform, mutant);
+CREATE INDEX kinetics_selectivity ON kinetics (selectivity);
+CREATE INDEX kinetics_mutant ON kinetics (mutant);
+CREATE INDEX kinetics_new_residue ON kinetics (new_residue);
+CREATE INDEX kinetics_gating ON kinetics (gating);
 
-INSERT INTO main_table (t1, t2)
-VALUES ('Mike', 'TheKing');
\ No newline at end of file
+CREATE TABLE dataset_meta(
+	`key` VARCHAR(32) PRIMARY KEY,
+	value INT NOT NULL
+);
+
+INSERT INTO dataset_meta (`key`, value)
+VALUES ('version', 1), ('generation', 1);
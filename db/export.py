@@ -0,0 +1,91 @@
+"""Chunked CSV / NDJSON / Parquet encodings of (filtered) kinetics frames, for the /export routes.
+
+Each generator encodes `chunk_rows` rows at a time, taken from the whole frame or from the row ids of a filter (the
+index postings), so the memory used by a download does not grow with the size of the result."""
+import hashlib
+import io
+
+import numpy as np
+import pyarrow as pa
+from pyarrow import parquet
+
+from db.schema import COLUMNS, NUM_COLS
+
+CHUNK_ROWS = 10000
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+    'parquet': 'application/vnd.apache.parquet',
+}
+PARQUET_SCHEMA = pa.schema([(col, pa.float64() if col in NUM_COLS else pa.string()) for col in COLUMNS])
+
+
+def _chunks(df, rows, chunk_rows):
+    if rows is None:
+        for start in range(0, len(df), chunk_rows):
+            yield df.iloc[start:start + chunk_rows]
+    else:
+        for start in range(0, len(rows), chunk_rows):
+            yield df.take(rows[start:start + chunk_rows])
+
+
+def iter_csv(df, rows=None, chunk_rows=CHUNK_ROWS):
+    yield ','.join(COLUMNS) + '\n'
+    for chunk in _chunks(df, rows, chunk_rows):
+        yield chunk.to_csv(header=False, index=False, columns=COLUMNS)
+
+
+def iter_ndjson(df, rows=None, chunk_rows=CHUNK_ROWS):
+    for chunk in _chunks(df, rows, chunk_rows):
+        lines = chunk[COLUMNS].to_json(orient='records', lines=True)
+        yield lines if lines.endswith('\n') else lines + '\n'
+
+
+class _Sink(io.RawIOBase):
+    """Write-only file that hands over what was written since the last take()"""
+
+    def __init__(self):
+        self.parts = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def take(self):
+        data, self.parts = b''.join(self.parts), []
+        return data
+
+
+def iter_parquet(df, rows=None, chunk_rows=CHUNK_ROWS):
+    """One Parquet file, with a row group per chunk"""
+    sink = _Sink()
+    writer = parquet.ParquetWriter(sink, PARQUET_SCHEMA)
+    for chunk in _chunks(df, rows, chunk_rows):
+        arrays = [pa.array(chunk[col].to_numpy(dtype=np.float64)) if col in NUM_COLS else
+                  pa.array(chunk[col].astype(object), type=pa.string(), from_pandas=True) for col in COLUMNS]
+        writer.write_table(pa.Table.from_arrays(arrays, schema=PARQUET_SCHEMA))
+        yield sink.take()
+    writer.close()
+    yield sink.take()
+
+
+ENCODERS = {'csv': iter_csv, 'ndjson': iter_ndjson, 'parquet': iter_parquet}
+
+
+def export_etag(fmt, version, filters):
+    """Strong ETag of an export: the same format, dataset version and filters always give the same bytes"""
+    key = '|'.join([fmt, str(version)] + [str(value) for value in filters])
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()[:20]
+
+
+def encode(fmt, df, rows=None, chunk_rows=CHUNK_ROWS):
+    """Chunks of the export of df, or of its rows with the ids `rows`"""
+    return ENCODERS[fmt](df, rows, chunk_rows=chunk_rows)
@@ -0,0 +1,160 @@
+import threading
+
+import numpy as np
+import pandas as pd
+
+from db.query import gating_of
+from db.schema import NUM_COLS
+from db.sketches import KLLSketch, merge_moments, update_moments
+from monitoring.metrics import phase
+
+FACET_COLS = ['selectivity', 'isoform', 'mutant']
+QUANTILES = [0.25, 0.5, 0.75]
+
+# Fixed, shared bin edges: counts of different facets (and of successive inserts) add up bin by bin.
+# Values outside the range land in the first/last bin.
+V50_EDGES = np.arange(-220, 152, 2.)
+Z_EDGES = np.arange(0, 20.25, 0.25)
+TIME_EDGES = np.logspace(-2, 4, 61)
+BIN_EDGES = {
+    'act_v50': V50_EDGES,
+    'inact_v50': V50_EDGES,
+    'act_z': Z_EDGES,
+    'inact_z': Z_EDGES,
+    'act_time': TIME_EDGES,
+    'inact_time': TIME_EDGES,
+}
+# per-column Welford moments kept for each facet
+COUNT, MEAN, M2, MIN, MAX = range(5)
+
+
+def bin_index(col, values):
+    edges = BIN_EDGES[col]
+    return np.clip(np.searchsorted(edges, values, side='right') - 1, 0, len(edges) - 2)
+
+
+@phase('aggregate')
+def histogram(col, values):
+    """Bin counts of raw values on the column's fixed edges (same bins as the materialized facets)"""
+    values = np.asarray(values, dtype=np.float64)
+    values = values[~np.isnan(values)]
+    return np.bincount(bin_index(col, values), minlength=len(BIN_EDGES[col]) - 1), BIN_EDGES[col]
+
+
+def _facet_codes(rows):
+    """Batch-local facet code of every row, plus the (selectivity, isoform, mutant) key of each code"""
+    combined = np.zeros(len(rows), dtype=np.int64)
+    for col in FACET_COLS:
+        codes, uniques = pd.factorize(rows[col])
+        combined = combined * (len(uniques) + 1) + codes + 1
+    _, first, inverse = np.unique(combined, return_index=True, return_inverse=True)
+    keys = rows[FACET_COLS].iloc[first].astype(object)
+    keys = keys.where(keys.notna(), None)
+    return inverse, list(keys.itertuples(index=False, name=None))
+
+
+class FacetTable:
+    """Histogram bin counts, Welford moments and a KLL quantile sketch of every numeric column, materialized
+    per (selectivity, isoform, mutant) facet.
+
+    Inserted rows are folded in with add(), at a cost proportional to the inserted rows. A query merges the
+    matching facets (e.g. all Kv isoforms), so histogram and summary cost depends on the number of facets, bins
+    and sketch size, not rows."""
+
+    def __init__(self, df, generation=None):
+        self.generation = generation
+        self.n_rows = 0
+        self.ids = {}
+        self.keys = np.empty((0, len(FACET_COLS)), dtype=object)
+        self.gating = np.empty(0, dtype=object)
+        self.counts = {col: np.zeros((0, len(BIN_EDGES[col]) - 1), dtype=np.int64) for col in NUM_COLS}
+        self.moments = {col: np.zeros((0, 5)) for col in NUM_COLS}
+        self.sketches = {col: [] for col in NUM_COLS}
+        self._lock = threading.Lock()
+        self.add(df)
+
+    def _grow(self, new_keys):
+        n_new = len(new_keys)
+        self.keys = np.concatenate([self.keys, np.array(new_keys, dtype=object).reshape(n_new, -1)])
+        self.gating = np.concatenate([self.gating, [gating_of(key[1]) if key[1] is not None else None
+                                                    for key in new_keys]])
+        for col in NUM_COLS:
+            self.counts[col] = np.concatenate([self.counts[col],
+                                               np.zeros((n_new, self.counts[col].shape[1]), dtype=np.int64)])
+            empty = np.zeros((n_new, 5))
+            empty[:, MIN], empty[:, MAX] = np.inf, -np.inf
+            self.moments[col] = np.concatenate([self.moments[col], empty])
+            self.sketches[col].extend(KLLSketch() for _ in range(n_new))
+
+    def add(self, rows):
+        if len(rows) == 0:
+            return
+        local, keys = _facet_codes(rows)
+        with self._lock:
+            new_keys = [key for key in keys if key not in self.ids]
+            for key in new_keys:
+                self.ids[key] = len(self.ids)
+            if new_keys:
+                self._grow(new_keys)
+            facet = np.array([self.ids[key] for key in keys], dtype=np.int64)[local]
+            n_facets = len(self.ids)
+
+            for col in NUM_COLS:
+                values = rows[col].to_numpy(dtype=np.float64)
+                valid = ~np.isnan(values)
+                ids, values = facet[valid], values[valid]
+                n_bins = self.counts[col].shape[1]
+                self.counts[col] += np.bincount(ids * n_bins + bin_index(col, values),
+                                                minlength=n_facets * n_bins).reshape(n_facets, n_bins)
+                moments = self.moments[col]
+                update_moments(moments[:, COUNT], moments[:, MEAN], moments[:, M2], ids, values)
+                np.minimum.at(moments[:, MIN], ids, values)
+                np.maximum.at(moments[:, MAX], ids, values)
+
+                order = np.argsort(ids, kind='stable')
+                groups, starts = np.unique(ids[order], return_index=True)
+                for facet_id, group_values in zip(groups, np.split(values[order], starts[1:])):
+                    self.sketches[col][facet_id].update(group_values)
+            self.n_rows += len(rows)
+
+    def match(self, selectivity=None, isoform=None, mutant=None, gating=None):
+        """Ids of the facets matching the filters (selectivity as stored, e.g. 'K+'); `mutant` is a name or a list
+        of names, e.g. the matches of a mutant search"""
+        mask = np.ones(len(self.keys), dtype=bool)
+        for i, value in enumerate((selectivity, isoform)):
+            if value:
+                mask &= self.keys[:, i] == value
+        if isinstance(mutant, str):
+            mutant = [mutant] if mutant else None
+        if mutant is not None:
+            mask &= np.isin(self.keys[:, 2], list(mutant))
+        if gating:
+            mask &= self.gating == gating
+        return np.flatnonzero(mask)
+
+    @phase('aggregate')
+    def histogram(self, col, ids):
+        with self._lock:
+            return self.counts[col][ids].sum(axis=0), BIN_EDGES[col]
+
+    def sketch(self, col, ids):
+        """The merged quantile sketch of the given facets"""
+        with self._lock:
+            sketches = [self.sketches[col][facet_id] for facet_id in ids]
+            return KLLSketch().merge(*[sketch for sketch in sketches if sketch.n])
+
+    @phase('aggregate')
+    def describe(self, cols, ids):
+        """DataFrame.describe() layout from merged facet summaries: exact count/mean/std/min/max, quartiles
+        exact while the merged sketch holds every value and within the sketch's rank error beyond"""
+        stats = {}
+        for col in cols:
+            with self._lock:
+                moments = self.moments[col][ids]
+            n, mean, m2 = merge_moments(moments[:, COUNT], moments[:, MEAN], moments[:, M2])
+            std = np.sqrt(m2 / (n - 1)) if n > 1 else np.nan
+            lo, hi = (moments[:, MIN].min(), moments[:, MAX].max()) if n else (np.nan, np.nan)
+            stats[col] = [n, mean, std, lo] + self.sketch(col, ids).quantiles(QUANTILES) + [hi]
+        index = ['count', 'mean', 'std', 'min'] + [f'{q:.0%}' for q in QUANTILES] + ['max']
+        return pd.DataFrame(stats, index=index, columns=cols)
+
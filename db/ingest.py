@@ -0,0 +1,149 @@
+"""Bulk ingest of kinetics measurements from CSV/TSV/Excel (.xlsx) files.
+
+    python -m db.ingest measurements.xlsx [more.tsv ...] [--rejects rejects.csv] [--chunksize 50000]
+
+Rows are streamed in chunks (for Excel, from the first sheet read row by row), checked against the Insert form
+constraints (V50 >= -220 mV, time >= 0, z >= 0, selectivity and source required), and each chunk of valid rows is
+written in one batch through the store."""
+import argparse
+import base64
+import io
+import os
+
+import numpy as np
+import pandas as pd
+
+from db.schema import COLUMNS, NUM_COLS, TEXT_COLS, signed_selectivity
+
+CHUNKSIZE = 50000
+MIN_V50 = -220
+V50_COLS = ['act_v50', 'inact_v50']
+TIME_COLS = ['act_time', 'inact_time']
+Z_COLS = ['act_z', 'inact_z']
+
+
+def _sniff_sep(head):
+    first_line = head.split(b'\n', 1)[0]
+    return '\t' if first_line.count(b'\t') >= first_line.count(b',') else ','
+
+
+def _text(value):
+    return None if value is None else str(value)
+
+
+def read_excel_chunks(source, chunksize=CHUNKSIZE):
+    """Chunks of the first sheet of an .xlsx workbook, read in openpyxl's read-only (streaming) mode; the first row
+    is the header and empty rows are skipped, as for CSV"""
+    import openpyxl
+
+    workbook = openpyxl.load_workbook(source, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = [_text(col) for col in next(rows, ())]
+        batch = []
+        for row in rows:
+            if any(value is not None for value in row):
+                batch.append([_text(value) for value in row[:len(header)]])
+            if len(batch) == chunksize:
+                yield pd.DataFrame(batch, columns=header)
+                batch = []
+        if batch:
+            yield pd.DataFrame(batch, columns=header)
+    finally:
+        workbook.close()
+
+
+def read_chunks(source, filename=None, chunksize=CHUNKSIZE):
+    """Yields DataFrame chunks (all columns as text) from a path or a binary buffer; format from the extension"""
+    filename = filename or (source if isinstance(source, str) else '')
+    if filename.lower().endswith('.xls'):
+        raise ValueError('.xls workbooks are not supported, save the sheet as .xlsx or CSV')
+    if filename.lower().endswith('.xlsx'):
+        yield from read_excel_chunks(source, chunksize)
+        return
+
+    buffer = open(source, 'rb') if isinstance(source, str) else source
+    try:
+        sep = _sniff_sep(buffer.read(4096))
+        buffer.seek(0)
+        yield from pd.read_csv(buffer, sep=sep, dtype=str, chunksize=chunksize, skipinitialspace=True)
+    finally:
+        if isinstance(source, str):
+            buffer.close()
+
+
+def validate_chunk(chunk, first_line=2):
+    """Splits a raw chunk into (valid rows in store layout, rejects with their file line and reason)"""
+    chunk = chunk.rename(columns=lambda col: str(col).strip().lower())
+    df = chunk.reindex(columns=COLUMNS)
+    reasons = pd.Series('', index=df.index)
+    for col in TEXT_COLS:
+        df[col] = df[col].astype(object)
+
+    def reject(mask, reason):
+        reasons[mask] += reason + '; '
+
+    for col in NUM_COLS:
+        raw = df[col].str.strip() if df[col].dtype == object else df[col]
+        values = pd.to_numeric(raw, errors='coerce')
+        reject((values.isna() & raw.notna() & (raw != '')).to_numpy(), f'{col} is not a number')
+        df[col] = values
+    for col in V50_COLS:
+        reject((df[col] < MIN_V50).to_numpy(), f'{col} < {MIN_V50} mV')
+    for col in TIME_COLS + Z_COLS:
+        reject((df[col] < 0).to_numpy(), f'{col} < 0')
+
+    selectivity = df['selectivity'].str.strip()
+    reject(selectivity.isna().to_numpy() | (selectivity == '').to_numpy(), 'missing selectivity')
+    df['selectivity'] = selectivity.map(signed_selectivity, na_action='ignore')
+    source = df['source'].str.strip()
+    reject(source.isna().to_numpy() | (source == '').to_numpy(), 'missing source')
+
+    bad = (reasons != '').to_numpy()
+    rejects = chunk[bad].copy()
+    rejects.insert(0, 'line', np.flatnonzero(bad) + first_line)
+    rejects['reason'] = reasons[bad].str.rstrip('; ').to_numpy()
+    return df[~bad], rejects
+
+
+def ingest(source, store, filename=None, chunksize=CHUNKSIZE):
+    """Validates and inserts every row of `source`; returns (number of rows inserted, rejects DataFrame)"""
+    inserted, rejects, first_line = 0, [], 2
+    for chunk in read_chunks(source, filename=filename, chunksize=chunksize):
+        valid, bad = validate_chunk(chunk, first_line)
+        if len(valid):
+            store.append(valid, note=filename or source)
+            inserted += len(valid)
+        rejects.append(bad)
+        first_line += len(chunk)
+    rejects = pd.concat(rejects, ignore_index=True) if rejects else pd.DataFrame(columns=['line', 'reason'])
+    return inserted, rejects
+
+
+def ingest_upload(contents, filename, store):
+    """Same as ingest() for the base64 `contents` of a dcc.Upload"""
+    data = base64.b64decode(contents.split(',', 1)[1])
+    return ingest(io.BytesIO(data), store, filename=filename)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('paths', nargs='+')
+    parser.add_argument('--rejects', help='write rejected rows (with line and reason) to this CSV file')
+    parser.add_argument('--chunksize', type=int, default=CHUNKSIZE)
+    args = parser.parse_args()
+
+    from db.store import STORE
+
+    all_rejects = []
+    for path in args.paths:
+        inserted, rejects = ingest(path, STORE, chunksize=args.chunksize)
+        print(f'{path}: {inserted} rows inserted, {len(rejects)} rejected')
+        rejects.insert(0, 'file', os.path.basename(path))
+        all_rejects.append(rejects)
+    if args.rejects:
+        pd.concat(all_rejects, ignore_index=True).to_csv(args.rejects, index=False)
+
+
+if __name__ == '__main__':
+    main()
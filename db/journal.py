@@ -0,0 +1,75 @@
+import io
+import os
+from contextlib import contextmanager
+
+import pandas as pd
+
+from db.columnar import is_arrow, read_tsv, write_arrow
+from db.schema import COLUMNS, TEXT_COLS
+
+try:
+    import fcntl
+except ImportError:  # Windows dev boxes: single process, no locking needed
+    fcntl = None
+
+
+@contextmanager
+def file_lock(path, shared=False):
+    """Advisory lock on `path + '.lock'`, held across processes (gunicorn workers)"""
+    with open(path + '.lock', 'a') as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def to_tsv_lines(df):
+    """Rows as header-less TSV, one physical line per record (tabs/newlines in text fields become spaces)"""
+    df = df.reindex(columns=COLUMNS).copy()
+    for col in TEXT_COLS:
+        text = df[col].astype(str).str.replace(r'[\t\r\n]', ' ', regex=True)
+        df[col] = df[col].astype(object).where(df[col].isna(), text)
+    return df.to_csv(sep='\t', header=False, index=False)
+
+
+def append_rows(journal_path, df):
+    """Appends records to the journal with a single O_APPEND write: O(rows written), whatever the table size.
+    Returns the byte range the records were written to."""
+    data = to_tsv_lines(df).encode('utf-8')
+    fd = os.open(journal_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(fd, data)
+        os.fsync(fd)
+        stop = os.lseek(fd, 0, os.SEEK_END)
+    finally:
+        os.close(fd)
+    return stop - len(data), stop
+
+
+def read_journal(journal_path, offset=0, stop=None):
+    """Records appended after byte `offset` (and before `stop`), and the offset just past the last complete line"""
+    try:
+        with open(journal_path, 'rb') as journal:
+            journal.seek(offset)
+            data = journal.read() if stop is None else journal.read(stop - offset)
+    except FileNotFoundError:
+        return pd.DataFrame(columns=COLUMNS), offset
+    end = data.rfind(b'\n') + 1
+    if end == 0:
+        return pd.DataFrame(columns=COLUMNS), offset
+    df = read_tsv(io.BytesIO(data[:end]), header=False)
+    return df, offset + end
+
+
+def replace_file(path, df):
+    """Writes a full table (TSV or Arrow, as `path`) next to it then renames it over, so readers never see a
+    partial file"""
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    if is_arrow(path):
+        write_arrow(df, tmp_path)
+    else:
+        df.to_csv(tmp_path, sep='\t', index=False)
+    os.replace(tmp_path, path)
@@ -0,0 +1,36 @@
+"""Imports the TSV kinetics tables (db/*.csv) into a SQLite store.
+
+    python -m db.migrate db/kinetics.sqlite db/test.csv [db/other.csv ...] [--replace]
+
+Then start the app with KINETICS_DB=db/kinetics.sqlite to serve from it."""
+import argparse
+
+import pandas as pd
+
+from db.columnar import read_table
+from db.store import BACKUP_FILE
+from db.sqlite_store import SqliteStore
+
+
+def migrate(sqlite_path, tsv_paths, replace=False):
+    store = SqliteStore(sqlite_path, BACKUP_FILE)
+    df = pd.concat([read_table(path) for path in tsv_paths], ignore_index=True)
+    if replace:
+        store.write(df)
+    else:
+        store.append(df)
+    return len(df)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('sqlite_path')
+    parser.add_argument('tsv_paths', nargs='+')
+    parser.add_argument('--replace', action='store_true', help='drop the rows already in the database first')
+    args = parser.parse_args()
+    n_rows = migrate(args.sqlite_path, args.tsv_paths, replace=args.replace)
+    print(f'Imported {n_rows} rows into {args.sqlite_path}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,189 @@
+"""Search over the mutant names of the kinetics table, as typed in the WT/Mutant field.
+
+Names are parsed into (original residue, position, new residue) mutations, with residues in one- or three-letter
+code ('W434F', 'Trp434Phe', 'p.W434F'; several mutations separated by '/', ',', ';' or '+'). A query is one of
+    WT                  wild type
+    W434F, Trp434Phe    names holding every given mutation ('W434', '434F' and '434' leave a residue open)
+    400-450             names with a mutation in the position range (also '400..450', 'positions 400 to 450')
+Filters only take these matches: a query matching none of them selects no rows. Suggestions, listed while the
+field is being typed, fall back to names starting with the query, then to trigram similarity of the names
+(typos), when it matches nothing.
+
+The index is built over the distinct names rather than the rows: matching names are mapped to rows through
+the mutant postings of the KineticsIndex."""
+import re
+from functools import lru_cache
+
+import numpy as np
+
+from db.schema import RESIDUES
+
+WILD_TYPE = 'WT'
+# 'Ala (A)' -> three-letter 'Ala', one-letter 'A'
+ONE_LETTER = {res[-2]: res for res in RESIDUES}
+THREE_LETTER = {res[:3].lower(): res[-2] for res in RESIDUES}
+SEPARATORS = re.compile(r'[\s/,;+]+')
+MUTATION = re.compile(r'^(?:p\.)?([a-z]{3}|[a-z])?(\d+)([a-z]{3}|[a-z])?$', re.IGNORECASE)
+POSITION_RANGE = re.compile(r'^(?:pos(?:ition)?s?\s*)?(\d+)\s*(?:-|–|—|\.\.|to)\s*(\d+)$', re.IGNORECASE)
+# minimum trigram similarity (shared / distinct trigrams of both strings) of a fuzzy match
+FUZZY_THRESHOLD = 0.3
+
+
+def residue_code(code):
+    """One-letter code of a one- or three-letter residue code, None if it is not in RESIDUES"""
+    if len(code) == 1:
+        return code.upper() if code.upper() in ONE_LETTER else None
+    return THREE_LETTER.get(code.lower())
+
+
+def parse_mutation(token):
+    """(original, position, new) of 'W434F' / 'Trp434Phe', residues None when left out, or None"""
+    match = MUTATION.match(token)
+    if match is None:
+        return None
+    original, position, new = match.groups()
+    mutation = (residue_code(original) if original else None, int(position), residue_code(new) if new else None)
+    if (original and mutation[0] is None) or (new and mutation[2] is None):
+        return None
+    return mutation
+
+
+# names are parsed again by each new index and comparison: remember the distinct names seen
+@lru_cache(maxsize=2 ** 16)
+def parse_mutant(text):
+    """Tuple of the mutations of a mutant name, () for wild type, None if it cannot be parsed"""
+    text = str(text).strip().strip('[]')
+    if text.upper() == WILD_TYPE:
+        return ()
+    tokens = [token for token in SEPARATORS.split(text) if token]
+    mutations = tuple(parse_mutation(token) for token in tokens)
+    if not mutations or None in mutations:
+        return None
+    return mutations
+
+
+def canonical(mutations):
+    """'W434F/L435A' form of parsed mutations"""
+    if not mutations:
+        return WILD_TYPE
+    return '/'.join(f'{original or ""}{position}{new or ""}' for original, position, new in mutations)
+
+
+def trigrams(text):
+    """Trigrams of a normalized string, padded as in pg_trgm so that prefixes weigh more"""
+    padded = f'  {text.lower()} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class MutantIndex:
+    """Positions, residues and trigrams of a list of mutant names; searches return positions in that list"""
+
+    def __init__(self, names):
+        self.names = list(names)
+        self.keys = {}
+        grams = {}
+        n_grams = []
+        slots = []
+        for i, name in enumerate(self.names):
+            mutations = parse_mutant(name)
+            key = canonical(mutations) if mutations is not None else str(name).strip().upper()
+            self.keys.setdefault(key, []).append(i)
+            slots.extend((position, i, original, new) for original, position, new in mutations or ())
+            name_grams = trigrams(key)
+            n_grams.append(len(name_grams))
+            for gram in name_grams:
+                grams.setdefault(gram, []).append(i)
+
+        # one slot per mutation, sorted by position, for position and range lookups
+        slots.sort(key=lambda slot: slot[:2])
+        self.positions = np.array([slot[0] for slot in slots], dtype=np.int64)
+        self.slot_ids = np.array([slot[1] for slot in slots], dtype=np.int64)
+        self.originals = np.array([slot[2] or '' for slot in slots], dtype=object)
+        self.news = np.array([slot[3] or '' for slot in slots], dtype=object)
+        self.trigrams = {gram: np.array(ids, dtype=np.int64) for gram, ids in grams.items()}
+        # sorted keys, for prefix matches of unfinished input
+        self.sorted_keys = np.array(sorted(self.keys), dtype=object)
+        self.n_grams = np.array(n_grams, dtype=np.int64)
+
+    def _slots(self, lo, hi):
+        return np.searchsorted(self.positions, lo, side='left'), np.searchsorted(self.positions, hi, side='right')
+
+    def _in_range(self, lo, hi):
+        start, stop = self._slots(lo, hi)
+        ids = self.slot_ids[start:stop]
+        # unique names, in position order
+        _, first = np.unique(ids, return_index=True)
+        return ids[np.sort(first)]
+
+    def _with_mutations(self, mutations):
+        matches = None
+        for original, position, new in mutations:
+            start, stop = self._slots(position, position)
+            mask = np.ones(stop - start, dtype=bool)
+            if original:
+                mask &= self.originals[start:stop] == original
+            if new:
+                mask &= self.news[start:stop] == new
+            ids = np.unique(self.slot_ids[start:stop][mask])
+            matches = ids if matches is None else np.intersect1d(matches, ids, assume_unique=True)
+        return matches
+
+    def _prefixed(self, key):
+        start = np.searchsorted(self.sorted_keys, key, side='left')
+        stop = np.searchsorted(self.sorted_keys, key + '\uffff', side='right')
+        lists = [self.keys[match] for match in self.sorted_keys[start:stop]]
+        return np.concatenate(lists).astype(np.int64) if lists else np.array([], dtype=np.int64)
+
+    def _fuzzy(self, key):
+        query_grams = trigrams(key)
+        lists = [self.trigrams[gram] for gram in query_grams if gram in self.trigrams]
+        if not lists:
+            return np.array([], dtype=np.int64)
+        shared = np.bincount(np.concatenate(lists), minlength=len(self.names))
+        ids = np.flatnonzero(shared)
+        score = shared[ids] / (len(query_grams) + self.n_grams[ids] - shared[ids])
+        keep = score >= FUZZY_THRESHOLD
+        ids, score = ids[keep], score[keep]
+        return ids[np.argsort(-score, kind='stable')]
+
+    def search(self, query, limit=None):
+        """Positions of the names matching a query, best first: exact (canonical) matches, then structured
+        matches. Filters go through this, never through the looser suggest()."""
+        query = str(query).strip()
+        position_range = POSITION_RANGE.match(query)
+        if position_range:
+            lo, hi = sorted(int(bound) for bound in position_range.groups())
+            return self._in_range(lo, hi)[:limit]
+
+        mutations = parse_mutant(query)
+        key = canonical(mutations) if mutations is not None else query.upper()
+        exact = np.array(self.keys.get(key, []), dtype=np.int64)
+        ids = exact
+        if mutations:
+            structured = self._with_mutations(mutations)
+            ids = np.concatenate([exact, structured[~np.isin(structured, exact)]])
+        return ids[:limit]
+
+    def suggest(self, query, limit=None):
+        """Positions of the names to suggest for an unfinished query: the search() matches, or when there are none,
+        names starting with the query then similar names"""
+        ids = self.search(query, limit=limit)
+        if len(ids) == 0:
+            key = str(query).strip()
+            mutations = parse_mutant(key)
+            key = canonical(mutations) if mutations is not None else key.upper()
+            prefixed, similar = self._prefixed(key), self._fuzzy(key)
+            ids = np.concatenate([prefixed, similar[~np.isin(similar, prefixed)]])
+        return ids[:limit]
+
+    def search_names(self, query, limit=None):
+        return [self.names[i] for i in self.search(query, limit=limit)]
+
+    def suggest_names(self, query, limit=None):
+        return [self.names[i] for i in self.suggest(query, limit=limit)]
+
+
+@lru_cache(maxsize=4)
+def mutant_index(names):
+    """MutantIndex of a tuple of names, shared by the indexes of successive versions with the same names"""
+    return MutantIndex(names)
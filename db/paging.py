@@ -0,0 +1,101 @@
+import math
+
+import pandas as pd
+
+from monitoring.metrics import phase
+
+FILTER_OPERATORS = [['ge ', '>='], ['le ', '<='], ['lt ', '<'], ['gt ', '>'], ['ne ', '!='], ['eq ', '='],
+                    ['contains '], ['datestartswith ']]
+
+
+def split_filter_part(filter_part):
+    """Parses one clause of a DataTable filter_query, e.g. '{act_v50} >= -50', into (column, operator, value)"""
+    for operator_type in FILTER_OPERATORS:
+        for operator in operator_type:
+            if operator in filter_part:
+                name_part, value_part = filter_part.split(operator, 1)
+                name = name_part[name_part.find('{') + 1: name_part.rfind('}')]
+
+                value_part = value_part.strip()
+                v0 = value_part[0] if value_part else ''
+                if v0 == value_part[-1:] and v0 in ("'", '"', '`'):
+                    value = value_part[1: -1].replace('\\' + v0, v0)
+                else:
+                    try:
+                        value = float(value_part)
+                    except ValueError:
+                        value = value_part
+
+                # word operators need spaces after them in the filter string,
+                # but we don't want these later
+                return name, operator_type[0].strip(), value
+
+    return [None] * 3
+
+
+def text_operand(value):
+    """An operand as written, e.g. '434' rather than '434.0' for a number"""
+    return f'{value:g}' if isinstance(value, float) else str(value)
+
+
+def comparison_operand(col, value):
+    """The value of a comparison clause as the column's type, None when it is not one (e.g. 'abc' for a number)"""
+    if not pd.api.types.is_numeric_dtype(col):
+        return text_operand(value)
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+@phase('filter')
+def apply_filter_query(df, filter_query):
+    """Rows matching every clause of a DataTable filter_query; clauses on unknown columns or with an operand the
+    column cannot be compared with are ignored"""
+    for filter_part in (filter_query or '').split(' && '):
+        col_name, operator, filter_value = split_filter_part(filter_part)
+        if col_name not in df.columns:
+            continue
+        col = df[col_name]
+        if operator in ('eq', 'ne', 'lt', 'le', 'gt', 'ge'):
+            filter_value = comparison_operand(col, filter_value)
+            if filter_value is None:
+                continue
+            if isinstance(col.dtype, pd.CategoricalDtype):
+                col = col.astype(object)
+            df = df.loc[getattr(col, operator)(filter_value).to_numpy()]
+        elif operator in ('contains', 'datestartswith'):
+            text, filter_value = col.astype(str), text_operand(filter_value)
+            mask = text.str.contains(filter_value, regex=False) if operator == 'contains' \
+                else text.str.startswith(filter_value)
+            df = df.loc[mask.to_numpy()]
+    return df
+
+
+def sort_key(col):
+    """Text columns sort by value rather than by category code"""
+    return col.astype(object) if isinstance(col.dtype, pd.CategoricalDtype) else col
+
+
+@phase('filter')
+def apply_sort(df, sort_by):
+    if not sort_by:
+        return df
+    return df.sort_values(
+        [col['column_id'] for col in sort_by],
+        ascending=[col['direction'] == 'asc' for col in sort_by],
+        kind='mergesort',
+        na_position='last',
+        key=sort_key,
+    )
+
+
+def page_count(n_rows, page_size):
+    return max(1, math.ceil(n_rows / page_size))
+
+
+def get_page(df, page_current, page_size):
+    """Rows of one page as DataTable records, clamping page_current to the last page"""
+    page_current = min(page_current or 0, page_count(len(df), page_size) - 1)
+    start = page_current * page_size
+    return df.iloc[start:start + page_size].to_dict('records')
@@ -0,0 +1,120 @@
+import numpy as np
+
+from db.mutants import mutant_index
+from db.schema import FILTER_COLS, signed_selectivity
+from db.catalog import CATALOG
+from monitoring.metrics import phase
+
+
+def gating_of(isoform):
+    """'lg' or 'vg', as the channel catalog (cfg/channels.json) lists the isoform's family"""
+    return CATALOG.gating(isoform)
+
+
+def _postings(codes, n_values):
+    """Sorted row ids of each categorical code, from a single stable sort of the code column"""
+    order = np.argsort(codes, kind='stable')
+    counts = np.bincount(codes + 1, minlength=n_values + 1)
+    bounds = np.cumsum(counts)
+    # codes of -1 (missing values) sort first, skip them
+    return [order[bounds[i]:bounds[i + 1]] for i in range(n_values)]
+
+
+def _intersect(small, large):
+    if len(small) == 0 or len(large) == 0:
+        return small[:0]
+    pos = np.searchsorted(large, small)
+    pos[pos == len(large)] = 0
+    return small[large[pos] == small]
+
+
+class KineticsIndex:
+    """Inverted indexes (value -> sorted row ids) over the categorical filter columns of a kinetics frame.
+
+    A query intersects the row-id sets of its filters, smallest first, so its cost follows the number of
+    matching rows rather than the table size. An index is not modified once built: extend() returns the index of
+    the frame with rows appended, at a cost proportional to those rows and to the postings they add to."""
+
+    def __init__(self, df, generation=None):
+        self.generation = generation
+        self.n_rows = 0
+        self.postings = {col: {} for col in FILTER_COLS}
+        self.postings['gating'] = {gating: np.array([], dtype=np.int64) for gating in ('vg', 'lg')}
+        self._mutants = None
+        self._add(df)
+
+    def _add(self, rows):
+        start = self.n_rows
+        for col in FILTER_COLS:
+            values = rows[col].astype('category').cat.remove_unused_categories().cat
+            lists = _postings(values.codes.to_numpy().astype(np.int64), len(values.categories))
+            postings = self.postings[col]
+            for value, ids in zip(values.categories, lists):
+                ids = ids + start
+                postings[value] = np.concatenate([postings[value], ids]) if value in postings else ids
+            if col == 'isoform':
+                # the rows' ids by gating, all above the ids already indexed
+                by_gating = {'vg': [], 'lg': []}
+                for isoform, ids in zip(values.categories, lists):
+                    by_gating[gating_of(isoform)].append(ids + start)
+                for gating, lists_of_gating in by_gating.items():
+                    if lists_of_gating:
+                        self.postings['gating'][gating] = np.concatenate(
+                            [self.postings['gating'][gating], np.sort(np.concatenate(lists_of_gating))])
+        self.n_rows += len(rows)
+
+    def extend(self, rows):
+        """The index of the frame followed by `rows`; this one is left as it is"""
+        index = KineticsIndex.__new__(KineticsIndex)
+        index.generation, index.n_rows = self.generation, self.n_rows
+        index.postings = {col: dict(postings) for col, postings in self.postings.items()}
+        index._add(rows)
+        # the mutant search only needs rebuilding for new names
+        index._mutants = self._mutants if len(index.postings['mutant']) == len(self.postings['mutant']) else None
+        return index
+
+    @property
+    def mutants(self):
+        """MutantIndex of the mutant names, resolving the free-text mutant filter"""
+        if self._mutants is None:
+            self._mutants = mutant_index(tuple(self.postings['mutant']))
+        return self._mutants
+
+    def mutant_names(self, query):
+        return self.mutants.search_names(query)
+
+    def rows(self, col, value):
+        if col == 'mutant':
+            lists = [self.postings['mutant'][name] for name in self.mutant_names(value)]
+            return np.sort(np.concatenate(lists)) if lists else np.array([], dtype=np.int64)
+        return self.postings[col].get(value, np.array([], dtype=np.int64))
+
+    def lookup(self, **filters):
+        """Row ids matching every non-empty filter (col=value), or None when no filter applies"""
+        sets = [self.rows(col, value) for col, value in filters.items() if value]
+        if not sets:
+            return None
+        sets.sort(key=len)
+        rows = sets[0]
+        for other in sets[1:]:
+            rows = _intersect(rows, other)
+        return rows
+
+
+def filter_rows(index, isoform=None, mutant=None, selectivity=None, new_res=None, gating=None):
+    """Ids of the rows matching the filters (selectivity as in the forms, e.g. 'K'), None when no filter applies"""
+    return index.lookup(
+        isoform=isoform,
+        mutant=mutant,
+        selectivity=signed_selectivity(selectivity) if selectivity else None,
+        new_residue=new_res,
+        gating=gating,
+    )
+
+
+@phase('filter')
+def filter_frame(df, index, **filters):
+    rows = filter_rows(index, **filters)
+    if rows is None:
+        return df
+    return df.take(rows)
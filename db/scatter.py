@@ -0,0 +1,80 @@
+"""Server-side reduction of scatter views of two numeric columns, so that the payload of a figure is bounded
+whatever the number of rows: up to a point budget the points are sent as they are; above it either a stratified
+sample or the counts of 2-D bins (on the columns' fixed histogram edges, see db.facets) is sent instead."""
+import numpy as np
+
+from db.facets import BIN_EDGES, bin_index
+from monitoring.metrics import phase
+
+POINT_BUDGET = 10000
+# cells per axis of the grid the sample is stratified on
+SAMPLE_GRID = 64
+LOG_COLS = ['act_time', 'inact_time']
+
+
+def plotted(x, y, log_x=False, log_y=False):
+    """Positions of the rows where both values can be plotted (present, and positive on log axes)"""
+    keep = ~np.isnan(x) & ~np.isnan(y)
+    if log_x:
+        keep &= x > 0
+    if log_y:
+        keep &= y > 0
+    return np.flatnonzero(keep)
+
+
+def _cells(values, log, grid):
+    """Cell of each value on a grid of equal cells between the minimum and the maximum"""
+    if log:
+        values = np.log10(values)
+    lo, hi = values.min(), values.max()
+    if hi == lo:
+        return np.zeros(len(values), dtype=np.int64)
+    return np.minimum(((values - lo) / (hi - lo) * grid).astype(np.int64), grid - 1)
+
+
+def _cap(counts, budget):
+    """Largest number of points per cell such that the capped cells hold at most budget points"""
+    counts = np.sort(counts)
+    # points kept with a cap of counts[i]: every smaller cell whole, counts[i] for the rest
+    kept = np.cumsum(counts) + counts * (len(counts) - 1 - np.arange(len(counts)))
+    fits = np.searchsorted(kept, budget, side='right')
+    if fits == len(counts):
+        return counts[-1]
+    below = kept[fits - 1] if fits else 0
+    floor = counts[fits - 1] if fits else 0
+    # raise the cap past counts[fits - 1] while the remaining cells still fit
+    return floor + (budget - below) // (len(counts) - fits)
+
+
+@phase('aggregate')
+def stratified_sample(x, y, budget=POINT_BUDGET, log_x=False, log_y=False, grid=SAMPLE_GRID, seed=0):
+    """Positions of at most budget points, sorted. The cells of a grid over the data share the budget: sparse
+    cells (outliers, rare combinations) are kept whole and the densest ones thinned to the same number of
+    points, drawn at random."""
+    if len(x) <= budget:
+        return np.arange(len(x))
+    # at least one point per cell fits in the budget
+    grid = min(grid, int(np.sqrt(budget)))
+    cells = _cells(x, log_x, grid) * grid + _cells(y, log_y, grid)
+    counts = np.bincount(cells, minlength=grid * grid)
+    cap = _cap(counts[counts > 0], budget)
+    # random order within each cell: a stable sort of shuffled positions (radix sort on small cell codes)
+    shuffled = np.random.default_rng(seed).permutation(len(x))
+    order = shuffled[np.argsort(cells[shuffled].astype(np.int16 if grid * grid < 2 ** 15 else np.int64),
+                                kind='stable')]
+    starts = np.cumsum(counts) - counts
+    return np.sort(order[np.arange(len(order)) - starts[cells[order]] < cap])
+
+
+@phase('aggregate')
+def density(x_col, y_col, x, y):
+    """(counts (y bins x x bins), x edges, y edges) of the points on the columns' fixed bin edges, trimmed to
+    the bins between the first and last occupied ones"""
+    x_edges, y_edges = BIN_EDGES[x_col], BIN_EDGES[y_col]
+    n_x, n_y = len(x_edges) - 1, len(y_edges) - 1
+    counts = np.bincount(bin_index(y_col, y) * n_x + bin_index(x_col, x), minlength=n_x * n_y).reshape(n_y, n_x)
+    if not counts.any():
+        return counts[:0, :0], x_edges[:1], y_edges[:1]
+    rows, cols = np.flatnonzero(counts.any(axis=1)), np.flatnonzero(counts.any(axis=0))
+    counts = counts[rows[0]:rows[-1] + 1, cols[0]:cols[-1] + 1]
+    return counts, x_edges[cols[0]:cols[-1] + 2], y_edges[rows[0]:rows[-1] + 2]
@@ -0,0 +1,53 @@
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+COLUMNS = ['selectivity', 'isoform', 'mutant', 'new_residue', 'act_v50', 'act_z', 'act_time', 'inact_v50',
+           'inact_z', 'inact_time', 'source']
+FILTER_COLS = ['selectivity', 'isoform', 'mutant', 'new_residue']
+TEXT_COLS = FILTER_COLS + ['source']
+NUM_COLS = [col for col in COLUMNS if col not in TEXT_COLS]
+# amino acids offered as new residues, 'Three-letter (one-letter)' code
+RESIDUES = ['Ala (A)', 'Arg (R)', 'Asn (N)', 'Asp (D)', 'Cys (C)', 'Glu (E)',
+            'Gln (Q)', 'Gly (G)', 'His (H)', 'Hyp (O)', 'Ile (I)', 'Leu (L)', 'Lys (K)', 'Met (M)', 'Phe (F)',
+            'Pro (P)', 'Glp (U)', 'Ser (S)', 'Thr (T)', 'Trp (W)', 'Tyr (Y)', 'Val (V)']
+
+
+def coerce_frame(df, columns=COLUMNS):
+    """Casts a kinetics table (or some of its columns) to the store's column types: categorical filter columns,
+    float measurements"""
+    df = df.reindex(columns=columns)
+    for col in df.columns.intersection(FILTER_COLS):
+        df[col] = df[col].astype('category')
+    if 'source' in df:
+        df['source'] = df['source'].astype(object)
+    # reindex() made a copy: convert in place from here
+    for col in df.columns.intersection(NUM_COLS):
+        if df[col].dtype != 'float64':
+            df[col] = pd.to_numeric(df[col], errors='coerce').astype('float64')
+    df.index = pd.RangeIndex(len(df))
+    return df
+
+
+def append_frame(df, rows):
+    """df followed by rows, both coerced: the categorical columns of df gain the new values of rows, their
+    categories kept sorted as coerce_frame() makes them (sorting a categorical column sorts by category order), and
+    the rows already there are recoded rather than converted again"""
+    columns = {}
+    for col in df.columns:
+        if isinstance(df[col].dtype, pd.CategoricalDtype):
+            old, new = df[col].array, rows[col].array
+            # e.g. an all-missing column, whose (no) categories are floats
+            if old.categories.dtype != new.categories.dtype:
+                old = old.rename_categories(old.categories.astype(object))
+                new = new.rename_categories(new.categories.astype(object))
+            columns[col] = union_categoricals([old, new], sort_categories=True)
+        else:
+            columns[col] = np.concatenate([df[col].to_numpy(), rows[col].to_numpy()])
+    return pd.DataFrame(columns, columns=df.columns)
+
+
+def signed_selectivity(selectivity):
+    """Stored selectivity label: 'K' -> 'K+', 'Cl' -> 'Cl-' (an existing sign is replaced)"""
+    ion = selectivity.rstrip('+-')
+    return ion + ('-' if 'cl' in ion.lower() else '+')
@@ -0,0 +1,112 @@
+import math
+
+import numpy as np
+
+# normalized rank error targeted by the quantile sketches (0.01: quartiles within 1% of the rank)
+QUANTILE_ERROR = 0.01
+# coin flips of the compactions, shared: a generator per sketch costs more than the sketch itself when every
+# facet and column has one
+_COINS = np.random.default_rng()
+
+
+def k_for_error(error):
+    """KLL compactor size keeping the normalized rank error within `error`: it is about 1/k on average and rarely
+    over 2/k, so k = 4/error leaves a margin of two"""
+    return max(8, int(math.ceil(4 / error)))
+
+
+def merge_moments(count, mean, m2):
+    """Combines per-group (count, mean, M2 = sum of squared deviations) into totals, exactly (Chan et al.)"""
+    n = count.sum()
+    if n == 0:
+        return 0, np.nan, np.nan
+    total_mean = (count * np.where(count > 0, mean, 0)).sum() / n
+    total_m2 = np.where(count > 0, m2 + count * (mean - total_mean) ** 2, 0).sum()
+    return n, total_mean, total_m2
+
+
+def update_moments(count, mean, m2, ids, values):
+    """Folds a batch of values (grouped by `ids`) into per-group Welford moments, in place"""
+    n_groups = len(count)
+    batch_count = np.bincount(ids, minlength=n_groups)
+    seen = batch_count > 0
+    batch_mean = np.bincount(ids, weights=values, minlength=n_groups)[seen] / batch_count[seen]
+    group_mean = np.zeros(n_groups)
+    group_mean[seen] = batch_mean
+    batch_m2 = np.bincount(ids, weights=(values - group_mean[ids]) ** 2, minlength=n_groups)[seen]
+
+    n_a, n_b = count[seen], batch_count[seen]
+    n = n_a + n_b
+    delta = batch_mean - mean[seen]
+    mean[seen] = mean[seen] + delta * n_b / n
+    m2[seen] = m2[seen] + batch_m2 + delta ** 2 * n_a * n_b / n
+    count[seen] = n
+
+
+class KLLSketch:
+    """Mergeable quantile sketch (Karnin, Lang & Liberty 2016).
+
+    Values are kept exactly until the first compaction, so small sketches give the same linearly interpolated
+    quantiles as DataFrame.describe(); larger ones keep O(k log(n/k)) items with a normalized rank error of
+    about 1/k."""
+
+    def __init__(self, k=None, seed=None):
+        self.k = k or k_for_error(QUANTILE_ERROR)
+        self.n = 0
+        self.compactors = [np.empty(0)]
+        # a generator of its own only when the sketch must be reproducible
+        self._rng = _COINS if seed is None else np.random.default_rng(seed)
+
+    def _capacity(self, level):
+        depth = len(self.compactors) - level - 1
+        return max(2, int(math.ceil(self.k * (2 / 3) ** depth)))
+
+    def update(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        if len(values):
+            self.compactors[0] = np.concatenate([self.compactors[0], values])
+            self.n += len(values)
+            self._compress()
+        return self
+
+    def merge(self, *others):
+        """Folds other sketches into this one, level by level, with a single compression pass"""
+        depth = max([len(self.compactors)] + [len(other.compactors) for other in others])
+        self.compactors += [np.empty(0)] * (depth - len(self.compactors))
+        for level in range(depth):
+            items = [other.compactors[level] for other in others if level < len(other.compactors)]
+            self.compactors[level] = np.concatenate([self.compactors[level]] + items)
+        self.n += sum(other.n for other in others)
+        self._compress()
+        return self
+
+    def _compress(self):
+        level = 0
+        while level < len(self.compactors):
+            items = self.compactors[level]
+            if len(items) > self._capacity(level):
+                if level + 1 == len(self.compactors):
+                    self.compactors.append(np.empty(0))
+                items = np.sort(items)
+                # an odd item out stays at this level
+                keep = items[len(items) - len(items) % 2:]
+                promoted = items[self._rng.integers(2):len(items) - len(items) % 2:2]
+                self.compactors[level + 1] = np.concatenate([self.compactors[level + 1], promoted])
+                self.compactors[level] = keep
+            level += 1
+
+    @property
+    def exact(self):
+        return len(self.compactors) == 1
+
+    def quantiles(self, qs):
+        if self.n == 0:
+            return [np.nan] * len(qs)
+        if self.exact:
+            return list(np.percentile(self.compactors[0], [100 * q for q in qs]))
+        items = np.concatenate(self.compactors)
+        weights = np.concatenate([np.full(len(c), 2. ** level) for level, c in enumerate(self.compactors)])
+        order = np.argsort(items)
+        items, cum = items[order], np.cumsum(weights[order])
+        return [items[min(np.searchsorted(cum, q * cum[-1], side='right'), len(items) - 1)] for q in qs]
@@ -0,0 +1,232 @@
+"""Immutable snapshots of the kinetics table behind a CURRENT pointer, with a history of every change.
+
+    python -m db.snapshots history [--limit 20]    # changes, newest last, with the versions before/after them
+    python -m db.snapshots show VERSION            # rows of a version
+    python -m db.snapshots diff OLD NEW            # rows added and removed, e.g. by a submission (previous, version)
+    python -m db.snapshots rollback [VERSION]      # back to VERSION, by default to before the last change
+    python -m db.snapshots restore | clear
+    python -m db.snapshots gc [--keep 10] [--keep-events 100]    # delete the files of old snapshots
+
+A snapshot is a list of immutable segments (whole table files and byte ranges of journals) plus its own journal,
+to which inserts are appended; a version is a snapshot and a length of its journal, e.g. '000004+1830'.
+Restoring, clearing or rolling back makes a new snapshot out of existing segments and moves the pointer, so no
+rows are copied. Only compaction (and write() of an arbitrary frame) writes a new table file.
+
+Old snapshots are kept for rollbacks up to a limit: the store collects them after every compaction or write, and
+keeps the current snapshot, the last KEEP_SNAPSHOTS ones and those of the last KEEP_EVENTS changes in the history,
+with every file their segments use. Versions of collected snapshots can no longer be shown or rolled back to."""
+import argparse
+import json
+import os
+import time
+
+import pandas as pd
+
+from db import journal
+from db.columnar import read_base
+from db.schema import COLUMNS
+
+POINTER = 'CURRENT'
+HISTORY = 'history.jsonl'
+KEEP_SNAPSHOTS = 10
+KEEP_EVENTS = 100
+
+
+def version_id(snapshot, offset):
+    return f'{snapshot}+{offset}'
+
+
+def parse_version(version):
+    snapshot, _, offset = version.partition('+')
+    return snapshot, int(offset or 0)
+
+
+def read_segments(segments):
+    """The rows of a list of segments, in order (before coercion to the store's types)"""
+    frames = []
+    for segment in segments:
+        if 'start' in segment:
+            frames.append(journal.read_journal(segment['file'], segment['start'], segment['stop'])[0])
+        else:
+            frames.append(read_base(segment['file']))
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=COLUMNS)
+
+
+def diff_frames(old, new):
+    """(rows of `new` missing from `old`, rows of `old` missing from `new`), comparing rows as multisets"""
+    old_hashes = pd.util.hash_pandas_object(old.reindex(columns=COLUMNS).astype(object), index=False)
+    new_hashes = pd.util.hash_pandas_object(new.reindex(columns=COLUMNS).astype(object), index=False)
+    # the k-th occurrence of a row in one frame matches the k-th occurrence in the other
+    old_keys = list(zip(old_hashes, old_hashes.groupby(old_hashes).cumcount()))
+    new_keys = list(zip(new_hashes, new_hashes.groupby(new_hashes).cumcount()))
+    old_set, new_set = set(old_keys), set(new_keys)
+    added = new[[key not in old_set for key in new_keys]]
+    removed = old[[key not in new_set for key in old_keys]]
+    return added.reset_index(drop=True), removed.reset_index(drop=True)
+
+
+class SnapshotLog:
+    """Snapshot manifests, the CURRENT pointer and history.jsonl, kept in one directory.
+
+    Manifests are never modified once written; the pointer is replaced atomically. Changes must be made while
+    holding lock()."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.pointer_path = os.path.join(directory, POINTER)
+        self.history_path = os.path.join(directory, HISTORY)
+        self._manifests = {}
+        os.makedirs(directory, exist_ok=True)
+
+    def lock(self, shared=False):
+        return journal.file_lock(self.pointer_path, shared=shared)
+
+    def _write(self, path, text):
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    def exists(self):
+        return os.path.exists(self.pointer_path)
+
+    def signature(self):
+        st = os.stat(self.pointer_path)
+        return st.st_ino, st.st_mtime_ns, st.st_size
+
+    def current(self):
+        with open(self.pointer_path) as f:
+            return f.read().strip()
+
+    def manifest(self, snapshot):
+        if snapshot not in self._manifests:
+            try:
+                with open(os.path.join(self.directory, f'{snapshot}.json')) as f:
+                    self._manifests[snapshot] = json.load(f)
+            except FileNotFoundError:
+                raise ValueError(f'no snapshot {snapshot} (never made, or deleted by gc)') from None
+        return self._manifests[snapshot]
+
+    def snapshot_ids(self):
+        return sorted(name[:-len('.json')] for name in os.listdir(self.directory) if name.endswith('.json'))
+
+    def journal_path(self, snapshot):
+        return os.path.join(self.directory, f'{snapshot}.journal')
+
+    def new_table_path(self, ext):
+        return os.path.join(self.directory, f'table-{time.time_ns()}-{os.getpid()}{ext}')
+
+    def next_id(self):
+        ids = self.snapshot_ids()
+        return f'{int(ids[-1]) + 1 if ids else 1:06d}'
+
+    def create(self, segments, reason, parent=None):
+        snapshot = self.next_id()
+        manifest = {'id': snapshot, 'parent': parent, 'reason': reason, 'created': time.time(), 'segments': segments}
+        self._write(os.path.join(self.directory, f'{snapshot}.json'), json.dumps(manifest))
+        return snapshot
+
+    def point(self, snapshot):
+        self._write(self.pointer_path, snapshot + '\n')
+
+    def segments(self, version):
+        """The segments holding the rows of a version: its snapshot's, then the used part of its journal"""
+        snapshot, offset = parse_version(version)
+        segments = list(self.manifest(snapshot)['segments'])
+        if offset:
+            segments.append({'file': self.journal_path(snapshot), 'start': 0, 'stop': offset})
+        return segments
+
+    def record(self, event, **fields):
+        line = json.dumps(dict(time=time.time(), event=event, **fields)) + '\n'
+        with open(self.history_path, 'a') as f:
+            f.write(line)
+
+    def history(self):
+        try:
+            with open(self.history_path) as f:
+                return [json.loads(line) for line in f if line.strip()]
+        except FileNotFoundError:
+            return []
+
+    def gc(self, keep=KEEP_SNAPSHOTS, keep_events=KEEP_EVENTS):
+        """Deletes the manifests, journals and table files of the snapshots no longer kept: all but the current
+        one, the last `keep` ones and those of the last `keep_events` changes. Returns the deleted file names."""
+        ids, history = self.snapshot_ids(), self.history()
+        kept = set(ids[max(len(ids) - keep, 0):]) | {self.current()}
+        for event in history[max(len(history) - keep_events, 0):] if keep_events > 0 else []:
+            kept.update(parse_version(version)[0] for version in (event.get('version'), event.get('previous'))
+                        if version)
+        kept &= set(ids)
+        used = set()
+        for snapshot in kept:
+            used.add(os.path.abspath(self.journal_path(snapshot)))
+            used.update(os.path.abspath(segment['file']) for segment in self.manifest(snapshot)['segments'])
+
+        # manifests first: an interrupted gc leaves unused files, never a snapshot missing some
+        deleted = []
+        for snapshot in ids:
+            if snapshot not in kept:
+                os.remove(os.path.join(self.directory, f'{snapshot}.json'))
+                self._manifests.pop(snapshot, None)
+                deleted.append(f'{snapshot}.json')
+        for name in sorted(os.listdir(self.directory)):
+            path = os.path.join(self.directory, name)
+            if name.startswith('table-') and not name.endswith('.tmp') or name.endswith('.journal'):
+                if os.path.abspath(path) not in used:
+                    os.remove(path)
+                    deleted.append(name)
+        return deleted
+
+
+def main():
+    from db.store import STORE
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('history').add_argument('--limit', type=int, default=20)
+    commands.add_parser('show').add_argument('version')
+    diff = commands.add_parser('diff')
+    diff.add_argument('old')
+    diff.add_argument('new')
+    commands.add_parser('rollback').add_argument('version', nargs='?')
+    commands.add_parser('restore')
+    commands.add_parser('clear')
+    gc = commands.add_parser('gc')
+    gc.add_argument('--keep', type=int, help=f'most recent snapshots to keep (default {KEEP_SNAPSHOTS})')
+    gc.add_argument('--keep-events', type=int,
+                    help=f'keep the snapshots of this many of the latest changes (default {KEEP_EVENTS})')
+    args = parser.parse_args()
+    if not hasattr(STORE, 'snapshots'):
+        parser.exit(1, f'{parser.prog}: KINETICS_DB is a SQLite database, which keeps no snapshots or history; '
+                       f'they belong to the file store (TSV or Arrow)\n')
+
+    pd.set_option('display.width', 200)
+    try:
+        run(STORE, args)
+    except ValueError as error:
+        # e.g. a version that does not exist
+        parser.exit(1, f'{parser.prog} {args.command}: {error}\n')
+
+
+def run(store, args):
+    if args.command == 'history':
+        history = store.history()
+        print(history.tail(args.limit).to_string() if len(history) else 'no changes yet')
+    elif args.command == 'show':
+        print(store.version_frame(args.version).to_string())
+    elif args.command == 'diff':
+        added, removed = store.diff(args.old, args.new)
+        print(f'{len(added)} rows added:\n{added.to_string()}\n\n{len(removed)} rows removed:\n{removed.to_string()}')
+    elif args.command == 'gc':
+        deleted = store.gc(keep=args.keep, keep_events=args.keep_events)
+        print(f'{len(deleted)} files deleted' + ''.join(f'\n  {name}' for name in deleted))
+    else:
+        getattr(store, args.command)(*([args.version] if args.command == 'rollback' else []))
+        print(f'now at {store.current_version_id()} ({len(store.frame())} rows)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,273 @@
+import json
+import math
+import sqlite3
+import threading
+
+import numpy as np
+import pandas as pd
+
+from db.facets import histogram
+from db.mutants import mutant_index
+from db.query import KineticsIndex, gating_of
+from db.columnar import read_table
+from db.schema import COLUMNS, NUM_COLS, append_frame, coerce_frame, signed_selectivity
+from monitoring.metrics import phase
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS kinetics (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    selectivity TEXT,
+    isoform TEXT,
+    mutant TEXT,
+    new_residue TEXT,
+    act_v50 REAL,
+    act_z REAL,
+    act_time REAL,
+    inact_v50 REAL,
+    inact_z REAL,
+    inact_time REAL,
+    source TEXT,
+    gating TEXT
+);
+CREATE INDEX IF NOT EXISTS kinetics_isoform_mutant ON kinetics (isoform, mutant);
+CREATE INDEX IF NOT EXISTS kinetics_selectivity ON kinetics (selectivity);
+CREATE INDEX IF NOT EXISTS kinetics_mutant ON kinetics (mutant);
+CREATE INDEX IF NOT EXISTS kinetics_new_residue ON kinetics (new_residue);
+
+CREATE TABLE IF NOT EXISTS dataset_meta (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO dataset_meta (key, value) VALUES ('version', 1);
+INSERT OR IGNORE INTO dataset_meta (key, value) VALUES ('generation', 1);
+"""
+# gating of the isoform (see db.query.gating_of), stored to filter on it
+INDEX_SQL = 'CREATE INDEX IF NOT EXISTS kinetics_gating ON kinetics (gating)'
+INSERT_SQL = f'INSERT INTO kinetics ({", ".join(COLUMNS)}, gating) VALUES ({", ".join("?" * (len(COLUMNS) + 1))})'
+QUANTILES = [0.25, 0.5, 0.75]
+
+
+def _records(df):
+    """Rows as tuples in COLUMNS order followed by their gating, with NaN mapped to NULL"""
+    df = df.reindex(columns=COLUMNS).astype(object)
+    df['gating'] = df['isoform'].map({isoform: gating_of(isoform) for isoform in df['isoform'].dropna().unique()})
+    return list(df.where(df.notna(), None).itertuples(index=False, name=None))
+
+
+class SqliteStore:
+    """Kinetics table kept in a local SQLite database (WAL mode), with the same interface as KineticsStore.
+
+    Filters and summary statistics are pushed down as parameterized SQL on the indexed filter columns instead
+    of being computed in pandas. The version stamp lives in the database, so every worker sees the others'
+    writes."""
+
+    def __init__(self, path, backup_path):
+        self.path = path
+        self.backup_path = backup_path
+        self._local = threading.local()
+        self._lock = threading.RLock()
+        self._df = None
+        self._df_version = None
+        self._last_id = 0
+        self._generation = None
+        self._index = None
+        self._mutant_names = []
+        self._mutants_id = 0
+        self._mutants_generation = None
+        with self._connect() as con:
+            con.execute('PRAGMA journal_mode=WAL')
+            con.executescript(SCHEMA)
+            self._sync_gating(con)
+
+    def _sync_gating(self, con):
+        """Adds the gating column to databases made before it, and updates it where the channel catalog now says
+        otherwise (one pass over the isoform index)"""
+        if 'gating' not in [row[1] for row in con.execute('PRAGMA table_info(kinetics)')]:
+            con.execute('ALTER TABLE kinetics ADD COLUMN gating TEXT')
+        con.execute(INDEX_SQL)
+        changes = con.total_changes
+        for (isoform,) in con.execute('SELECT DISTINCT isoform FROM kinetics WHERE isoform IS NOT NULL').fetchall():
+            con.execute('UPDATE kinetics SET gating = ? WHERE isoform = ? AND gating IS NOT ?',
+                        (gating_of(isoform), isoform, gating_of(isoform)))
+        if con.total_changes != changes:
+            self._bump_version(con)
+
+    def _connect(self):
+        con = getattr(self._local, 'con', None)
+        if con is None:
+            con = sqlite3.connect(self.path, timeout=30)
+            self._local.con = con
+        return con
+
+    def _meta(self, key):
+        return self._connect().execute('SELECT value FROM dataset_meta WHERE key = ?', (key,)).fetchone()[0]
+
+    @property
+    def version(self):
+        return self._meta('version')
+
+    def current_version(self):
+        return self.version
+
+    def current_version_id(self):
+        """Same across workers, unlike KineticsStore.current_version()"""
+        return str(self.version)
+
+    def _bump_version(self, con):
+        con.execute("UPDATE dataset_meta SET value = value + 1 WHERE key = 'version'")
+
+    def _read_rows(self, after_id):
+        df = self._read_sql(f'SELECT id, {", ".join(COLUMNS)} FROM kinetics WHERE id > ? ORDER BY id', [after_id])
+        if len(df):
+            self._last_id = int(df['id'].iloc[-1])
+        return df.drop(columns='id')
+
+    @phase('load')
+    def frame(self):
+        """The whole table; after appends (by any worker) only the rows with a larger id are read"""
+        with self._lock:
+            version, generation = self.version, self._meta('generation')
+            if self._df is None or self._generation != generation:
+                self._last_id = 0
+                self._df = coerce_frame(self._read_rows(0))
+                self._generation = generation
+            elif self._df_version != version:
+                new_rows = self._read_rows(self._last_id)
+                if len(new_rows):
+                    self._df = append_frame(self._df, coerce_frame(new_rows))
+            self._df_version = version
+            return self._df
+
+    def snapshot(self):
+        with self._lock:
+            df = self.frame()
+            return self._df_version, str(self._df_version), df
+
+    @phase('load')
+    def index_for(self, df):
+        with self._lock:
+            if df is not self._df:
+                return KineticsIndex(df)
+            if self._index is None or self._index.generation != self._generation:
+                self._index = KineticsIndex(df, generation=self._generation)
+            elif self._index.n_rows < len(df):
+                self._index = self._index.extend(df.iloc[self._index.n_rows:])
+            return self._index
+
+    def preload(self):
+        """Loads the frame and its index (statistics are computed in SQL, without facets), then closes this thread's
+        connection, which must not be shared with forked workers"""
+        with self._lock:
+            self.index_for(self.frame())
+            self._local.con.close()
+            self._local = threading.local()
+
+    def _read_sql(self, sql, params=()):
+        return pd.read_sql_query(sql, self._connect(), params=params)
+
+    def mutants(self):
+        """MutantIndex of the distinct mutant names in the database: read once per generation, then only from the
+        rows added since"""
+        with self._lock:
+            con = self._connect()
+            generation = self._meta('generation')
+            if self._mutants_generation != generation:
+                self._mutant_names, self._mutants_id, self._mutants_generation = [], 0, generation
+            last_id = con.execute('SELECT MAX(id) FROM kinetics').fetchone()[0] or 0
+            if last_id > self._mutants_id:
+                known = set(self._mutant_names)
+                added = con.execute('SELECT mutant FROM kinetics WHERE id > ? AND id <= ? AND mutant IS NOT NULL '
+                                    'GROUP BY mutant ORDER BY MIN(id)', (self._mutants_id, last_id))
+                self._mutant_names.extend(mutant for (mutant,) in added if mutant not in known)
+                self._mutants_id = last_id
+            return mutant_index(tuple(self._mutant_names))
+
+    def _where(self, isoform=None, mutant=None, selectivity=None, new_res=None, gating=None):
+        clauses, params = [], []
+        for col, value in (('isoform', isoform), ('new_residue', new_res), ('gating', gating),
+                           ('selectivity', signed_selectivity(selectivity) if selectivity else None)):
+            if value:
+                clauses.append(f'{col} = ?')
+                params.append(value)
+        if mutant:
+            # the mutant search resolves to names, matched on the mutant index
+            clauses.append('mutant IN (SELECT value FROM json_each(?))')
+            params.append(json.dumps(self.mutants().search_names(mutant)))
+        return (' WHERE ' + ' AND '.join(clauses)) if clauses else '', params
+
+    @phase('filter')
+    def filter(self, **filters):
+        where, params = self._where(**filters)
+        return coerce_frame(self._read_sql(f'SELECT {", ".join(COLUMNS)} FROM kinetics{where} ORDER BY id', params))
+
+    @phase('aggregate')
+    def describe(self, cols, **filters):
+        """Same layout as DataFrame.describe(), computed in SQL (two-pass variance, quantiles by ordered offset)"""
+        cols = [col for col in cols if col in NUM_COLS]
+        where, params = self._where(**filters)
+        con = self._connect()
+        stats = {}
+        for col in cols:
+            non_null = f'{where} AND {col} IS NOT NULL' if where else f' WHERE {col} IS NOT NULL'
+            n, mean, lo, hi = con.execute(
+                f'SELECT COUNT({col}), AVG({col}), MIN({col}), MAX({col}) FROM kinetics{non_null}', params
+            ).fetchone()
+            std = quantiles = None
+            if n > 1:
+                ss = con.execute(f'SELECT SUM(({col} - ?) * ({col} - ?)) FROM kinetics{non_null}',
+                                 [mean, mean] + params).fetchone()[0]
+                std = math.sqrt(ss / (n - 1))
+            if n:
+                quantiles = []
+                for q in QUANTILES:
+                    pos = q * (n - 1)
+                    below = con.execute(f'SELECT {col} FROM kinetics{non_null} ORDER BY {col} LIMIT 2 OFFSET ?',
+                                        params + [int(pos)]).fetchall()
+                    value = below[0][0]
+                    if len(below) > 1:
+                        value += (below[1][0] - value) * (pos - int(pos))
+                    quantiles.append(value)
+            stats[col] = [n, mean, std, lo] + (quantiles or [None] * len(QUANTILES)) + [hi]
+        index = ['count', 'mean', 'std', 'min'] + [f'{q:.0%}' for q in QUANTILES] + ['max']
+        return pd.DataFrame(stats, index=index, columns=cols).astype(np.float64)
+
+    @phase('aggregate')
+    def histogram(self, col, **filters):
+        """(counts, bin edges) of one column over the filtered rows: only that column of the matching rows is read"""
+        if col not in NUM_COLS:
+            raise ValueError(f'no histogram of {col}')
+        where, params = self._where(**filters)
+        return histogram(col, self._read_sql(f'SELECT {col} FROM kinetics{where}', params)[col])
+
+    def append(self, rows, note=None):
+        # submissions are not kept apart here: the snapshot history (db.snapshots) belongs to the file store
+        with self._lock:
+            con = self._connect()
+            with con:
+                con.executemany(INSERT_SQL, _records(rows))
+                self._bump_version(con)
+            return self.frame()
+
+    def write(self, df):
+        with self._lock:
+            df = coerce_frame(df)
+            con = self._connect()
+            with con:
+                con.execute('DELETE FROM kinetics')
+                con.executemany(INSERT_SQL, _records(df))
+                con.execute("UPDATE dataset_meta SET value = value + 1 WHERE key = 'generation'")
+                self._bump_version(con)
+            return self.frame()
+
+    def restore(self):
+        """Back to the backup table file (a full rewrite here, unlike the file store's pointer swap)"""
+        return self.write(self.backup())
+
+    def clear(self):
+        return self.write(pd.DataFrame(columns=COLUMNS))
+
+    def backup(self):
+        return read_table(self.backup_path)
+
+    def columns(self):
+        return list(COLUMNS)
@@ -0,0 +1,344 @@
+import os
+import shutil
+import threading
+
+import pandas as pd
+
+from db import journal
+from db.columnar import read_table
+from db.facets import FacetTable, histogram
+from db.query import KineticsIndex, filter_frame
+from db.schema import COLUMNS, append_frame, coerce_frame, signed_selectivity
+from db.snapshots import (KEEP_EVENTS, KEEP_SNAPSHOTS, SnapshotLog, diff_frames, parse_version, read_segments,
+                          version_id)
+from db.sqlite_store import SqliteStore
+from monitoring.metrics import phase
+
+DB_FILE = 'db/test.csv'
+BACKUP_FILE = 'db/test-bk.csv'
+COMPACT_EVERY = 1000
+# 'db/kinetics.sqlite' (any .sqlite/.db path) selects the SQLite store, anything else the file store (TSV, or
+# Arrow IPC for .arrow/.feather paths)
+KINETICS_DB = os.environ.get('KINETICS_DB', DB_FILE)
+
+
+class KineticsStore:
+    """Keeps the kinetics table in memory, shared by every callback of the process.
+
+    The table is the current snapshot (see db.snapshots) of the TSV (or Arrow IPC, for .arrow/.feather paths)
+    file: immutable table files plus a journal of records appended to it. They are read once; afterwards only
+    journal lines written since the last read are parsed, and the table is re-read only when the CURRENT pointer
+    moves (restore, rollback, clear, compaction, by any worker). Inserts are single appends to the journal under
+    a lock shared by all workers and are folded into a new table file every `compact_every` records.
+
+    Each change builds a new frame, so a frame handed out earlier remains a consistent snapshot while writes go
+    on. Returned frames are shared: callers must treat them as read-only."""
+
+    def __init__(self, path=DB_FILE, backup_path=BACKUP_FILE, compact_every=COMPACT_EVERY, snapshot_dir=None,
+                 keep_snapshots=KEEP_SNAPSHOTS, keep_events=KEEP_EVENTS):
+        self.path = path
+        self.backup_path = backup_path
+        self.snapshots = SnapshotLog(snapshot_dir or os.path.splitext(path)[0] + '.snapshots')
+        self.compact_every = compact_every
+        # retention of the snapshots collected after compactions and writes
+        self.keep_snapshots = keep_snapshots
+        self.keep_events = keep_events
+        self.version = 0
+        self.snapshot_id = None
+        self.journal_path = None
+        self._df = None
+        self._signature = None
+        self._base_rows = 0
+        self._journal_offset = 0
+        self._journal_rows = 0
+        self._index = None
+        # bumped whenever the frame is rebuilt rather than appended to
+        self._generation = 0
+        self._facets = None
+        self._lock = threading.RLock()
+
+    def _copy_table(self, source):
+        """A copy of a file in the snapshot directory: snapshots only refer to files nothing else writes to, while
+        the table and backup files may be edited or replaced"""
+        path = self.snapshots.new_table_path(os.path.splitext(source)[1])
+        shutil.copyfile(source, path + '.tmp')
+        os.replace(path + '.tmp', path)
+        return path
+
+    def _init_snapshots(self):
+        """The first snapshot is a copy of the table file as it is (plus the journal of earlier releases, if any)"""
+        with self.snapshots.lock():
+            if self.snapshots.exists():
+                return
+            segments = [{'file': self._copy_table(self.path)}]
+            legacy_journal = os.path.splitext(self.path)[0] + '.journal'
+            if os.path.exists(legacy_journal) and os.path.getsize(legacy_journal):
+                segments.append({'file': self._copy_table(legacy_journal), 'start': 0,
+                                 'stop': os.path.getsize(legacy_journal)})
+            snapshot = self.snapshots.create(segments, 'init')
+            self.snapshots.point(snapshot)
+            self.snapshots.record('init', version=version_id(snapshot, 0), previous=None)
+
+    def _journal_size(self):
+        try:
+            return os.stat(self.journal_path).st_size
+        except FileNotFoundError:
+            return 0
+
+    def _load(self):
+        if not self.snapshots.exists():
+            self._init_snapshots()
+        with self.snapshots.lock(shared=True):
+            self._signature = self.snapshots.signature()
+            self.snapshot_id = self.snapshots.current()
+            self.journal_path = self.snapshots.journal_path(self.snapshot_id)
+            base = read_segments(self.snapshots.manifest(self.snapshot_id)['segments'])
+            tail, self._journal_offset = journal.read_journal(self.journal_path)
+        self._df = coerce_frame(pd.concat([base, tail], ignore_index=True))
+        self._base_rows = len(base)
+        self._journal_rows = len(tail)
+        self._generation += 1
+        self.version += 1
+
+    @phase('load')
+    def frame(self):
+        with self._lock:
+            if self._df is None or not self.snapshots.exists() or self.snapshots.signature() != self._signature:
+                self._load()
+            elif self._journal_size() > self._journal_offset:
+                tail, self._journal_offset = journal.read_journal(self.journal_path, self._journal_offset)
+                if len(tail):
+                    self._df = append_frame(self._df, coerce_frame(tail))
+                    self._journal_rows += len(tail)
+                    self.version += 1
+            return self._df
+
+    def current_version(self):
+        with self._lock:
+            self.frame()
+            return self.version
+
+    def current_version_id(self):
+        """The snapshot version of the frame, e.g. '000004+1830'"""
+        with self._lock:
+            self.frame()
+            return version_id(self.snapshot_id, self._journal_offset)
+
+    def snapshot(self):
+        """The current (version, version id, frame), read atomically"""
+        with self._lock:
+            df = self.frame()
+            return self.version, version_id(self.snapshot_id, self._journal_offset), df
+
+    @phase('load')
+    def index_for(self, df):
+        """The query index of df: for the store's own frame, rebuilt after a reload and only extended after appends;
+        built on the fly for any other frame"""
+        with self._lock:
+            if df is not self._df:
+                return KineticsIndex(df)
+            if self._index is None or self._index.generation != self._generation:
+                self._index = KineticsIndex(df, generation=self._generation)
+            elif self._index.n_rows < len(df):
+                self._index = self._index.extend(df.iloc[self._index.n_rows:])
+            return self._index
+
+    @phase('load')
+    def facets(self):
+        """Per-facet histograms and moments, rebuilt after a reload and only extended after appends"""
+        with self._lock:
+            df = self.frame()
+            if self._facets is None or self._facets.generation != self._generation:
+                self._facets = FacetTable(df, generation=self._generation)
+            elif self._facets.n_rows < len(df):
+                self._facets.add(df.iloc[self._facets.n_rows:])
+            return self._facets
+
+    def preload(self):
+        """Loads the frame, its index and facets, e.g. in a server's master process before it forks workers"""
+        with self._lock:
+            self.index_for(self.frame())
+            self.facets()
+
+    def filter(self, **filters):
+        with self._lock:
+            df = self.frame()
+            index = self.index_for(df)
+        return filter_frame(df, index, **filters)
+
+    def _facet_ids(self, isoform=None, mutant=None, selectivity=None, gating=None):
+        """The facet table and the ids of the facets matching the filters"""
+        with self._lock:
+            facets = self.facets()
+            names = self.index_for(self.frame()).mutants.search_names(mutant) if mutant else None
+        return facets, facets.match(selectivity=signed_selectivity(selectivity) if selectivity else None,
+                                    isoform=isoform, mutant=names, gating=gating)
+
+    @phase('aggregate')
+    def describe(self, cols, new_res=None, **filters):
+        """DataFrame.describe() of the filtered rows, merged from the facets (keyed on selectivity, isoform and
+        mutant) unless a new residue filter needs the rows themselves"""
+        if new_res:
+            return self.filter(new_res=new_res, **filters)[cols].describe()
+        facets, ids = self._facet_ids(**filters)
+        return facets.describe(cols, ids)
+
+    def histogram(self, col, new_res=None, **filters):
+        """(counts, bin edges) of one column over the filtered rows, from the facets as for describe()"""
+        if new_res:
+            return histogram(col, self.filter(new_res=new_res, **filters)[col])
+        facets, ids = self._facet_ids(**filters)
+        return facets.histogram(col, ids)
+
+    def append(self, rows, note=None):
+        """Appends records through the journal and returns the refreshed frame; `note` (e.g. the uploaded file)
+        is kept with the submission in the history"""
+        with self._lock:
+            self.frame()
+            with self.snapshots.lock():
+                snapshot = self.snapshots.current()
+                start, stop = journal.append_rows(self.snapshots.journal_path(snapshot), rows)
+                self.snapshots.record('append', version=version_id(snapshot, stop),
+                                      previous=version_id(snapshot, start), rows=len(rows), note=note)
+            self.frame()
+            if self._journal_rows >= self.compact_every:
+                self.compact()
+            return self._df
+
+    def _journal_size_of(self, snapshot):
+        try:
+            return os.stat(self.snapshots.journal_path(snapshot)).st_size
+        except FileNotFoundError:
+            return 0
+
+    def _repoint(self, segments, reason, parent=None):
+        """Points CURRENT at a new snapshot made of `segments` and logs it (snapshot lock held); returns its id"""
+        current = self.snapshots.current()
+        previous = version_id(current, self._journal_size_of(current))
+        snapshot = self.snapshots.create(segments, reason, parent=parent or current)
+        self.snapshots.point(snapshot)
+        self.snapshots.record(reason, version=version_id(snapshot, 0), previous=previous)
+        return snapshot
+
+    def compact(self):
+        """Folds the journal into a new table file"""
+        with self._lock:
+            self.frame()
+            with self.snapshots.lock():
+                current = self.snapshots.current()
+                size = self._journal_size_of(current)
+                if current == self.snapshot_id and size == self._journal_offset:
+                    df = self._df
+                else:
+                    df = coerce_frame(read_segments(self.snapshots.segments(version_id(current, size))))
+                path = self.snapshots.new_table_path(os.path.splitext(self.path)[1])
+                journal.replace_file(path, df)
+                snapshot = self._repoint([{'file': path}], 'compact')
+                if df is self._df:
+                    # same rows as the frame in memory: keep it (and everything derived from it)
+                    self.snapshot_id = snapshot
+                    self.journal_path = self.snapshots.journal_path(snapshot)
+                    self._signature = self.snapshots.signature()
+                    self._base_rows = len(df)
+                    self._journal_offset = 0
+                    self._journal_rows = 0
+                else:
+                    self._set(snapshot, df)
+                self.snapshots.gc(self.keep_snapshots, self.keep_events)
+
+    def write(self, df):
+        """Replaces the whole table with an arbitrary frame, written as a new table file; appends should go through
+        append(), and restore/rollback/clear do not copy rows"""
+        with self._lock, self.snapshots.lock():
+            df = coerce_frame(df)
+            path = self.snapshots.new_table_path(os.path.splitext(self.path)[1])
+            journal.replace_file(path, df)
+            self._set(self._repoint([{'file': path}], 'write'), df)
+            self.snapshots.gc(self.keep_snapshots, self.keep_events)
+            return df
+
+    def checkout(self, version, reason='rollback'):
+        """Makes `version` current again, as a new snapshot sharing its segments"""
+        with self._lock:
+            self.frame()
+            snapshot, offset = parse_version(version)
+            with self.snapshots.lock():
+                new_snapshot = self._repoint(self.snapshots.segments(version), reason, parent=snapshot)
+                if snapshot == self.snapshot_id and offset <= self._journal_offset:
+                    # an earlier state of the frame in memory: a prefix of it
+                    head, _ = journal.read_journal(self.journal_path, 0, offset)
+                    self._set(new_snapshot, self._df.iloc[:self._base_rows + len(head)])
+            return self.frame()
+
+    def rollback(self, version=None):
+        """Back to `version`, by default to the version before the last change (so a second rollback redoes it)"""
+        if version is None:
+            history = self.snapshots.history()
+            if not history or history[-1]['previous'] is None:
+                return self.frame()
+            version = history[-1]['previous']
+        return self.checkout(version)
+
+    def restore(self):
+        """Back to (a copy of) the backup table file"""
+        with self._lock:
+            with self.snapshots.lock():
+                self._repoint([{'file': self._copy_table(self.backup_path)}], 'restore')
+            return self.frame()
+
+    def clear(self):
+        with self._lock:
+            with self.snapshots.lock():
+                self._set(self._repoint([], 'clear'), coerce_frame(pd.DataFrame(columns=COLUMNS)))
+            return self._df
+
+    def version_frame(self, version):
+        with self._lock:
+            if version == self.current_version_id():
+                return self._df
+        return coerce_frame(read_segments(self.snapshots.segments(version)))
+
+    def diff(self, old, new):
+        """(rows added, rows removed) from version `old` to version `new`"""
+        return diff_frames(self.version_frame(old), self.version_frame(new))
+
+    def gc(self, keep=None, keep_events=None):
+        """Deletes the files of old snapshots (see SnapshotLog.gc), by default with the store's retention, and
+        returns their names"""
+        with self._lock, self.snapshots.lock():
+            return self.snapshots.gc(self.keep_snapshots if keep is None else keep,
+                                     self.keep_events if keep_events is None else keep_events)
+
+    def history(self):
+        """Every change (inserts with their row count and note, restores, rollbacks, ...) with the versions before
+        and after it"""
+        history = pd.DataFrame(self.snapshots.history(), columns=['time', 'event', 'version', 'previous', 'rows',
+                                                                  'note'])
+        history['time'] = pd.to_datetime(history['time'], unit='s')
+        return history
+
+    def _set(self, snapshot, df):
+        self._df = df
+        self.snapshot_id = snapshot
+        self.journal_path = self.snapshots.journal_path(snapshot)
+        self._signature = self.snapshots.signature()
+        self._base_rows = len(df)
+        self._journal_offset = 0
+        self._journal_rows = 0
+        self._generation += 1
+        self.version += 1
+
+    def backup(self):
+        return read_table(self.backup_path)
+
+    def columns(self):
+        return list(self.frame().columns)
+
+
+def open_store(location=KINETICS_DB, backup_path=BACKUP_FILE):
+    if location.endswith(('.sqlite', '.db')):
+        return SqliteStore(location, backup_path)
+    return KineticsStore(location, backup_path)
+
+
+STORE = open_store()
@@ -0,0 +1,35 @@
+"""Production serving profile, used by the Procfile:
+
+    gunicorn -c gunicorn.conf.py app:server
+
+The app and the kinetics table are loaded once in the master process (preload_app) and the workers are forked
+from it, so they share the table's pages copy-on-write instead of each parsing and holding its own copy. Each
+worker serves requests from a pool of threads; connections beyond `backlog` waiting to be accepted are refused
+instead of queueing without bound."""
+import gc
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8050')}"
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count()))
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+preload_app = True
+backlog = int(os.environ.get('GUNICORN_BACKLOG', 64))
+timeout = 60
+graceful_timeout = 30
+keepalive = 5
+
+# no collections while the app is imported: objects then stay packed together and the frozen (see when_ready)
+# pages are not rewritten by the collector in the workers
+gc.disable()
+
+
+def when_ready(server):
+    # runs in the master after the app is preloaded and before any worker is forked
+    from db.store import STORE
+
+    STORE.preload()
+    gc.freeze()
+    gc.enable()
+    server.log.info('kinetics table preloaded, %d objects frozen', gc.get_freeze_count())
@@ -0,0 +1,86 @@
+"""Content-hashed image URLs and their pre-generated variants.
+
+    python -m layout.assets    # writes resized/WebP variants to img/_build (needs Pillow)
+
+Images are referenced as /static-img/<stem>.<hash>[.w<width>].<ext>. The hash changes with the file content, so
+responses can be cached forever by the browser; nothing is read until the first URL is built."""
+import hashlib
+import os
+import re
+
+APP_DIR = os.getcwd()
+IMG_DIR = os.path.join(APP_DIR, 'img')
+BUILD_DIR = os.path.join(IMG_DIR, '_build')
+ASSET_ROUTE = '/static-img'
+CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+# widths (px) pre-generated for each image, matching the size they are displayed at (x2 for HiDPI screens)
+VARIANT_WIDTHS = {
+    'geprom.png': [400],
+    'udem2.png': [400],
+    'Lab2014_sm.jpg': [1200],
+}
+ASSET_NAME = re.compile(r'^(?P<stem>[\w\-]+)\.(?P<hash>[0-9a-f]{12})(?:\.w(?P<width>\d+))?(?P<ext>\.\w+)$')
+
+_hashes = {}
+
+
+def content_hash(name):
+    """First 12 hex digits of the file's SHA-1, memoized per (mtime, size)"""
+    st = os.stat(os.path.join(IMG_DIR, name))
+    key = (name, st.st_mtime_ns, st.st_size)
+    if key not in _hashes:
+        with open(os.path.join(IMG_DIR, name), 'rb') as f:
+            _hashes[key] = hashlib.sha1(f.read()).hexdigest()[:12]
+    return _hashes[key]
+
+
+def asset_url(name, width=None):
+    stem, ext = os.path.splitext(name)
+    suffix = f'.w{width}' if width else ''
+    return f'{ASSET_ROUTE}/{stem}.{content_hash(name)}{suffix}{ext}'
+
+
+def variant_name(name, width, ext=None):
+    stem, original_ext = os.path.splitext(name)
+    return f'{stem}.{content_hash(name)}.w{width}{ext or original_ext}'
+
+
+def resolve_asset(filename, accept_webp=False):
+    """(directory, file name) to send for a hashed asset URL, or None if it does not name a current image.
+
+    Resized variants fall back to the original image when they have not been generated; WebP is served to
+    browsers that accept it whenever a WebP variant exists."""
+    match = ASSET_NAME.match(filename)
+    if match is None:
+        return None
+    name = match['stem'] + match['ext']
+    if name not in VARIANT_WIDTHS or content_hash(name) != match['hash']:
+        return None
+    width = match['width']
+    if width:
+        candidates = [variant_name(name, width, '.webp')] if accept_webp else []
+        candidates.append(variant_name(name, width))
+        for candidate in candidates:
+            if os.path.exists(os.path.join(BUILD_DIR, candidate)):
+                return BUILD_DIR, candidate
+    return IMG_DIR, name
+
+
+def build_variants():
+    from PIL import Image
+
+    os.makedirs(BUILD_DIR, exist_ok=True)
+    for name, widths in VARIANT_WIDTHS.items():
+        with Image.open(os.path.join(IMG_DIR, name)) as image:
+            image = image.convert('RGBA' if image.mode in ('P', 'LA', 'RGBA') else 'RGB')
+            for width in widths:
+                height = round(image.height * min(width, image.width) / image.width)
+                resized = image.resize((min(width, image.width), height), Image.LANCZOS)
+                resized.save(os.path.join(BUILD_DIR, variant_name(name, width)), optimize=True)
+                resized.save(os.path.join(BUILD_DIR, variant_name(name, width, '.webp')), quality=85)
+                print(f'{name}: w{width} variants written')
+
+
+if __name__ == '__main__':
+    build_variants()
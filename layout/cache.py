@@ -0,0 +1,32 @@
+import hashlib
+import json
+import threading
+
+import plotly
+
+
+class LayoutCache:
+    """Builds the app layout once per process (app.layout = cache.tree) and the ETag of the JSON served by
+    /_dash-layout, so that a browser holding it gets a 304.
+
+    Everything that changes with the data (dropdown options, tables, figures) is filled in by callbacks, so the
+    component tree itself never changes while the process runs."""
+
+    def __init__(self, build):
+        self.build = build
+        self._tree = None
+        self._etag = None
+        self._lock = threading.Lock()
+
+    def tree(self):
+        with self._lock:
+            if self._tree is None:
+                self._tree = self.build()
+            return self._tree
+
+    def etag(self):
+        """Hash of the layout's JSON, encoded as Dash does, on first use"""
+        if self._etag is None:
+            body = json.dumps(self.tree(), cls=plotly.utils.PlotlyJSONEncoder).encode('utf-8')
+            self._etag = hashlib.sha1(body).hexdigest()[:16]
+        return self._etag
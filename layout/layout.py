@@ -1,23 +1,24 @@
-import base64
 # Dash/Plotly/Flask
 import dash_table
 import dash_core_components as dcc
 import dash_html_components as html
 import dash_bootstrap_components as dbc
 import os
+from functools import lru_cache
+
+from analysis.comparison import METRIC_LABELS
+from db.catalog import CONFIG_DIR
+from db.schema import COLUMNS, NUM_COLS, RESIDUES
+from layout.assets import asset_url
 
 #APP_DIR = '/home/michael/Desktop/Biophysics/Dev/KineticsApp'
 APP_DIR = os.getcwd()
-GEPROM_IMG = APP_DIR + '/img/geprom.png'
-UDEM_IMG = APP_DIR + '/img/udem2.png'
-TEAM_IMG = APP_DIR + '/img/Lab2014_sm.jpg'
-CONFIG_DIR = APP_DIR + '/cfg'
-ENCODED_IMG_GEPROM = base64.b64encode(open(GEPROM_IMG, 'rb').read())
-ENCODED_IMG_UDEM= base64.b64encode(open(UDEM_IMG, 'rb').read())
-ENCODED_IMG_TEAM= base64.b64encode(open(TEAM_IMG, 'rb').read())
-RESIDUES = ['Ala (A)', 'Arg (R)', 'Asn (N)', 'Asp (D)', 'Cys (C)', 'Glu (E)',
-            'Gln (Q)', 'Gly (G)', 'His (H)', 'Hyp (O)', 'Ile (I)', 'Leu (L)', 'Lys (K)', 'Met (M)', 'Phe (F)',
-            'Pro (P)', 'Glp (U)', 'Ser (S)', 'Thr (T)', 'Trp (W)', 'Tyr (Y)', 'Val (V)']
+TABLE_PAGE_SIZE = 25
+# mutant names listed under the WT/Mutant field while typing
+MUTANT_SUGGESTIONS = 10
+# columns of the shift heatmap (the positions with the most substitutions) and rows of the largest shifts table
+SHIFT_HEATMAP_POSITIONS = 200
+SHIFT_TABLE_ROWS = 15
 
 # the style arguments for the sidebar. We use position:fixed and a fixed width
 SIDEBAR_STYLE = {
@@ -45,6 +46,7 @@ NAV_STYLE = {
 }
 
 
+@lru_cache(maxsize=None)
 def produce_sidebar():
     return html.Div(
     [
@@ -71,7 +73,7 @@ def produce_sidebar():
         html.Div(
             html.A(
                 html.Img(
-                    src='data:image/png;base64,{}'.format(ENCODED_IMG_GEPROM.decode()),
+                    src=asset_url('geprom.png', width=400),
                     style={
                         "width": "75%",
                         "text-align": "center",
@@ -87,7 +89,7 @@ def produce_sidebar():
         ),
         html.Div(
             html.A(
-                html.Img(src='data:image/png;base64,{}'.format(ENCODED_IMG_UDEM.decode()),
+                html.Img(src=asset_url('udem2.png', width=400),
                          style={"width": "75%", 'text-align': 'center'}),
                 href="https://www.umontreal.ca/"
             ),
@@ -163,10 +165,12 @@ mutant_input = dbc.FormGroup(
     [
         dbc.Label("WT/Mutant", html_for="mutant-row", width=2),
         dbc.Col(
-            dbc.Input(
+            [dbc.Input(
                 id="mutant-input",
-                placeholder="Search for WT or the mutated residue",
+                placeholder="WT, W434F, Trp434Phe or positions 400-450",
+                list="mutant-suggestions",
             ),
+                html.Datalist(id="mutant-suggestions")],
             width=5,
         ),
         dbc.Col(
@@ -210,9 +214,32 @@ email_input = dbc.FormGroup(
     row=True,
 )
 
+bulk_upload = html.Div(
+    [
+        dcc.Upload(
+            id='bulk-upload',
+            children=html.Div(['Mass insert: drag and drop or ', html.A('select a CSV/TSV/Excel file')]),
+            style={
+                'borderWidth': '1px',
+                'borderStyle': 'dashed',
+                'borderRadius': '5px',
+                'textAlign': 'center',
+                'padding': '20px',
+                'margin-top': '20px',
+            },
+        ),
+        dbc.FormText("One row per measurement, with the database column names as headers "
+                     "(selectivity, isoform, mutant, new_residue, act_v50, act_z, act_time, inact_v50, inact_z, "
+                     "inact_time, source)."),
+        html.Div(id='bulk-upload-report', style={'margin-top': '20px', 'text-align': 'center'}),
+    ],
+    style={'margin-bottom': '40px'}
+)
+
 isoform_subform = dbc.Form([radios_input, selectivity_input, isoform_input, mutant_input], style={'margin-bottom': '0px'})
 
 
+@lru_cache(maxsize=None)
 def produce_kinetics_ui():
     return dbc.Container([
         html.H2('Ion Channels Kinetics Data',
@@ -225,9 +252,10 @@ def produce_kinetics_ui():
 
         isoform_subform,
 
+        # both tab bodies are part of the layout, so switching tabs does not go through the server
         dcc.Tabs(id='mother-tabs', value='select-tab', children=[
-            dcc.Tab(label='Insert Data', value='insert-tab'),
-            dcc.Tab(label='Consult Data', value='select-tab'),
+            dcc.Tab(produce_insert_tab(), label='Insert Data', value='insert-tab'),
+            dcc.Tab(produce_consult_tab(), label='Consult Data', value='select-tab'),
         ],
         colors={
             "border": "#e6eeff",
@@ -238,11 +266,130 @@ def produce_kinetics_ui():
             "margin-top": "20px"
         }
         ),
-        html.Div(id='tabs-div-container', style={"margin-top": "20px"}),
     ]
     )
 
 
+def produce_insert_tab():
+    return html.Div([
+        dcc.Markdown(
+            """
+            Please enter as many of the following fields and a credible source. (*If you have a lot of data, upload it as a file at the bottom of this tab*).
+            """
+        ),
+        produce_kinetics_subform(type='Act.'),
+        produce_kinetics_subform(type='Inact.'),
+        html.Div(source_input, style={"margin-top": "20px"}),
+        email_input,
+        html.Div(
+            dbc.Button(
+                id='submit-button',
+                children='Submit Data!',
+                color="primary",
+                className="btn btn-primary",
+                style={
+                    'float': 'center',
+                    'margin-bottom': '40px',
+                    'text-align': 'center'
+                }
+            ),
+            style={
+                'float': 'center',
+                'text-align': 'center'
+            }
+        ),
+
+        html.Div(id='click-confirmation-div'),
+        bulk_upload,
+    ],
+        style={"margin-top": "20px"}
+    )
+
+
+def produce_consult_tab():
+    return html.Div([
+        html.Div([
+            html.P('Filter the database with the fields above, or leave empty for all data.'),
+            produce_data_table(COLUMNS, numeric_columns=NUM_COLS),
+        ],
+            id='consult-data-div',
+            style={'margin-bottom': '50px'}
+        ),
+        html.H6('Select your desired Statistics',
+                style={'textAlign': 'center', 'padding': '20px', 'font-size': '18px', 'margin-top': '90px'}),
+        dcc.Dropdown(
+            id='hist-selector',
+            multi=True,
+            value=['act_v50', 'inact_v50'],
+            style={
+                'margin-bottom': 'px',
+                #'width': '92.5%',
+                }
+        ),
+
+        html.Div([
+            dbc.Row([
+                dbc.Col(html.Div(id='stats-table', style={'margin-top': '50px',})),
+                dbc.Col(dcc.Graph(id='consult-graph', style={'margin-top': '0px'})),
+
+            ]),
+
+        ]
+        ),
+
+        html.H6('Plot one parameter against another',
+                style={'textAlign': 'center', 'padding': '20px', 'font-size': '18px', 'margin-top': '50px'}),
+        dbc.Row([
+            dbc.Col(dcc.Dropdown(id='scatter-x', options=[{'label': col, 'value': col} for col in NUM_COLS],
+                                 value='act_v50', clearable=False)),
+            dbc.Col(dcc.Dropdown(id='scatter-y', options=[{'label': col, 'value': col} for col in NUM_COLS],
+                                 value='inact_v50', clearable=False)),
+            dbc.Col(dbc.RadioItems(
+                id='scatter-mode',
+                options=[
+                    {'label': 'Points', 'value': 'points'},
+                    {'label': 'Density', 'value': 'density'},
+                ],
+                value='points',
+                inline=True,
+            )),
+        ]),
+        dcc.Graph(id='scatter-graph'),
+
+        html.H6('Shifts of the mutants from the wild type',
+                style={'textAlign': 'center', 'padding': '20px', 'font-size': '18px', 'margin-top': '50px'}),
+        dcc.Dropdown(
+            id='shift-metric',
+            options=[{'label': label, 'value': metric} for metric, label in METRIC_LABELS.items()],
+            value='d_act_v50',
+            clearable=False,
+        ),
+        dcc.Graph(id='shift-heatmap'),
+        html.Div(id='shift-table', style={'margin-top': '20px'}),
+
+    ],
+        style={"margin-top": "20px"}
+    )
+
+
+def produce_data_table(columns, numeric_columns=(), id='consult-table'):
+    """Paginated table whose pages are sorted, filtered and sliced on the server (page/sort/filter_action='custom')"""
+    return dash_table.DataTable(
+        id=id,
+        columns=[{'name': col, 'id': col, 'type': 'numeric' if col in numeric_columns else 'text'} for col in columns],
+        page_current=0,
+        page_size=TABLE_PAGE_SIZE,
+        page_action='custom',
+        sort_action='custom',
+        sort_mode='multi',
+        sort_by=[],
+        filter_action='custom',
+        filter_query='',
+        style_cell={'text-align': 'center', 'padding': '10px'},
+        style_table={'overflowX': 'auto'},
+    )
+
+
 def produce_kinetics_subform(type):
     if 'In' in type:
         full_name = 'Inactivation'
@@ -282,6 +429,7 @@ def produce_kinetics_subform(type):
     )
 
 
+@lru_cache(maxsize=None)
 def produce_about_page():
     return dbc.Container([
         html.Div(
@@ -313,7 +461,7 @@ def produce_about_page():
         html.Div(
             html.A(
                 html.Img(
-                    src='data:image/png;base64,{}'.format(ENCODED_IMG_TEAM.decode()),
+                    src=asset_url('Lab2014_sm.jpg', width=1200),
                     style={
                         "width": "80%",
                         "text-align": "center",
@@ -366,6 +514,7 @@ def produce_about_page():
     )
 
 
+@lru_cache(maxsize=None)
 def produce_contact_page():
     return dbc.Container(
     [
@@ -383,4 +532,16 @@ def produce_contact_page():
 
     ]
 
-    )
\ No newline at end of file
+    )
+
+
+@lru_cache(maxsize=None)
+def produce_not_found_page():
+    return dbc.Jumbotron(
+        [
+            html.H1("404: Not found", className="text-danger"),
+            html.Hr(),
+            html.P(["The pathname ", html.Span(id="missing-pathname"), " was not recognised... The only pages are "
+                    "those accessible through the sidebar."]),
+        ]
+    )
@@ -0,0 +1,127 @@
+"""Instrumentation of every server-side Dash callback, installed with instrument(app) before they are declared.
+
+Each call is traced: wall time split into phases (load, filter, aggregate, render as timed in the db and app
+code, serialize for Dash's encoding of the response, other for the rest), the size of the JSON response and
+the query cache lookups it made. The metrics are served by the app at /metrics.
+
+KINETICS_SLOW_CALLBACK_MS=500 logs every callback slower than that, with its phases, to the 'kinetics.slow'
+logger; KINETICS_PROFILE_INTERVAL_MS=5 adds the most frequent stacks seen by a sampling profiler to each entry."""
+import functools
+import logging
+import os
+import time
+
+from dash.exceptions import PreventUpdate
+
+from monitoring.metrics import (METRICS, PHASES, SIZE_BUCKETS, begin_trace, current_trace, end_trace)
+from monitoring.profiler import SamplingProfiler, format_samples
+
+SLOW_CALLBACK_MS = float(os.environ.get('KINETICS_SLOW_CALLBACK_MS', 0))
+PROFILE_INTERVAL_MS = float(os.environ.get('KINETICS_PROFILE_INTERVAL_MS', 0))
+
+METRICS.describe('kinetics_callback_calls_total', 'Callback calls by status (ok, prevented, error)')
+METRICS.describe('kinetics_callback_seconds', 'Wall time of callbacks, serialization of the response included')
+METRICS.describe('kinetics_callback_phase_seconds_total', 'Wall time of callbacks by phase')
+METRICS.describe('kinetics_callback_response_bytes', 'Size of the JSON responses of callbacks')
+METRICS.describe('kinetics_callback_cache_total', 'Query cache lookups made by callbacks, by result')
+
+slow_log = logging.getLogger('kinetics.slow')
+
+
+def callback_name(callback_id):
+    """'consult-table.data,consult-table.page_count' for Dash's '..consult-table.data...consult-table.page_count..'"""
+    return ','.join(callback_id.strip('.').split('...'))
+
+
+def _mark_return(func):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        try:
+            return func(*args, **kwargs)
+        finally:
+            trace = current_trace()
+            if trace is not None:
+                trace.returned = time.perf_counter()
+
+    return wrapper
+
+
+class CallbackInstrumentation:
+
+    def __init__(self, slow_ms=SLOW_CALLBACK_MS, profile_interval_ms=PROFILE_INTERVAL_MS):
+        self.slow = slow_ms / 1000 if slow_ms else None
+        self.profiler = None
+        if self.slow and profile_interval_ms:
+            self.profiler = SamplingProfiler(interval=profile_interval_ms / 1000)
+
+    def install(self, app):
+        """Replaces app.callback so that callbacks declared from now on are traced"""
+        register = app.callback
+
+        @functools.wraps(register)
+        def callback(*args, **kwargs):
+            before = set(app.callback_map)
+            decorator = register(*args, **kwargs)
+            (callback_id,) = set(app.callback_map) - before
+
+            def wrap(func):
+                decorated = decorator(_mark_return(func))
+                entry = app.callback_map[callback_id]
+                entry['callback'] = self.traced(callback_name(callback_id), entry['callback'])
+                return decorated
+
+            return wrap
+
+        app.callback = callback
+        return app
+
+    def traced(self, name, dispatch):
+        """Wraps the function Dash dispatches to (callback, validation and JSON encoding)"""
+
+        @functools.wraps(dispatch)
+        def wrapper(*args, **kwargs):
+            trace = begin_trace(name)
+            if self.profiler is not None:
+                trace.samples = self.profiler.start()
+            status, size = 'error', None
+            try:
+                response = dispatch(*args, **kwargs)
+                # bytes on the wire: the JSON text is sent as UTF-8
+                status, size = 'ok', len(response.encode('utf-8') if isinstance(response, str) else response)
+                return response
+            except PreventUpdate:
+                status = 'prevented'
+                raise
+            finally:
+                if self.profiler is not None:
+                    self.profiler.stop()
+                self.record(end_trace(trace), status, size)
+
+        return wrapper
+
+    def record(self, trace, status, size):
+        labels = (('callback', trace.name),)
+        METRICS.inc('kinetics_callback_calls_total', labels + (('status', status),))
+        METRICS.observe('kinetics_callback_seconds', labels, trace.duration)
+        for name in PHASES:
+            if trace.phases.get(name):
+                METRICS.inc('kinetics_callback_phase_seconds_total', labels + (('phase', name),), trace.phases[name])
+        for result, n in trace.cache.items():
+            METRICS.inc('kinetics_callback_cache_total', labels + (('result', result),), n)
+        if size is not None:
+            METRICS.observe('kinetics_callback_response_bytes', labels, size, SIZE_BUCKETS)
+        if self.slow is not None and trace.duration >= self.slow:
+            self.log_slow(trace, status, size)
+
+    def log_slow(self, trace, status, size):
+        phases = ' '.join(f'{name}={trace.phases[name] * 1000:.1f}ms' for name in PHASES if trace.phases.get(name))
+        cache = ' '.join(f'{result}={n}' for result, n in sorted(trace.cache.items()))
+        message = (f'slow callback {trace.name}: {trace.duration * 1000:.1f} ms, {status}, '
+                   f'{size if size is not None else "-"} bytes; {phases}' + (f'; cache {cache}' if cache else ''))
+        if trace.samples:
+            message += '\n' + format_samples(trace.samples, self.profiler.interval)
+        slow_log.warning(message)
+
+
+def instrument(app, **settings):
+    return CallbackInstrumentation(**settings).install(app)
@@ -0,0 +1,181 @@
+"""Process-local counters and histograms, rendered in the Prometheus text format, and the phase timers feeding them.
+
+    with phase('filter'):              # or @phase('filter') on a function
+        ...
+
+Time spent in a phase is exclusive: a phase nested in another is subtracted from it, so the phases of a callback
+add up to its wall time. Phases are always recorded per process (kinetics_phase_seconds) and, inside a traced
+callback (see monitoring.callbacks), also per callback. Every series carries the pid of the process: under
+gunicorn each scrape of /metrics is answered by one worker, and sum without (pid) (...) adds the workers up."""
+import bisect
+import functools
+import os
+import threading
+import time
+from collections import defaultdict
+
+PHASES = ('load', 'filter', 'aggregate', 'render', 'serialize', 'other')
+LATENCY_BUCKETS = (.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1., 2.5, 5., 10.)
+SIZE_BUCKETS = (1e3, 1e4, 5e4, 1e5, 2.5e5, 5e5, 1e6, 2.5e6, 5e6, 1e7)
+
+_local = threading.local()
+
+
+class Histogram:
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.
+        self.count = 0
+
+    def observe(self, value):
+        # counts of each bucket alone, made cumulative when rendered
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Metrics:
+    """Counters and histograms keyed on (name, labels), labels being a tuple of (label, value) pairs"""
+
+    def __init__(self):
+        self.help = {}
+        self.counters = defaultdict(float)
+        self.histograms = {}
+        self._lock = threading.Lock()
+
+    def describe(self, name, text):
+        self.help[name] = text
+
+    def inc(self, name, labels=(), value=1):
+        with self._lock:
+            self.counters[name, labels] += value
+
+    def observe(self, name, labels, value, buckets=LATENCY_BUCKETS):
+        with self._lock:
+            histogram = self.histograms.get((name, labels))
+            if histogram is None:
+                histogram = self.histograms[name, labels] = Histogram(buckets)
+            histogram.observe(value)
+
+    def render(self):
+        pid = (('pid', str(os.getpid())),)
+        with self._lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted((key, (list(h.counts), h.sum, h.count, h.buckets))
+                                for key, h in self.histograms.items())
+        lines = []
+        declared = set()
+
+        def declare(name, kind):
+            if name not in declared:
+                declared.add(name)
+                if name in self.help:
+                    lines.append(f'# HELP {name} {self.help[name]}')
+                lines.append(f'# TYPE {name} {kind}')
+
+        for (name, labels), value in counters:
+            declare(name, 'counter')
+            lines.append(f'{name}{_labels(labels + pid)} {value:g}')
+        for (name, labels), (counts, total, count, buckets) in histograms:
+            declare(name, 'histogram')
+            cumulative = 0
+            for bound, n in zip(buckets + (float('inf'),), counts):
+                cumulative += n
+                le = '+Inf' if bound == float('inf') else f'{bound:g}'
+                lines.append(f'{name}_bucket{_labels(labels + pid + (("le", le),))} {cumulative}')
+            lines.append(f'{name}_sum{_labels(labels + pid)} {total:.6g}')
+            lines.append(f'{name}_count{_labels(labels + pid)} {count}')
+        return '\n'.join(lines) + '\n'
+
+
+def _labels(labels):
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in labels)
+    return '{' + ','.join(f'{label}="{value}"' for (label, _), value in zip(labels, escaped)) + '}'
+
+
+METRICS = Metrics()
+METRICS.describe('kinetics_phase_seconds', 'Exclusive time spent in each phase (load, filter, aggregate, render)')
+METRICS.describe('kinetics_query_cache_total', 'Query cache lookups by result (hit, miss, coalesced)')
+
+
+class Trace:
+    """Phase times and cache lookups of one callback call, in the thread running it"""
+
+    def __init__(self, name):
+        self.name = name
+        self.start = time.perf_counter()
+        self.returned = None
+        self.duration = None
+        self.phases = defaultdict(float)
+        self.cache = defaultdict(int)
+        self.samples = None
+
+
+def begin_trace(name):
+    trace = _local.trace = Trace(name)
+    return trace
+
+
+def end_trace(trace):
+    """Stops the trace; what followed the callback's return (Dash's validation and JSON encoding) is its serialize
+    phase, and time not covered by any phase goes to 'other'"""
+    end = time.perf_counter()
+    trace.duration = end - trace.start
+    if trace.returned is not None:
+        trace.phases['serialize'] += end - trace.returned
+    trace.phases['other'] = max(trace.duration - sum(trace.phases.values()), 0.)
+    _local.trace = None
+    return trace
+
+
+def current_trace():
+    return getattr(_local, 'trace', None)
+
+
+def note_cache(result):
+    """Counts a query cache lookup: 'hit', 'miss' or 'coalesced'"""
+    METRICS.inc('kinetics_query_cache_total', (('result', result),))
+    trace = current_trace()
+    if trace is not None:
+        trace.cache[result] += 1
+
+
+class phase:
+    """Context manager (or function decorator) timing a block as one phase"""
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        stack = getattr(_local, 'stack', None)
+        if stack is None:
+            stack = _local.stack = []
+        stack.append(self)
+        self.nested = 0.
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        elapsed = time.perf_counter() - self.start
+        stack = _local.stack
+        stack.pop()
+        if stack:
+            stack[-1].nested += elapsed
+        own = elapsed - self.nested
+        METRICS.observe('kinetics_phase_seconds', (('phase', self.name),), own)
+        trace = current_trace()
+        if trace is not None:
+            trace.phases[self.name] += own
+        return False
+
+    def __call__(self, func):
+        name = self.name
+
+        @functools.wraps(func)
+        def timed(*args, **kwargs):
+            with phase(name):
+                return func(*args, **kwargs)
+
+        return timed
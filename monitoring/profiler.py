@@ -0,0 +1,68 @@
+"""Sampling profiler for callbacks: a daemon thread records the stack of every thread running a callback each
+`interval` seconds. Only the threads that asked for it are sampled, and nothing is traced, so running callbacks
+are not slowed down; the samples of a slow callback are written to the slow-callback log."""
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+
+def collapse(frame, depth):
+    """'file:function:line;...' stack of a frame, outermost call first"""
+    calls = []
+    while frame is not None and len(calls) < depth:
+        code = frame.f_code
+        calls.append(f'{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}')
+        frame = frame.f_back
+    return ';'.join(reversed(calls))
+
+
+class SamplingProfiler:
+
+    def __init__(self, interval=0.005, depth=40):
+        self.interval = interval
+        self.depth = depth
+        self._active = {}
+        self._lock = threading.Lock()
+        self._pid = None
+
+    def _ensure_thread(self):
+        # threads do not survive a fork: gunicorn workers start their own on first use
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            threading.Thread(target=self._run, name='callback-profiler', daemon=True).start()
+
+    def start(self):
+        """Starts sampling the calling thread; returns the Counter its stacks are counted in"""
+        samples = Counter()
+        with self._lock:
+            self._ensure_thread()
+            self._active[threading.get_ident()] = samples
+        return samples
+
+    def stop(self):
+        with self._lock:
+            return self._active.pop(threading.get_ident(), None)
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                active = list(self._active.items())
+            if not active:
+                continue
+            frames = sys._current_frames()
+            for thread_id, samples in active:
+                frame = frames.get(thread_id)
+                if frame is not None:
+                    samples[collapse(frame, self.depth)] += 1
+
+
+def format_samples(samples, interval, top=5):
+    """The most frequent stacks, with the time they account for"""
+    total = sum(samples.values())
+    lines = []
+    for stack, n in samples.most_common(top):
+        lines.append(f'  {n}/{total} samples (~{n * interval * 1000:.0f} ms) {stack}')
+    return '\n'.join(lines)
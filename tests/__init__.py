@@ -0,0 +1,15 @@
+"""Behavior tests, run from the repository root:
+
+    python -m pytest tests        # or: python -m unittest discover tests
+
+The app opens the store named by KINETICS_DB when it is imported; the tests point it at a scratch copy of the
+shipped table, so that nothing is written under db/."""
+import os
+import shutil
+import tempfile
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRATCH_DIR = tempfile.mkdtemp(prefix='kinetics-tests-')
+
+shutil.copy(os.path.join(REPO_DIR, 'db', 'test.csv'), SCRATCH_DIR)
+os.environ['KINETICS_DB'] = os.path.join(SCRATCH_DIR, 'test.csv')
@@ -0,0 +1,79 @@
+import json
+import unittest
+from unittest import mock
+
+from tests.test_store import StoreTestCase, records
+
+
+class ApiTestCase(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        import app
+
+        cls.client = app.server.test_client()
+
+    def get_json(self, url, status=200):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status, response.data)
+        return json.loads(response.data)
+
+
+class KineticsApiTest(ApiTestCase):
+
+    def test_rows(self):
+        body = self.get_json('/api/v1/kinetics?isoform=Kv 1.2&columns=mutant,act_v50&sort=act_v50')
+        self.assertEqual(body['total'], 2)
+        self.assertEqual(body['rows'], [{'mutant': 'WT', 'act_v50': -60.4}, {'mutant': 'WT', 'act_v50': -50.0}])
+
+    def test_mutant_without_match(self):
+        for mutant in ['W434A', 'W4', 'WT2']:
+            self.assertEqual(self.get_json(f'/api/v1/kinetics?mutant={mutant}')['total'], 0, mutant)
+
+    def test_invalid_parameters(self):
+        for query in ['limit=abc', 'offset=-1', 'columns=act_v50,nope', 'sort=-nope']:
+            self.assertIn('error', self.get_json(f'/api/v1/kinetics?{query}', status=400), query)
+
+    def test_stats(self):
+        body = self.get_json('/api/v1/stats?columns=act_v50')
+        self.assertEqual(body['stats']['count'], {'act_v50': 2})
+        self.assertIn('error', self.get_json('/api/v1/stats?columns=isoform', status=400))
+        self.assertIn('error', self.get_json('/api/v1/stats?columns=nope', status=400))
+
+
+class ApiAppendTest(StoreTestCase):
+    """The API over a scratch store that rows are appended to"""
+
+    def setUp(self):
+        import app
+        from db.cache import QUERY_CACHE
+
+        super().setUp()
+        patcher = mock.patch.object(app, 'STORE', self.store)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        # responses are cached per store version, which another store may share
+        QUERY_CACHE.clear()
+        self.addCleanup(QUERY_CACHE.clear)
+        self.client = app.server.test_client()
+
+    def get_json(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, response.data)
+        return json.loads(response.data)
+
+    def test_sorted_after_append(self):
+        self.store.append(records('W434F', isoform='Kv 1.1'))
+        self.store.append(records('A1B', isoform='Kv 1.0'))
+        body = self.get_json('/api/v1/kinetics?columns=isoform,mutant&sort=isoform,-mutant')
+        self.assertEqual(body['version'], self.store.current_version_id())
+        self.assertEqual([(row['isoform'], row['mutant']) for row in body['rows']],
+                         [('Kv 1.0', 'A1B'), ('Kv 1.1', 'W434F'), ('Kv 1.2', 'WT'), ('Kv 1.2', 'WT')])
+
+    def test_body_matches_version(self):
+        before = self.get_json('/api/v1/kinetics?columns=mutant')
+        self.store.append(records('W434F'))
+        after = self.get_json('/api/v1/kinetics?columns=mutant')
+        self.assertEqual((before['total'], after['total']), (2, 3))
+        self.assertNotEqual(before['version'], after['version'])
+        self.assertEqual(after['version'], self.store.current_version_id())
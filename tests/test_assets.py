@@ -0,0 +1,73 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from layout import assets
+from layout.assets import ASSET_ROUTE, CACHE_CONTROL, asset_url, content_hash, resolve_asset, variant_name
+
+
+class AssetUrlTest(unittest.TestCase):
+
+    def setUp(self):
+        # a scratch image directory, so that images can be changed
+        self.dir = tempfile.mkdtemp()
+        shutil.copy(os.path.join(assets.IMG_DIR, 'udem2.png'), self.dir)
+        for name, value in (('IMG_DIR', self.dir), ('BUILD_DIR', os.path.join(self.dir, '_build'))):
+            patcher = mock.patch.object(assets, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_url_follows_content(self):
+        url = asset_url('udem2.png', width=400)
+        self.assertRegex(url, rf'^{ASSET_ROUTE}/udem2\.[0-9a-f]{{12}}\.w400\.png$')
+        with open(os.path.join(self.dir, 'udem2.png'), 'ab') as f:
+            f.write(b'\0')
+        self.assertNotEqual(asset_url('udem2.png', width=400), url)
+
+    def test_resolve(self):
+        name = f'udem2.{content_hash("udem2.png")}'
+        self.assertEqual(resolve_asset(f'{name}.png'), (self.dir, 'udem2.png'))
+        # variants not built yet: the original
+        self.assertEqual(resolve_asset(f'{name}.w400.png', accept_webp=True), (self.dir, 'udem2.png'))
+        for filename in ['udem2.000000000000.png', 'geprom.png', '../app.py', f'{name}.png/x']:
+            self.assertIsNone(resolve_asset(filename), filename)
+
+    def test_variants(self):
+        build_dir = os.path.join(self.dir, '_build')
+        with mock.patch.object(assets, 'VARIANT_WIDTHS', {'udem2.png': [400]}):
+            assets.build_variants()
+            webp, png = variant_name('udem2.png', 400, '.webp'), variant_name('udem2.png', 400)
+            name = f'udem2.{content_hash("udem2.png")}.w400.png'
+            self.assertEqual(resolve_asset(name, accept_webp=True), (build_dir, webp))
+            self.assertEqual(resolve_asset(name), (build_dir, png))
+
+
+class AssetRouteTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        import app
+
+        cls.client = app.server.test_client()
+
+    def test_cached_forever(self):
+        response = self.client.get(asset_url('geprom.png'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers['Cache-Control'], CACHE_CONTROL)
+        self.assertIn('Accept', [value.strip() for value in response.headers['Vary'].split(',')])
+        with open(os.path.join(assets.IMG_DIR, 'geprom.png'), 'rb') as f:
+            self.assertEqual(response.data, f.read())
+        response.close()
+
+    def test_stale_hash(self):
+        self.assertEqual(self.client.get(f'{ASSET_ROUTE}/geprom.000000000000.png').status_code, 404)
+
+    def test_layout_refers_to_urls(self):
+        body = self.client.get('/_dash-layout').data.decode()
+        self.assertIn(asset_url('geprom.png', width=400), body)
+        self.assertNotIn('data:image', body)
@@ -0,0 +1,34 @@
+import unittest
+
+from db.query import gating_of
+from db.catalog import ChannelCatalog, prefix_table
+
+FAMILIES = [
+    {'family': 'Kv', 'gating': 'vg', 'ions': ['K'], 'isoforms': ['Kv 1.2']},
+    {'family': 'GluK', 'gating': 'lg', 'ions': ['Na', 'K'], 'isoforms': ['Kainate GluK2']},
+]
+
+
+class GatingTest(unittest.TestCase):
+
+    def test_gating_of_listed_isoforms(self):
+        catalog = ChannelCatalog(FAMILIES)
+        self.assertEqual(catalog.gating('Kv 1.2'), 'vg')
+        self.assertEqual(catalog.gating('Kainate GluK2'), 'lg')
+
+    def test_gating_of_unlisted_isoforms(self):
+        catalog = ChannelCatalog(FAMILIES)
+        self.assertEqual(catalog.gating('GluK 9'), 'lg')
+        self.assertEqual(catalog.gating('Unknown 1'), 'vg')
+
+    def test_gating_filter_follows_the_shipped_catalog(self):
+        self.assertEqual(gating_of('NMDA GluN1/GluN2A'), 'lg')
+        self.assertEqual(gating_of('ClC-1'), 'vg')
+
+
+class PrefixTableTest(unittest.TestCase):
+
+    def test_word_endings_sorted(self):
+        table = prefix_table(['Kv 1.2', 'Nav 1.5'])
+        self.assertEqual(table['keys'], ['1.2', '1.5', 'kv 1.2', 'nav 1.5'])
+        self.assertEqual(table['ids'], [0, 1, 0, 1])
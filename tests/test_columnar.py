@@ -0,0 +1,61 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from db.columnar import read_arrow, read_table, write_table
+from db.schema import coerce_frame
+from db.store import KineticsStore
+from tests import REPO_DIR
+
+
+class ArrowTableTest(unittest.TestCase):
+
+    def setUp(self):
+        self.df = read_table(os.path.join(REPO_DIR, 'db', 'test.csv'))
+        self.path = os.path.join(tempfile.mkdtemp(), 'kinetics.arrow')
+        write_table(self.df, self.path)
+
+    def test_round_trip(self):
+        df = read_table(self.path)
+        self.assertEqual(list(df.dtypes.astype(str)), list(self.df.dtypes.astype(str)))
+        pd.testing.assert_frame_equal(df.select_dtypes('number'), self.df.select_dtypes('number'), rtol=1e-6)
+        self.assertEqual(list(df['isoform']), list(self.df['isoform']))
+
+    def test_projection_keeps_float32(self):
+        df = read_arrow(self.path, columns=['act_v50'])
+        self.assertEqual(list(df.columns), ['act_v50'])
+        self.assertEqual(df['act_v50'].dtype, np.float32)
+
+    def test_coerce_keeps_float64_columns(self):
+        df = coerce_frame(self.df)
+        np.testing.assert_array_equal(df['act_v50'].to_numpy(), self.df['act_v50'].to_numpy())
+        self.assertFalse(np.shares_memory(df['act_v50'].to_numpy(), self.df['act_v50'].to_numpy()))
+
+
+class ArrowStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'kinetics.arrow')
+        write_table(read_table(os.path.join(REPO_DIR, 'db', 'test.csv')), self.path)
+
+    def test_numeric_text(self):
+        df = read_table(self.path)
+        df['source'] = pd.Series([12345678, None], dtype=object)
+        write_table(df, self.path)
+        source = read_table(self.path)['source']
+        self.assertEqual(source[0], '12345678')
+        self.assertTrue(pd.isna(source[1]))
+
+    def test_compact_numeric_looking_text(self):
+        store = KineticsStore(self.path, os.path.join(REPO_DIR, 'db', 'test-bk.csv'), compact_every=2)
+        rows = pd.DataFrame({'selectivity': 'K+', 'isoform': 'Kv 1.2', 'mutant': 'WT', 'act_v50': -30.,
+                             'source': ['12345678', '007']})
+        store.append(rows)
+        self.assertEqual(list(store.history()['event']), ['init', 'append', 'compact'])
+        df = KineticsStore(self.path, store.backup_path).frame()
+        self.assertEqual(len(df), 4)
+        self.assertEqual(list(df['source'][2:]), ['12345678', '007'])
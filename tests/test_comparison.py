@@ -0,0 +1,69 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from analysis.comparison import compare_to_wild_type, result_columns
+from db.schema import COLUMNS, coerce_frame
+
+
+def kinetics(rows):
+    """Frame of (isoform, mutant, act_v50, act_time) records, other measurements left empty"""
+    df = pd.DataFrame(rows, columns=['isoform', 'mutant', 'act_v50', 'act_time'])
+    df['selectivity'] = 'K+'
+    return coerce_frame(df)
+
+
+class CompareToWildTypeTest(unittest.TestCase):
+
+    def test_empty_table(self):
+        shifts = compare_to_wild_type(coerce_frame(pd.DataFrame(columns=COLUMNS)))
+        self.assertEqual(len(shifts), 0)
+        self.assertEqual(list(shifts.columns), result_columns())
+
+    def test_wild_types_only(self):
+        shifts = compare_to_wild_type(kinetics([('Kv 1.2', 'WT', -20., 2.), ('Kv 1.2', 'WT', -22., 3.)]))
+        self.assertEqual(len(shifts), 0)
+        self.assertEqual(list(shifts.columns), result_columns())
+
+    def test_shift_from_wild_type(self):
+        shifts = compare_to_wild_type(kinetics([
+            ('Kv 1.2', 'WT', -20., 2.), ('Kv 1.2', 'WT', -22., 8.),
+            ('Kv 1.2', 'W434F', -30., 4.), ('Kv 1.2', 'W434F', -34., 16.),
+            ('Kv 1.3', 'W434F', -10., 1.),
+        ]))
+        self.assertEqual(list(shifts.columns), result_columns())
+        kv12 = shifts[shifts['isoform'] == 'Kv 1.2'].iloc[0]
+        self.assertEqual((kv12['position'], kv12['original'], kv12['new']), (434, 'W', 'F'))
+        self.assertEqual((kv12['n'], kv12['n_wt']), (2, 2))
+        self.assertAlmostEqual(kv12['d_act_v50'], -11.)
+        # geometric means: 8 / 4
+        self.assertAlmostEqual(kv12['act_time_ratio'], 2.)
+        self.assertLessEqual(kv12['d_act_v50_low'], kv12['d_act_v50'])
+        self.assertGreaterEqual(kv12['d_act_v50_high'], kv12['d_act_v50'])
+        # no wild type to compare with
+        kv13 = shifts[shifts['isoform'] == 'Kv 1.3'].iloc[0]
+        self.assertEqual(kv13['n_wt'], 0)
+        self.assertTrue(np.isnan(kv13['d_act_v50']))
+
+
+class ShiftViewTest(unittest.TestCase):
+
+    def test_shipped_table(self):
+        # the shipped table holds wild types only
+        import app
+
+        body = {
+            'output': '..shift-heatmap.figure...shift-table.children..',
+            'outputs': [{'id': 'shift-heatmap', 'property': 'figure'}, {'id': 'shift-table', 'property': 'children'}],
+            'inputs': [{'id': 'shift-metric', 'property': 'value', 'value': 'd_act_v50'}] + [
+                {'id': id, 'property': 'value', 'value': None} for id in
+                ['gating-radio', 'selectivity-dropdown', 'isoform-dropdown', 'mutant-input', 'new-residue-dropdown']],
+            'changedPropIds': ['shift-metric.value'],
+        }
+        response = app.server.test_client().post('/_dash-update-component', json=body)
+        self.assertEqual(response.status_code, 200)
+
+
+if __name__ == '__main__':
+    unittest.main()
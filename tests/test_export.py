@@ -0,0 +1,53 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from db.export import encode
+from db.schema import coerce_frame
+
+
+class EncodeTest(unittest.TestCase):
+
+    def setUp(self):
+        self.df = coerce_frame(pd.DataFrame({'selectivity': 'K+', 'isoform': 'Kv 1.2',
+                                             'mutant': [f'M{i}' for i in range(25)], 'act_v50': np.arange(25.)}))
+
+    def test_rows_taken_by_chunk(self):
+        rows = np.arange(1, 25, 3)
+        for fmt in ['csv', 'ndjson']:
+            expected = ''.join(encode(fmt, self.df.take(rows)))
+            self.assertEqual(''.join(encode(fmt, self.df, rows, chunk_rows=3)), expected, fmt)
+        self.assertEqual(''.join(encode('csv', self.df, np.array([], dtype=np.int64))).count('\n'), 1)
+
+
+class ExportTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        import app
+
+        cls.client = app.server.test_client()
+
+    def test_csv(self):
+        response = self.client.get('/export/kinetics.csv?selectivity=K')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data.decode().strip().split('\n')), 3)
+        cached = self.client.get('/export/kinetics.csv?selectivity=K',
+                                 headers={'If-None-Match': response.headers['ETag']})
+        self.assertEqual(cached.status_code, 304)
+
+    def test_not_cached(self):
+        from db.cache import QUERY_CACHE
+
+        QUERY_CACHE.clear()
+        self.assertEqual(self.client.get('/export/kinetics.ndjson?isoform=Kv 1.2').status_code, 200)
+        self.assertEqual(QUERY_CACHE.stats()['size'], 0)
+
+    def test_no_rows(self):
+        response = self.client.get('/export/kinetics.ndjson?mutant=W43')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, b'')
+
+    def test_unknown_format(self):
+        self.assertEqual(self.client.get('/export/kinetics.xlsx').status_code, 404)
@@ -0,0 +1,82 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from db.facets import BIN_EDGES, FacetTable, histogram
+from db.schema import NUM_COLS, append_frame, coerce_frame
+
+
+def kinetics(n, seed=0):
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({'selectivity': rng.choice(['K+', 'Na+'], n), 'isoform': rng.choice(['Kv 1.1', 'Kv 1.2'], n),
+                       'mutant': rng.choice(['WT', 'W434F', 'R362Q'], n)})
+    for col in NUM_COLS:
+        values = rng.normal(-40., 30., n) if col.endswith('v50') else rng.lognormal(0., 1.5, n)
+        # some missing, some outside the bins
+        df[col] = np.where(rng.random(n) < 0.1, np.nan, values)
+    return coerce_frame(df)
+
+
+class FacetTableTest(unittest.TestCase):
+
+    def setUp(self):
+        self.df = kinetics(5000)
+        self.facets = FacetTable(self.df)
+
+    def test_incremental_add_matches_rebuild(self):
+        facets = FacetTable(self.df.iloc[:1000])
+        for start in range(1000, 5000, 700):
+            facets.add(self.df.iloc[start:start + 700])
+        self.assertEqual(facets.n_rows, 5000)
+        self.assertEqual(facets.ids, self.facets.ids)
+        for col in NUM_COLS:
+            np.testing.assert_array_equal(facets.counts[col], self.facets.counts[col])
+            np.testing.assert_allclose(facets.moments[col], self.facets.moments[col])
+
+    def test_new_facets_after_append(self):
+        rows = coerce_frame(pd.DataFrame({'selectivity': 'K+', 'isoform': 'Kv 1.3', 'mutant': ['WT', 'A1B'],
+                                          'act_v50': [-10., -20.]}))
+        self.facets.add(rows)
+        ids = self.facets.match(isoform='Kv 1.3')
+        self.assertEqual(len(ids), 2)
+        expected = FacetTable(append_frame(self.df, rows))
+        np.testing.assert_array_equal(self.facets.counts['act_v50'], expected.counts['act_v50'])
+        self.assertEqual(self.facets.describe(['act_v50'], ids)['act_v50']['mean'], -15.)
+
+    def test_bins_match_numpy(self):
+        for col in NUM_COLS:
+            counts, edges = self.facets.histogram(col, self.facets.match(isoform='Kv 1.2'))
+            values = self.df.loc[self.df['isoform'] == 'Kv 1.2', col].dropna()
+            # values outside the edges are counted in the first and last bins
+            expected, _ = np.histogram(np.clip(values, edges[0], edges[-1]), bins=edges)
+            np.testing.assert_array_equal(counts, expected, col)
+            np.testing.assert_array_equal(histogram(col, values)[0], expected, col)
+            self.assertIs(edges, BIN_EDGES[col])
+
+    def test_moments_match_describe(self):
+        for filters in [{}, {'selectivity': 'K+'}, {'isoform': 'Kv 1.1', 'mutant': ['WT', 'W434F']}]:
+            ids = self.facets.match(**filters)
+            rows = self.df
+            for col, value in (('selectivity', filters.get('selectivity')), ('isoform', filters.get('isoform'))):
+                if value:
+                    rows = rows[rows[col] == value]
+            if 'mutant' in filters:
+                rows = rows[rows['mutant'].isin(filters['mutant'])]
+            stats, expected = self.facets.describe(NUM_COLS, ids), rows[NUM_COLS].describe()
+            summary = ['count', 'mean', 'std', 'min', 'max']
+            np.testing.assert_allclose(stats.loc[summary].to_numpy(dtype=float), expected.loc[summary].to_numpy(),
+                                       err_msg=str(filters))
+
+    def test_small_facets_exact(self):
+        ids = self.facets.match(selectivity='Na+', isoform='Kv 1.1', mutant='WT')
+        rows = self.df[(self.df['selectivity'] == 'Na+') & (self.df['isoform'] == 'Kv 1.1')
+                       & (self.df['mutant'] == 'WT')]
+        np.testing.assert_allclose(self.facets.describe(['act_v50'], ids).to_numpy(dtype=float),
+                                   rows[['act_v50']].describe().to_numpy())
+
+    def test_no_match(self):
+        stats = self.facets.describe(['act_v50'], self.facets.match(isoform='Kv 9.9'))['act_v50']
+        self.assertEqual(stats['count'], 0)
+        self.assertTrue(stats.drop('count').isna().all())
+        self.assertEqual(self.facets.histogram('act_v50', [])[0].sum(), 0)
@@ -0,0 +1,42 @@
+import unittest
+
+import numpy as np
+
+from analysis.fitting import boltzmann, fit_boltzmann, fits_to_rows, insert_fits
+
+
+class Recorder:
+    """Store stand-in keeping the appended frames"""
+
+    def __init__(self):
+        self.appended = []
+
+    def append(self, df, note=None):
+        self.appended.append(df)
+
+
+class FitBoltzmannTest(unittest.TestCase):
+
+    def setUp(self):
+        self.v = np.arange(-100., 41., 5.)
+
+    def test_activation(self):
+        fits = fit_boltzmann(self.v, [boltzmann(self.v, 1., -30., 3.), boltzmann(self.v, 2., -10., 1.5)])
+        self.assertTrue(fits['converged'].all())
+        np.testing.assert_allclose(fits[['gmax', 'v50', 'z']].to_numpy(), [[1., -30., 3.], [2., -10., 1.5]],
+                                   rtol=1e-4, atol=1e-4)
+
+    def test_reversed_sweep_keeps_its_sign(self):
+        # an inactivation curve fitted as an activation
+        fits = fit_boltzmann(self.v, [boltzmann(self.v, 1., -40., 4., sign=-1)])
+        self.assertAlmostEqual(fits['v50'][0], -40., places=3)
+        self.assertAlmostEqual(fits['z'][0], -4., places=3)
+
+    def test_reversed_sweep_rejected_on_insert(self):
+        fits = fit_boltzmann(self.v, [boltzmann(self.v, 1., -30., 3.), boltzmann(self.v, 1., -40., 4., sign=-1)])
+        store = Recorder()
+        rows = fits_to_rows(fits, 'act', selectivity='K', isoform='Kv 1.2', mutant='WT', source='test')
+        inserted, rejects = insert_fits(rows, store)
+        self.assertEqual(inserted, 1)
+        self.assertEqual(list(rejects['reason']), ['act_z < 0'])
+        self.assertAlmostEqual(store.appended[0]['act_z'].iloc[0], 3., places=3)
@@ -0,0 +1,50 @@
+import io
+import unittest
+
+import openpyxl
+
+from db.ingest import ingest, read_chunks
+from tests.test_fitting import Recorder
+
+HEADER = ['selectivity', 'isoform', 'mutant', 'act_v50', 'act_time', 'source']
+ROWS = [
+    ['K', 'Kv 1.2', 'W434F', -30, 2.5, 'paper'],
+    ['Na', 'Nav 1.5', '007', -300, 1, 'paper'],
+    [None] * 6,
+    ['K', 'Kv 1.2', 'WT', -50.5, None, None],
+    ['K', 'Kv 1.3', 'WT', 'abc', -1, 'paper'],
+]
+
+
+def workbook(rows):
+    book = openpyxl.Workbook()
+    sheet = book.active
+    sheet.append(HEADER)
+    for row in rows:
+        sheet.append(row)
+    buffer = io.BytesIO()
+    book.save(buffer)
+    buffer.seek(0)
+    return buffer
+
+
+class ExcelIngestTest(unittest.TestCase):
+
+    def test_chunks_as_text(self):
+        chunks = list(read_chunks(workbook(ROWS), filename='upload.xlsx', chunksize=2))
+        self.assertEqual([len(chunk) for chunk in chunks], [2, 2])
+        self.assertEqual(list(chunks[0].columns), HEADER)
+        self.assertEqual(list(chunks[0].iloc[1]), ['Na', 'Nav 1.5', '007', '-300', '1', 'paper'])
+        self.assertIsNone(chunks[1]['source'].iloc[0])
+
+    def test_ingest_with_rejects(self):
+        store = Recorder()
+        inserted, rejects = ingest(workbook(ROWS), store, filename='upload.xlsx', chunksize=2)
+        self.assertEqual(inserted, 1)
+        self.assertEqual(list(store.appended[0]['selectivity']), ['K+'])
+        self.assertEqual(list(rejects['reason']), ['act_v50 < -220 mV', 'missing source',
+                                                   'act_v50 is not a number; act_time < 0'])
+
+    def test_xls_refused(self):
+        with self.assertRaises(ValueError):
+            ingest(io.BytesIO(b''), Recorder(), filename='upload.xls')
@@ -0,0 +1,28 @@
+import json
+import unittest
+
+
+class LayoutRouteTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        import app
+
+        cls.client = app.server.test_client()
+
+    def test_layout_revalidated_by_etag(self):
+        response = self.client.get('/_dash-layout')
+        self.assertEqual(response.status_code, 200)
+        etag = response.headers['ETag']
+        self.assertIn('sidebar', json.dumps(json.loads(response.data)))
+
+        response = self.client.get('/_dash-layout', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.data, b'')
+
+        response = self.client.get('/_dash-layout', headers={'If-None-Match': '"stale"'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers['ETag'], etag)
+
+    def test_other_routes_untouched(self):
+        self.assertNotIn('ETag', self.client.get('/_dash-dependencies').headers)
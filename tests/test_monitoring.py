@@ -0,0 +1,14 @@
+import unittest
+
+from monitoring.callbacks import CallbackInstrumentation
+
+
+class ResponseSizeTest(unittest.TestCase):
+
+    def test_size_in_utf8_bytes(self):
+        sizes = []
+        instrumentation = CallbackInstrumentation()
+        instrumentation.record = lambda trace, status, size: sizes.append((status, size))
+        dispatch = instrumentation.traced('iso.value', lambda: '{"isoform": "nAChR α1β1γδ"}')
+        self.assertEqual(dispatch(), '{"isoform": "nAChR α1β1γδ"}')
+        self.assertEqual(sizes, [('ok', 31)])
@@ -0,0 +1,48 @@
+import unittest
+
+import pandas as pd
+
+from db.mutants import MutantIndex
+from db.query import KineticsIndex, filter_frame
+from db.schema import coerce_frame
+
+NAMES = ['WT', 'W434F', 'W434F/T449Y', 'R362Q', 'K374E']
+
+
+def kinetics(names):
+    return coerce_frame(pd.DataFrame({'selectivity': 'K+', 'isoform': 'Kv 1.2', 'mutant': names}))
+
+
+class MutantSearchTest(unittest.TestCase):
+
+    def setUp(self):
+        self.index = MutantIndex(NAMES)
+
+    def test_exact_and_structured_matches(self):
+        self.assertEqual(self.index.search_names('w434f'), ['W434F', 'W434F/T449Y'])
+        self.assertEqual(self.index.search_names('T449Y'), ['W434F/T449Y'])
+        self.assertEqual(self.index.search_names('360-370'), ['R362Q'])
+
+    def test_no_partial_or_similar_matches(self):
+        for query in ['W434A', 'W43', 'W4', 'R36Q', 'nonsense']:
+            self.assertEqual(self.index.search_names(query), [], query)
+
+    def test_suggestions_fall_back_to_prefixes(self):
+        self.assertEqual(self.index.suggest_names('W43')[:2], ['W434F', 'W434F/T449Y'])
+        self.assertIn('W434F', self.index.suggest_names('W434A'))
+        self.assertEqual(self.index.suggest_names('W434F'), ['W434F', 'W434F/T449Y'])
+
+
+class MutantFilterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.df = kinetics(NAMES)
+        self.index = KineticsIndex(self.df)
+
+    def test_filter_matches_exactly(self):
+        rows = filter_frame(self.df, self.index, mutant='W434F')
+        self.assertEqual(sorted(rows['mutant']), ['W434F', 'W434F/T449Y'])
+
+    def test_filter_without_match_selects_no_rows(self):
+        for query in ['W434A', 'W43']:
+            self.assertEqual(len(filter_frame(self.df, self.index, mutant=query)), 0, query)
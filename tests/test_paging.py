@@ -0,0 +1,83 @@
+import json
+import unittest
+
+import pandas as pd
+
+from db.paging import apply_filter_query, apply_sort, split_filter_part
+from db.schema import append_frame, coerce_frame
+
+
+def kinetics():
+    return coerce_frame(pd.DataFrame({
+        'selectivity': 'K+',
+        'isoform': ['Kv 1.2', 'Kv 1.2', 'Kv 1.3'],
+        'mutant': ['WT', 'W434F', 'WT'],
+        'act_v50': [-50., -20., None],
+    }))
+
+
+class SplitFilterPartTest(unittest.TestCase):
+
+    def test_operators_and_operands(self):
+        self.assertEqual(split_filter_part('{act_v50} ge -50'), ('act_v50', 'ge', -50.))
+        self.assertEqual(split_filter_part('{mutant} contains "W4"'), ('mutant', 'contains', 'W4'))
+        self.assertEqual(split_filter_part("{isoform} eq 'Kv 1.2'"), ('isoform', 'eq', 'Kv 1.2'))
+
+    def test_unparsed_clause(self):
+        self.assertEqual(split_filter_part('act_v50'), [None] * 3)
+
+
+class ApplyFilterQueryTest(unittest.TestCase):
+
+    def test_numeric_comparison(self):
+        self.assertEqual(list(apply_filter_query(kinetics(), '{act_v50} lt -30')['mutant']), ['WT'])
+        self.assertEqual(list(apply_filter_query(kinetics(), '{act_v50} ge "-30"')['mutant']), ['W434F'])
+
+    def test_text_filters(self):
+        df = apply_filter_query(kinetics(), '{isoform} eq "Kv 1.2" && {mutant} contains 434')
+        self.assertEqual(list(df['mutant']), ['W434F'])
+
+    def test_invalid_clauses_are_ignored(self):
+        for query in ['{act_v50} lt abc', '{nope} eq 1', 'garbage', '{act_v50} lt abc && {mutant} eq WT']:
+            df = apply_filter_query(kinetics(), query)
+            self.assertEqual(len(df), 2 if query.endswith('WT') else 3, query)
+
+
+class ApplySortTest(unittest.TestCase):
+
+    def test_text_sorted_by_value_after_append(self):
+        rows = coerce_frame(pd.DataFrame({'selectivity': 'K+', 'isoform': ['Kv 1.1'], 'mutant': ['A1B'],
+                                          'act_v50': [-10.]}))
+        df = append_frame(kinetics(), rows)
+        df = apply_sort(df, [{'column_id': 'isoform', 'direction': 'asc'}, {'column_id': 'mutant', 'direction': 'desc'}])
+        self.assertEqual(list(zip(df['isoform'], df['mutant'])),
+                         [('Kv 1.1', 'A1B'), ('Kv 1.2', 'WT'), ('Kv 1.2', 'W434F'), ('Kv 1.3', 'WT')])
+
+    def test_text_sorted_by_value_whatever_category_order(self):
+        df = kinetics()
+        df['mutant'] = df['mutant'].cat.reorder_categories(['WT', 'W434F'])
+        self.assertEqual(list(apply_sort(df, [{'column_id': 'mutant', 'direction': 'asc'}])['mutant']),
+                         ['W434F', 'WT', 'WT'])
+
+
+class TableViewTest(unittest.TestCase):
+
+    def post_filter(self, filter_query):
+        import app
+
+        inputs = [{'id': id, 'property': 'value', 'value': None} for id in
+                  ['gating-radio', 'selectivity-dropdown', 'isoform-dropdown', 'mutant-input', 'new-residue-dropdown']]
+        inputs += [{'id': 'consult-table', 'property': prop, 'value': value} for prop, value in
+                   [('page_current', 0), ('page_size', 10), ('sort_by', []), ('filter_query', filter_query)]]
+        body = {
+            'output': '..consult-table.data...consult-table.page_count..',
+            'outputs': [{'id': 'consult-table', 'property': 'data'}, {'id': 'consult-table', 'property': 'page_count'}],
+            'inputs': inputs,
+            'changedPropIds': ['consult-table.filter_query'],
+        }
+        return app.server.test_client().post('/_dash-update-component', json=body)
+
+    def test_invalid_operand(self):
+        response = self.post_filter('{act_v50} lt abc')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(json.loads(response.data)['response']['consult-table']['data']), 2)
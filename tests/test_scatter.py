@@ -0,0 +1,71 @@
+import unittest
+
+import numpy as np
+
+from db.facets import BIN_EDGES
+from db.scatter import _cap, density, plotted, stratified_sample
+
+
+class PlottedTest(unittest.TestCase):
+
+    def test_missing_and_non_positive_on_log_axes(self):
+        x, y = np.array([1., np.nan, 3., -1., 0.]), np.array([1., 2., np.nan, 4., 5.])
+        self.assertEqual(list(plotted(x, y)), [0, 3, 4])
+        self.assertEqual(list(plotted(x, y, log_x=True)), [0])
+        self.assertEqual(list(plotted(y, x, log_y=True)), [0])
+
+
+class CapTest(unittest.TestCase):
+
+    def test_largest_cap_within_budget(self):
+        rng = np.random.default_rng(0)
+        for counts in [np.array([1, 1, 50, 200]), rng.integers(1, 500, 300), np.array([7])]:
+            for budget in [len(counts), 100, 1000, counts.sum(), counts.sum() + 5]:
+                cap = _cap(counts, budget)
+                self.assertLessEqual(np.minimum(counts, cap).sum(), budget)
+                if cap < counts.max():
+                    self.assertGreater(np.minimum(counts, cap + 1).sum(), budget)
+
+
+class StratifiedSampleTest(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        # a dense cloud and a few outliers
+        self.x = np.concatenate([rng.normal(-40., 5., 200000), [100., 120.]])
+        self.y = np.concatenate([rng.normal(-60., 5., 200000), [50., -200.]])
+
+    def test_within_budget_all(self):
+        self.assertEqual(list(stratified_sample(self.x[:10], self.y[:10], budget=10)), list(range(10)))
+
+    def test_budget_and_outliers(self):
+        sample = stratified_sample(self.x, self.y, budget=5000)
+        self.assertLessEqual(len(sample), 5000)
+        self.assertGreater(len(sample), 4000)
+        self.assertTrue((np.diff(sample) > 0).all())
+        self.assertEqual(list(sample[-2:]), [200000, 200001])
+
+    def test_log_axes_and_repeatable(self):
+        x = np.exp(self.x / 20)
+        sample = stratified_sample(x, self.y, budget=1000, log_x=True)
+        self.assertLessEqual(len(sample), 1000)
+        self.assertEqual(list(sample), list(stratified_sample(x, self.y, budget=1000, log_x=True)))
+        self.assertNotEqual(list(sample), list(stratified_sample(x, self.y, budget=1000, log_x=True, seed=1)))
+
+
+class DensityTest(unittest.TestCase):
+
+    def test_counts_on_trimmed_fixed_edges(self):
+        x, y = np.array([-50., -49., -10., 500.]), np.array([1., 1.1, 3., 2.])
+        counts, x_edges, y_edges = density('act_v50', 'act_z', x, y)
+        self.assertEqual(counts.sum(), 4)
+        self.assertEqual(counts.shape, (len(y_edges) - 1, len(x_edges) - 1))
+        self.assertEqual((x_edges[0], y_edges[0]), (-50., 1.))
+        # out of range values land in the last bin
+        self.assertEqual(x_edges[-1], BIN_EDGES['act_v50'][-1])
+        self.assertEqual(counts[0, 0], 2)
+
+    def test_no_points(self):
+        counts, x_edges, y_edges = density('act_v50', 'act_z', np.array([]), np.array([]))
+        self.assertEqual(counts.size, 0)
+        self.assertEqual((len(x_edges), len(y_edges)), (1, 1))
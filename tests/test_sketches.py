@@ -0,0 +1,84 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from db.facets import QUANTILES, FacetTable
+from db.schema import coerce_frame
+from db.sketches import QUANTILE_ERROR, KLLSketch, merge_moments, update_moments
+
+
+def rank_error(values, estimate, q):
+    """Distance from q of the normalized rank (range, for ties) of an estimated q-quantile"""
+    values = np.sort(values)
+    lo, hi = np.searchsorted(values, estimate, side='left'), np.searchsorted(values, estimate, side='right')
+    return max(0., lo / len(values) - q, q - hi / len(values))
+
+
+class KLLSketchTest(unittest.TestCase):
+
+    def setUp(self):
+        self.values = np.random.default_rng(0).normal(-40., 15., 200000)
+
+    def test_exact_until_compacted(self):
+        sketch = KLLSketch().update([3., np.nan, 1., 2., 10.])
+        self.assertTrue(sketch.exact)
+        self.assertEqual(sketch.n, 4)
+        self.assertEqual(sketch.quantiles(QUANTILES), list(np.percentile([1., 2., 3., 10.], [25, 50, 75])))
+        self.assertTrue(np.isnan(KLLSketch().quantiles([0.5])).all())
+
+    def test_rank_error(self):
+        sketch = KLLSketch(seed=0)
+        for batch in np.array_split(self.values, 50):
+            sketch.update(batch)
+        self.assertFalse(sketch.exact)
+        self.assertEqual(sketch.n, len(self.values))
+        for q, estimate in zip(QUANTILES, sketch.quantiles(QUANTILES)):
+            self.assertLessEqual(rank_error(self.values, estimate, q), QUANTILE_ERROR, q)
+
+    def test_merged_rank_error(self):
+        parts = np.array_split(self.values, 200)
+        merged = KLLSketch().merge(*[KLLSketch().update(part) for part in parts])
+        self.assertEqual(merged.n, len(self.values))
+        for q, estimate in zip(QUANTILES, merged.quantiles(QUANTILES)):
+            self.assertLessEqual(rank_error(self.values, estimate, q), QUANTILE_ERROR, q)
+
+    def test_seeded_sketches_repeat(self):
+        quantiles = [KLLSketch(seed=1).update(self.values).quantiles(QUANTILES) for _ in range(2)]
+        self.assertEqual(quantiles[0], quantiles[1])
+
+
+class MomentsTest(unittest.TestCase):
+
+    def test_batches_and_groups_merge_exactly(self):
+        rng = np.random.default_rng(0)
+        values, ids = rng.normal(5., 2., 1000), rng.integers(3, size=1000)
+        count, mean, m2 = np.zeros(4), np.zeros(4), np.zeros(4)
+        for batch in np.array_split(np.arange(1000), 7):
+            update_moments(count, mean, m2, ids[batch], values[batch])
+        for group in range(3):
+            self.assertEqual(count[group], (ids == group).sum())
+            self.assertAlmostEqual(mean[group], values[ids == group].mean())
+            self.assertAlmostEqual(m2[group], ((values[ids == group] - mean[group]) ** 2).sum())
+        self.assertEqual(count[3], 0)
+        n, total_mean, total_m2 = merge_moments(count, mean, m2)
+        self.assertEqual(n, 1000)
+        self.assertAlmostEqual(total_mean, values.mean())
+        self.assertAlmostEqual(total_m2 / (n - 1), values.var(ddof=1))
+
+
+class FacetDescribeTest(unittest.TestCase):
+
+    def test_rank_error_bound(self):
+        rng = np.random.default_rng(0)
+        n = 100000
+        df = coerce_frame(pd.DataFrame({'selectivity': 'K+', 'isoform': rng.choice(['Kv 1.1', 'Kv 1.2'], n),
+                                        'mutant': rng.choice(['WT', 'W434F', 'R362Q'], n),
+                                        'act_v50': rng.normal(-40., 15., n)}))
+        facets = FacetTable(df)
+        stats = facets.describe(['act_v50'], facets.match())['act_v50']
+        expected = df['act_v50'].describe()
+        np.testing.assert_allclose(stats[['count', 'mean', 'std', 'min', 'max']],
+                                   expected[['count', 'mean', 'std', 'min', 'max']])
+        for q in QUANTILES:
+            self.assertLessEqual(rank_error(df['act_v50'], stats[f'{q:.0%}'], q), QUANTILE_ERROR, q)
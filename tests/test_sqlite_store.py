@@ -0,0 +1,73 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from db.facets import V50_EDGES
+from db.sqlite_store import INSERT_SQL, SCHEMA, SqliteStore, _records
+from tests import REPO_DIR
+
+
+def records(*rows):
+    """(isoform, mutant) records"""
+    return pd.DataFrame([{'selectivity': 'K+', 'isoform': isoform, 'mutant': mutant, 'act_v50': -30., 'source': 'test'}
+                         for isoform, mutant in rows])
+
+
+class SqliteStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'kinetics.sqlite')
+        self.store = SqliteStore(self.path, os.path.join(REPO_DIR, 'db', 'test-bk.csv'))
+        self.store.append(records(('Kv 1.2', 'WT'), ('Kv 1.2', 'W434F'), ('NMDA GluN1/GluN2A', 'N598Q')))
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_gating_filter(self):
+        self.assertEqual(list(self.store.filter(gating='lg')['mutant']), ['N598Q'])
+        self.assertEqual(list(self.store.filter(gating='vg')['mutant']), ['WT', 'W434F'])
+
+    def test_mutant_filter(self):
+        self.assertEqual(list(self.store.filter(mutant='w434f')['mutant']), ['W434F'])
+        self.assertEqual(len(self.store.filter(mutant='W434A')), 0)
+        self.assertEqual(len(self.store.filter(mutant='W43')), 0)
+        # names inserted later, by this or another worker
+        SqliteStore(self.path, self.store.backup_path).append(records(('Kv 1.3', 'W434A')))
+        self.assertEqual(list(self.store.filter(mutant='W434A')['isoform']), ['Kv 1.3'])
+
+    def test_write_replaces_mutant_names(self):
+        self.store.write(records(('Kv 1.2', 'R362Q')))
+        self.assertEqual(len(self.store.filter(mutant='W434F')), 0)
+        self.assertEqual(len(self.store.filter(mutant='R362Q')), 1)
+
+    def test_databases_without_gating(self):
+        path = os.path.join(self.dir, 'old.sqlite')
+        with sqlite3.connect(path) as con:
+            con.executescript(SCHEMA.replace(',\n    gating TEXT', ''))
+            con.executemany(INSERT_SQL.replace(', gating)', ')').replace(', ?)', ')'),
+                            [row[:-1] for row in _records(records(('GlyR α1', 'WT'), ('Kv 1.2', 'WT')))])
+        store = SqliteStore(path, self.store.backup_path)
+        self.assertEqual(store.current_version(), 2)
+        self.assertEqual(list(store.filter(gating='lg')['isoform']), ['GlyR α1'])
+
+    def test_statistics_in_sql(self):
+        self.store.append(pd.DataFrame({'selectivity': 'K+', 'isoform': 'Kv 1.2', 'mutant': 'R362Q',
+                                        'act_v50': [-10., -11., np.nan, -300.], 'source': 'test'}))
+        counts, edges = self.store.histogram('act_v50', isoform='Kv 1.2')
+        self.assertIs(edges, V50_EDGES)
+        self.assertEqual(counts.sum(), 5)
+        self.assertEqual(counts[0], 1)
+        self.assertEqual(counts[np.searchsorted(V50_EDGES, -30., side='right') - 1], 2)
+        stats = self.store.describe(['act_v50'], isoform='Kv 1.2', mutant='R362Q')['act_v50']
+        self.assertEqual((stats['count'], stats['min'], stats['max']), (3, -300., -10.))
+        with self.assertRaises(ValueError):
+            self.store.histogram('mutant')
+        # no facet table to keep in step with the database
+        self.store.preload()
+        self.assertFalse(hasattr(self.store, 'facets'))
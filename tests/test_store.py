@@ -0,0 +1,152 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import pandas as pd
+
+from db.query import KineticsIndex, filter_frame
+from db.store import KineticsStore
+from tests import REPO_DIR
+
+
+def records(*mutants, isoform='Kv 1.2'):
+    return pd.DataFrame({'selectivity': 'K+', 'isoform': isoform, 'mutant': list(mutants), 'act_v50': -30.,
+                         'source': 'test'})
+
+
+class StoreTestCase(unittest.TestCase):
+    """A store on a scratch copy of the shipped tables"""
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        for name in ['test.csv', 'test-bk.csv']:
+            shutil.copy(os.path.join(REPO_DIR, 'db', name), self.dir)
+        self.store = self.open()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def open(self, **settings):
+        return KineticsStore(os.path.join(self.dir, 'test.csv'), os.path.join(self.dir, 'test-bk.csv'), **settings)
+
+
+class KineticsStoreTest(StoreTestCase):
+
+    def test_append(self):
+        version = self.store.current_version()
+        df = self.store.append(records('W434F', 'R362Q'), note='upload.csv')
+        self.assertEqual(len(df), 4)
+        self.assertEqual(list(df['mutant'][2:]), ['W434F', 'R362Q'])
+        self.assertGreater(self.store.current_version(), version)
+        self.assertEqual(list(self.store.history()['event']), ['init', 'append'])
+        # another process sees the journal
+        self.assertEqual(list(self.open().frame()['mutant']), ['WT', 'WT', 'W434F', 'R362Q'])
+
+    def test_appended_categories_stay_sorted(self):
+        self.store.append(records('W434F', isoform='Kv 1.1'))
+        df = self.store.frame()
+        self.assertEqual(list(df['isoform'].cat.categories), ['Kv 1.1', 'Kv 1.2'])
+        self.assertEqual(list(df['isoform']), ['Kv 1.2', 'Kv 1.2', 'Kv 1.1'])
+        self.assertEqual(list(df.sort_values('isoform', kind='mergesort')['isoform']), ['Kv 1.1', 'Kv 1.2', 'Kv 1.2'])
+
+    def test_text_read_back_as_written(self):
+        rows = records('NA', 'NaN')
+        rows['source'] = ['007', '12345678']
+        self.store.append(rows)
+        df = self.open().frame()
+        self.assertEqual(list(df['mutant'][2:]), ['NA', 'NaN'])
+        self.assertEqual(list(df['source'][2:]), ['007', '12345678'])
+        self.assertTrue(df['new_residue'].isna().all())
+
+    def test_appends_extend_the_index(self):
+        index = self.store.index_for(self.store.frame())
+        self.store.append(records('W434F', isoform='Nav 1.5'))
+        df = self.store.frame()
+        extended = self.store.index_for(df)
+        self.assertEqual(extended.generation, index.generation)
+        self.assertEqual(index.n_rows, 2)
+        fresh = KineticsIndex(df)
+        for filters in [{'mutant': 'W434F'}, {'isoform': 'Kv 1.2'}, {'gating': 'vg'}, {'selectivity': 'K'}]:
+            self.assertTrue(filter_frame(df, extended, **filters).equals(filter_frame(df, fresh, **filters)))
+        self.assertEqual(list(filter_frame(df, extended, mutant='W434F')['isoform']), ['Nav 1.5'])
+
+    def test_compact(self):
+        store = self.open(compact_every=2)
+        store.append(records('W434F'))
+        self.assertEqual(list(store.history()['event']), ['init', 'append'])
+        store.append(records('R362Q'))
+        self.assertEqual(list(store.history()['event']), ['init', 'append', 'append', 'compact'])
+        self.assertEqual(list(self.open().frame()['mutant']), ['WT', 'WT', 'W434F', 'R362Q'])
+
+    def test_rollback(self):
+        before = self.store.current_version_id()
+        self.store.append(records('W434F'))
+        self.assertEqual(len(self.store.rollback()), 2)
+        self.assertEqual(len(self.open().frame()), 2)
+        added, removed = self.store.diff(before, self.store.history()['version'].iloc[1])
+        self.assertEqual(list(added['mutant']), ['W434F'])
+        self.assertEqual(len(removed), 0)
+        # rolling back the rollback redoes the insert
+        self.assertEqual(len(self.store.rollback()), 3)
+
+    def test_restore_and_clear(self):
+        self.store.append(records('W434F'))
+        self.assertEqual(len(self.store.restore()), 1)
+        self.assertEqual(len(self.store.clear()), 0)
+        self.assertEqual(len(self.open().frame()), 0)
+
+    def test_snapshots_independent_of_table_files(self):
+        self.store.frame()
+        version = self.store.current_version_id()
+        self.store.restore()
+        for name in ['test.csv', 'test-bk.csv']:
+            with open(os.path.join(self.dir, name), 'w') as f:
+                f.write('edited\n')
+        self.assertEqual(len(self.open().frame()), 1)
+        self.assertEqual(list(self.store.version_frame(version)['act_v50']), [-50., -60.4])
+
+    def test_statistics_from_facets(self):
+        self.store.append(records('W434F', 'R362Q', isoform='Kv 1.1'))
+        stats = self.store.describe(['act_v50'], isoform='Kv 1.2')
+        self.assertTrue(stats.equals(self.store.filter(isoform='Kv 1.2')[['act_v50']].describe()))
+        self.assertEqual(self.store.describe(['act_v50'], mutant='w434f')['act_v50']['count'], 1)
+        counts, _ = self.store.histogram('act_v50', selectivity='K', gating='vg')
+        self.assertEqual(counts.sum(), 4)
+        self.assertEqual(self.store.histogram('act_v50', new_res='Z')[0].sum(), 0)
+
+
+class SnapshotGcTest(StoreTestCase):
+
+    def snapshot_files(self):
+        return sorted(os.listdir(os.path.join(self.dir, 'test.snapshots')))
+
+    def test_compaction_keeps_recent_snapshots(self):
+        store = self.open(compact_every=1, keep_snapshots=3, keep_events=4)
+        for i in range(20):
+            store.append(records(f'W{434 + i}F'))
+        files = self.snapshot_files()
+        self.assertLessEqual(len([name for name in files if name.endswith('.json')]), 5)
+        self.assertLessEqual(len([name for name in files if name.startswith('table-')]), 5)
+        self.assertEqual(len(self.open().frame()), 22)
+        # the state before the last insert is still there
+        history = store.history()
+        self.assertEqual(len(store.rollback(history[history['event'] == 'append']['previous'].iloc[-1])), 21)
+
+    def test_gc(self):
+        store = self.open(compact_every=1)
+        for i in range(5):
+            store.append(records(f'W{434 + i}F'))
+        version = store.history()['version'].iloc[2]
+        self.assertEqual(len(store.version_frame(version)), 3)
+        deleted = store.gc(keep=1, keep_events=0)
+        self.assertTrue(deleted)
+        self.assertEqual([name for name in self.snapshot_files() if name.endswith('.json')],
+                         [store.snapshot_id + '.json'])
+        self.assertEqual(len(self.open().frame()), 7)
+        with self.assertRaises(ValueError):
+            store.version_frame(version)
+        # new snapshots do not reuse the ids of deleted ones
+        store.append(records('R362Q'))
+        self.assertEqual(len(self.open().frame()), 8)
+        self.assertEqual(store.gc(keep=1, keep_events=0)[0], f'{int(store.snapshot_id) - 1:06d}.json')